@@ -0,0 +1,159 @@
+# First-expiry-first-out stock allocation shared by /sales/sell and /create-invoice
+import time
+from collections import defaultdict
+from contextlib import closing
+from datetime import date
+
+import rollups
+from signals import inventory_changed, sales_recorded
+
+LOCK_BATCHES_SQL = """
+    SELECT id, product_id, quantity
+    FROM product_inventory_batches
+    WHERE product_id IN ({placeholders}) AND quantity > 0
+    ORDER BY product_id, expiry_date ASC, id
+    FOR UPDATE
+"""
+
+INSERT_SALES_SQL = """
+    INSERT INTO sales (user_id, product_id, quantity, sale_date, batch_id)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+REDUCE_PRODUCT_SQL = """
+    UPDATE products
+    SET inventory = inventory - %s
+    WHERE id = %s
+"""
+
+
+class Allocation:
+    def __init__(self, requested):
+        self.requested = requested
+        self.lines = []
+        # batch_id -> quantity the batch has left once the lines are taken
+        self.left = {}
+        self.shortfall = {}
+        self.committed = False
+        self.sale_date = None
+        self.latency_ms = None
+
+    @property
+    def complete(self):
+        return not self.shortfall
+
+
+def merge_items(items):
+    # Sum duplicate lines per product, skipping invalid entries like the old invoice loop did
+    requested = {}
+    for item in items:
+        product_id = item.get("product_id")
+        quantity = int(item.get("quantity", 0))
+        if not product_id or quantity <= 0:
+            continue
+        product_id = int(product_id)
+        requested[product_id] = requested.get(product_id, 0) + quantity
+    return requested
+
+
+def lock_batches(cursor, product_ids):
+    batches = defaultdict(list)
+    if not product_ids:
+        return batches
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    cursor.execute(LOCK_BATCHES_SQL.format(placeholders=placeholders), list(product_ids))
+    for batch_id, product_id, quantity in cursor.fetchall():
+        batches[product_id].append((batch_id, quantity))
+    return batches
+
+
+def allocate(batches, requested):
+    allocation = Allocation(requested)
+    for product_id, needed in requested.items():
+        for batch_id, batch_qty in batches.get(product_id, ()):
+            if needed <= 0:
+                break
+            used = min(batch_qty, needed)
+            allocation.lines.append((product_id, batch_id, used))
+            allocation.left[batch_id] = batch_qty - used
+            needed -= used
+        if needed > 0:
+            allocation.shortfall[product_id] = needed
+    return allocation
+
+
+def write_sales(cursor, user_id, lines, sale_date):
+    write_sale_rows(cursor, [
+        (user_id, product_id, qty, sale_date, batch_id) for product_id, batch_id, qty in lines
+    ])
+
+
+def write_sale_rows(cursor, rows):
+    """Insert (user_id, product_id, quantity, sale_date, batch_id) rows and take them off stock."""
+    if not rows:
+        return
+    cursor.executemany(INSERT_SALES_SQL, rows)
+    rollups.add(cursor, rows)
+    decrements = defaultdict(int)
+    per_product = defaultdict(int)
+    for _, product_id, qty, _, batch_id in rows:
+        decrements[batch_id] += qty
+        per_product[product_id] += qty
+    # One UPDATE for every touched batch instead of a round trip per batch
+    cases = " ".join(["WHEN %s THEN %s"] * len(decrements))
+    placeholders = ", ".join(["%s"] * len(decrements))
+    params = [v for pair in decrements.items() for v in pair] + list(decrements)
+    cursor.execute(f"""
+        UPDATE product_inventory_batches
+        SET quantity = quantity - CASE id {cases} END
+        WHERE id IN ({placeholders})
+    """, params)
+    # Keep products.inventory in step with the batches it summarises
+    cursor.executemany(REDUCE_PRODUCT_SQL, [(qty, product_id) for product_id, qty in per_product.items()])
+
+
+def reduce_batch(cursor, product_id, batch_id, quantity, delete=False):
+    if delete:
+        cursor.execute("DELETE FROM product_inventory_batches WHERE id = %s", (batch_id,))
+    else:
+        cursor.execute("UPDATE product_inventory_batches SET quantity = quantity - %s WHERE id = %s",
+                       (quantity, batch_id))
+    cursor.execute(REDUCE_PRODUCT_SQL, (quantity, product_id))
+
+
+def notify(sender, allocation):
+    if not allocation.committed or not allocation.lines:
+        return
+    sales_recorded.send(sender, rows=[
+        (product_id, batch_id, qty, allocation.sale_date) for product_id, batch_id, qty in allocation.lines
+    ])
+    inventory_changed.send(sender, changes=[
+        {"op": "update", "product_id": product_id, "batch_id": batch_id, "delta": -qty,
+         "quantity": allocation.left.get(batch_id)}
+        for product_id, batch_id, qty in allocation.lines
+    ])
+
+
+def allocate_fefo(conn, user_id, items, partial=False, sale_date=None):
+    """Allocate and record a sale of ``items`` in a single transaction.
+
+    Candidate batches for every product are locked with one SELECT ... FOR
+    UPDATE so concurrent tills can't oversell. With ``partial`` the available
+    stock is sold and the rest reported as shortfall; otherwise any shortfall
+    rolls the whole sale back.
+    """
+    start = time.perf_counter()
+    requested = merge_items(items)
+    with closing(conn.cursor()) as cursor:
+        batches = lock_batches(cursor, list(requested))
+        allocation = allocate(batches, requested)
+        allocation.sale_date = sale_date or date.today()
+        if allocation.shortfall and not partial:
+            conn.rollback()
+        else:
+            write_sales(cursor, user_id, allocation.lines, allocation.sale_date)
+            conn.commit()
+            allocation.committed = True
+    allocation.latency_ms = round((time.perf_counter() - start) * 1000, 3)
+    notify("allocation", allocation)
+    return allocation
@@ -0,0 +1,251 @@
+# Incrementally maintained aggregates behind /analytics
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import closing
+
+from ledger import get_ledger
+from replicas import cache_connection
+from signals import catalogue_changed, inventory_changed, sales_recorded
+import versions
+
+# How long a rendered dashboard payload is reused before being rebuilt
+ANALYTICS_CACHE_TTL = float(os.environ.get("ANALYTICS_CACHE_TTL", 5))
+# Full re-aggregation interval, absorbs writes made outside the app. Sibling
+# workers' writes (see versions.foreign) reload once the payload expires.
+ANALYTICS_REFRESH_SECONDS = float(os.environ.get("ANALYTICS_REFRESH_SECONDS", 3600))
+# Archive dataset (archive.py sync) holding sales history; when set, full
+# loads only aggregate the sales rows past its watermark
+ANALYTICS_ARCHIVE = os.environ.get("ANALYTICS_ARCHIVE")
+
+log = logging.getLogger("smartretail")
+
+PRODUCTS_SQL = """
+    SELECT p.id, p.name, c.name
+    FROM products p
+    JOIN categories c ON p.category_id = c.id
+"""
+
+CATEGORIES_SQL = """
+    SELECT c.name, COUNT(p.id) AS count
+    FROM categories c
+    LEFT JOIN products p ON p.category_id = c.id
+    GROUP BY c.id
+"""
+
+PRODUCT_SALES_SQL = """
+    SELECT product_id, SUM(quantity)
+    FROM sales
+    GROUP BY product_id
+"""
+
+# sale_month is the stored generated column from migrations/0003
+MONTHLY_SALES_SQL = """
+    SELECT sale_month, SUM(quantity)
+    FROM sales
+    GROUP BY sale_month
+"""
+
+PRODUCT_SALES_SINCE_SQL = """
+    SELECT product_id, SUM(quantity)
+    FROM sales
+    WHERE id > %s
+    GROUP BY product_id
+"""
+
+MONTHLY_SALES_SINCE_SQL = """
+    SELECT sale_month, SUM(quantity)
+    FROM sales
+    WHERE id > %s
+    GROUP BY sale_month
+"""
+
+INVENTORY_SQL = """
+    SELECT product_id, SUM(quantity), COUNT(*)
+    FROM product_inventory_batches
+    GROUP BY product_id
+"""
+
+
+class AnalyticsStore:
+    def __init__(self, ttl=ANALYTICS_CACHE_TTL, refresh=ANALYTICS_REFRESH_SECONDS, connection=cache_connection,
+                 archive=ANALYTICS_ARCHIVE):
+        self.ttl = ttl
+        self.refresh = refresh
+        self._connection = connection
+        self.archive = archive
+        self._history = None
+        self._lock = threading.RLock()
+
+        self.products = {}
+        self.categories = []
+        self.product_sales = defaultdict(int)
+        self.monthly_sales = defaultdict(int)
+        self.inventory = defaultdict(int)
+        self.batch_counts = defaultdict(int)
+
+        self._loaded_at = None
+        self._reload_started = 0.0
+        self._mark = None
+        self._catalogue_stale = True
+        self._payload = None
+        self._payload_at = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.full_loads = 0
+
+    def _load_catalogue(self, cursor):
+        cursor.execute(PRODUCTS_SQL)
+        self.products = {pid: (name, category) for pid, name, category in cursor.fetchall()}
+        cursor.execute(CATEGORIES_SQL)
+        self.categories = [{"name": name, "count": int(count)} for name, count in cursor.fetchall()]
+        self._catalogue_stale = False
+
+    def _archived_totals(self):
+        # Totals of the archived sales, recomputed only when the archive grew
+        try:
+            import archive
+            watermark = archive.load_manifest(self.archive)["watermark"]
+            if not isinstance(watermark, int):
+                return None
+            if self._history is None or self._history[2] != watermark:
+                self._history = archive.totals(self.archive)
+            return self._history
+        except Exception:
+            log.exception("sales archive %r unusable, aggregating the sales table", self.archive)
+            return None
+
+    def _load_all(self, cursor):
+        # Taken first: a sibling's write racing the queries reloads again
+        self._mark = versions.mark(*versions.DATASETS)
+        self._load_catalogue(cursor)
+
+        history = self._archived_totals() if self.archive else None
+        if history is None:
+            cursor.execute(PRODUCT_SALES_SQL)
+            self.product_sales = defaultdict(int, {pid: int(qty or 0) for pid, qty in cursor.fetchall()})
+            cursor.execute(MONTHLY_SALES_SQL)
+            self.monthly_sales = defaultdict(int, {month: int(qty or 0) for month, qty in cursor.fetchall()})
+        else:
+            by_product, by_month, watermark = history
+            self.product_sales = defaultdict(int, by_product)
+            self.monthly_sales = defaultdict(int, by_month)
+            cursor.execute(PRODUCT_SALES_SINCE_SQL, (watermark,))
+            for pid, qty in cursor.fetchall():
+                self.product_sales[pid] += int(qty or 0)
+            cursor.execute(MONTHLY_SALES_SINCE_SQL, (watermark,))
+            for month, qty in cursor.fetchall():
+                self.monthly_sales[month] += int(qty or 0)
+        cursor.execute(INVENTORY_SQL)
+        self.inventory = defaultdict(int)
+        self.batch_counts = defaultdict(int)
+        for pid, qty, batches in cursor.fetchall():
+            self.inventory[pid] = int(qty or 0)
+            self.batch_counts[pid] = int(batches)
+
+        self._loaded_at = time.monotonic()
+        self.full_loads += 1
+
+    def _render(self):
+        top = heapq.nlargest(5, (pid for pid in self.product_sales if pid in self.products),
+                             key=self.product_sales.__getitem__)
+        return {
+            "top_products": [
+                {"name": self.products[pid][0], "category": self.products[pid][1], "sales": self.product_sales[pid]}
+                for pid in top
+            ],
+            "categories": list(self.categories),
+            "monthly_sales": [{"month": m, "total": self.monthly_sales[m]} for m in sorted(self.monthly_sales)],
+            "inventory": [
+                {"name": self.products[pid][0], "category": self.products[pid][1], "inventory": self.inventory[pid]}
+                for pid, count in self.batch_counts.items() if count > 0 and pid in self.products
+            ]
+        }
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._payload is not None and now - self._payload_at < self.ttl:
+                self.hits += 1
+                return self._payload
+            self.misses += 1
+
+            full = (self._loaded_at is None or now - self._loaded_at > self.refresh
+                    or versions.foreign(self._mark))
+            if full or self._catalogue_stale:
+                if full:
+                    self._begin_reload()
+                with self._connection() as conn, closing(conn.cursor()) as cursor:
+                    if full:
+                        self._load_all(cursor)
+                    else:
+                        self._load_catalogue(cursor)
+
+            self._payload = self._render()
+            self._payload_at = now
+            return self._payload
+
+    def _begin_reload(self):
+        # Signals go out after their commit and outside this lock, so a write
+        # the reload reads may still be on its way to the handlers. They skip
+        # anything signalled before this point: it is committed (the stock
+        # ledger's sales once drained) and cache_connection() only picks a
+        # replica past the last signalled write. A commit whose signal lands
+        # just after this point is still counted twice, until the next reload.
+        self._reload_started = time.monotonic()
+        stock = get_ledger()
+        if stock is not None and not stock.drain():
+            log.warning("stock ledger not drained; analytics may miss its latest sales until the next reload")
+
+    def invalidate(self, full=False):
+        with self._lock:
+            self._payload = None
+            if full:
+                self._loaded_at = None
+
+    def on_sales_recorded(self, sender, rows):
+        signalled = time.monotonic()
+        with self._lock:
+            if signalled < self._reload_started:
+                return
+            for product_id, _, quantity, sale_date in rows:
+                self.product_sales[product_id] += quantity
+                self.monthly_sales[sale_date.strftime("%Y-%m")] += quantity
+            self._payload = None
+
+    def on_inventory_changed(self, sender, changes):
+        signalled = time.monotonic()
+        with self._lock:
+            if signalled < self._reload_started:
+                return
+            for change in changes:
+                product_id = change["product_id"]
+                self.inventory[product_id] += change["delta"]
+                if change["op"] == "add":
+                    self.batch_counts[product_id] += 1
+                elif change["op"] == "delete":
+                    self.batch_counts[product_id] -= 1
+            self._payload = None
+
+    def on_catalogue_changed(self, sender, product_id, action):
+        with self._lock:
+            if action == "deleted":
+                self.inventory.pop(product_id, None)
+                self.batch_counts.pop(product_id, None)
+            self._catalogue_stale = True
+            self._payload = None
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "full_loads": self.full_loads,
+                    "products": len(self.products), "months": len(self.monthly_sales)}
+
+
+store = AnalyticsStore()
+sales_recorded.connect(store.on_sales_recorded)
+inventory_changed.connect(store.on_inventory_changed)
+catalogue_changed.connect(store.on_catalogue_changed)
@@ -0,0 +1,383 @@
+# Month-partitioned columnar archive of sales history
+#
+#   python archive.py sync                             # append new rows from the sales table
+#   python archive.py import sales_data.csv            # append a sales CSV (dataset named after the file)
+#   python archive.py info [--dataset sales]
+#
+# Each dataset is a directory of uncompressed Arrow IPC files, one or more
+# per month (month=YYYY-MM/part-NNNNN.arrow), plus _manifest.json with the
+# parts and the watermark appends resume from: the last sales.id for the
+# table, the byte offset already read for a CSV. Uncompressed IPC files can be
+# memory-mapped, so read() hands back columns that point straight into the
+# page cache: only the requested columns of the requested months are
+# touched, and nothing is parsed or copied until a caller converts it.
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+from contextlib import closing
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+
+ARCHIVE_DIR = os.environ.get("SALES_ARCHIVE_DIR", "archive")
+SYNC_CHUNK_ROWS = int(os.environ.get("ARCHIVE_SYNC_CHUNK_ROWS", 200_000))
+# A month with more parts than this is rewritten as one part on the next append
+COMPACT_AFTER_PARTS = 16
+
+SCHEMA = pa.schema([
+    ("user_id", pa.int32()),
+    ("product_id", pa.int32()),
+    # Dictionary-encoded: a handful of names repeated on every row
+    ("category", pa.dictionary(pa.int32(), pa.string())),
+    ("quantity", pa.int32()),
+    ("sale_date", pa.date32()),
+    ("batch_id", pa.int32()),
+])
+
+SALES_SINCE_SQL = """
+    SELECT s.id, s.user_id, s.product_id, c.name, s.quantity, s.sale_date, s.batch_id
+    FROM sales s
+    LEFT JOIN products p ON p.id = s.product_id
+    LEFT JOIN categories c ON c.id = p.category_id
+    WHERE s.id > %s
+    ORDER BY s.id
+    LIMIT %s
+"""
+
+
+class ArchiveError(RuntimeError):
+    pass
+
+
+def _dataset_dir(dataset, archive_dir):
+    return os.path.join(archive_dir, dataset)
+
+
+def load_manifest(dataset="sales", archive_dir=ARCHIVE_DIR):
+    path = os.path.join(_dataset_dir(dataset, archive_dir), "_manifest.json")
+    if not os.path.exists(path):
+        return {"dataset": dataset, "watermark": None, "next_part": 0, "parts": []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest, archive_dir):
+    directory = _dataset_dir(manifest["dataset"], archive_dir)
+    tmp = os.path.join(directory, "_manifest.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    # Parts are written before the manifest names them, so a crash leaves at
+    # worst an unreferenced file, never a manifest pointing at a partial one
+    os.replace(tmp, os.path.join(directory, "_manifest.json"))
+
+
+def _write_table(table, path):
+    tmp = path + ".tmp"
+    # IPC files allow one dictionary per column, so chunks must share it
+    table = table.unify_dictionaries().combine_chunks()
+    with pa.OSFile(tmp, "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def _part_paths(manifest, archive_dir):
+    return [os.path.join(_dataset_dir(manifest["dataset"], archive_dir), p["file"]) for p in manifest["parts"]]
+
+
+def append(table, dataset, watermark, archive_dir=ARCHIVE_DIR):
+    """Write ``table`` as new month parts and move the watermark; returns rows written."""
+    table = table.select(SCHEMA.names).cast(SCHEMA)
+    manifest = load_manifest(dataset, archive_dir)
+    directory = _dataset_dir(dataset, archive_dir)
+    os.makedirs(directory, exist_ok=True)
+
+    if table.num_rows:
+        months = pc.strftime(table["sale_date"], format="%Y-%m")
+        for month in sorted(pc.unique(months).to_pylist()):
+            part = table.filter(pc.equal(months, month))
+            file = f"month={month}/part-{manifest['next_part']:05d}.arrow"
+            manifest["next_part"] += 1
+            os.makedirs(os.path.join(directory, f"month={month}"), exist_ok=True)
+            _write_table(part, os.path.join(directory, file))
+            dates = pc.min_max(part["sale_date"])
+            manifest["parts"].append({"month": month, "file": file, "rows": part.num_rows,
+                                      "min_date": dates["min"].as_py().isoformat(),
+                                      "max_date": dates["max"].as_py().isoformat()})
+    manifest["watermark"] = watermark
+    _save_manifest(manifest, archive_dir)
+    _compact(manifest, archive_dir)
+    return table.num_rows
+
+
+def _compact(manifest, archive_dir):
+    directory = _dataset_dir(manifest["dataset"], archive_dir)
+    by_month = {}
+    for part in manifest["parts"]:
+        by_month.setdefault(part["month"], []).append(part)
+    stale = []
+    for month, parts in by_month.items():
+        if len(parts) <= COMPACT_AFTER_PARTS:
+            continue
+        merged = pa.concat_tables(_read_part(os.path.join(directory, p["file"])) for p in parts)
+        file = f"month={month}/part-{manifest['next_part']:05d}.arrow"
+        manifest["next_part"] += 1
+        _write_table(merged, os.path.join(directory, file))
+        manifest["parts"] = [p for p in manifest["parts"] if p["month"] != month]
+        manifest["parts"].append({"month": month, "file": file, "rows": merged.num_rows,
+                                  "min_date": min(p["min_date"] for p in parts),
+                                  "max_date": max(p["max_date"] for p in parts)})
+        stale.extend(p["file"] for p in parts)
+    if stale:
+        manifest["parts"].sort(key=lambda p: (p["month"], p["file"]))
+        _save_manifest(manifest, archive_dir)
+        for file in stale:
+            os.remove(os.path.join(directory, file))
+
+
+def sync(conn, dataset="sales", archive_dir=ARCHIVE_DIR, chunk_rows=SYNC_CHUNK_ROWS):
+    """Append sales rows past the watermark; sales are insert-only, so id order is enough."""
+    total = 0
+    while True:
+        watermark = load_manifest(dataset, archive_dir)["watermark"] or 0
+        with closing(conn.cursor()) as cursor:
+            cursor.execute(SALES_SINCE_SQL, (watermark, chunk_rows))
+            rows = cursor.fetchall()
+        if not rows:
+            return total
+        ids, user_ids, product_ids, categories, quantities, sale_dates, batch_ids = zip(*rows)
+        table = pa.table({
+            "user_id": pa.array(user_ids, pa.int32()),
+            "product_id": pa.array(product_ids, pa.int32()),
+            "category": pa.array(categories, pa.string()).dictionary_encode(),
+            "quantity": pa.array(quantities, pa.int32()),
+            "sale_date": pa.array([_as_date(d) for d in sale_dates], pa.date32()),
+            "batch_id": pa.array(batch_ids, pa.int32()),
+        })
+        total += append(table, dataset, int(ids[-1]), archive_dir)
+        if len(rows) < chunk_rows:
+            return total
+
+
+def _as_date(value):
+    return value.date() if hasattr(value, "date") else value
+
+
+def _parse_dates(column):
+    try:
+        return pd.to_datetime(column, format="%Y-%m-%d")
+    except ValueError:
+        # smartretail_sales_data.csv writes M/D/YYYY
+        return pd.to_datetime(column, format="%m/%d/%Y")
+
+
+class _Limited(io.RawIOBase):
+    # The first ``remaining`` bytes of a file, so a CSV being appended to is
+    # read only up to the last complete line seen at the start
+    def __init__(self, f, remaining):
+        self._f = f
+        self._remaining = remaining
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self._f.readinto(memoryview(buffer)[:min(len(buffer), self._remaining)])
+        self._remaining -= n
+        return n
+
+
+def _fingerprint(f):
+    f.seek(0)
+    return hashlib.sha256(f.read(4096)).hexdigest()
+
+
+def _complete_end(f, size):
+    # Offset just past the last newline before ``size``
+    position = size
+    while position > 0:
+        step = min(65536, position)
+        f.seek(position - step)
+        newline = f.read(step).rfind(b"\n")
+        if newline >= 0:
+            return position - step + newline + 1
+        position -= step
+    return 0
+
+
+def import_csv(path, dataset=None, archive_dir=ARCHIVE_DIR, chunksize=SYNC_CHUNK_ROWS):
+    """Append the lines of a sales CSV not archived yet; the file may only grow."""
+    dataset = dataset or os.path.splitext(os.path.basename(path))[0]
+    watermark = load_manifest(dataset, archive_dir)["watermark"]
+    total = 0
+    with open(path, "rb") as f:
+        fingerprint = _fingerprint(f)
+        f.seek(0)
+        header = f.readline().decode("utf-8").strip().split(",")
+        start, skip, rows = f.tell(), 0, 0
+        if watermark:
+            if watermark["fingerprint"] != fingerprint or os.path.getsize(path) < watermark["offset"]:
+                raise ArchiveError(f"{path} was rewritten since it was archived; "
+                                   f"delete {dataset!r} from the archive to rebuild it")
+            start, skip, rows = watermark["offset"], watermark["skip"], watermark["rows"]
+        end = _complete_end(f, os.path.getsize(path))
+        if end <= start:
+            return 0
+        f.seek(start)
+        source = io.BufferedReader(_Limited(f, end - start))
+        # Lines archived by an interrupted import of this range are skipped
+        reader = pd.read_csv(source, names=header, header=None, skiprows=skip, chunksize=chunksize,
+                             dtype={"category": str})
+        for chunk in reader:
+            chunk["sale_date"] = _parse_dates(chunk["sale_date"]).dt.date
+            if "category" not in chunk:
+                chunk["category"] = None
+            skip += len(chunk)
+            rows += len(chunk)
+            table = pa.Table.from_pandas(chunk[SCHEMA.names], schema=SCHEMA, preserve_index=False)
+            total += append(table, dataset, {"fingerprint": fingerprint, "offset": start, "skip": skip,
+                                             "rows": rows}, archive_dir)
+    append(SCHEMA.empty_table(), dataset, {"fingerprint": fingerprint, "offset": end, "skip": 0, "rows": rows},
+           archive_dir)
+    return total
+
+
+def _read_part(path):
+    # Zero-copy: the buffers of the returned table are the mapped file
+    with pa.memory_map(path, "r") as source:
+        return ipc.open_file(source).read_all()
+
+
+def read(dataset="sales", columns=None, start=None, end=None, archive_dir=ARCHIVE_DIR):
+    """Rows with ``start <= sale_date <= end`` as a pyarrow Table of ``columns``.
+
+    Months outside the range are never opened; only parts straddling a
+    bound are filtered, everything else is returned as mapped.
+    """
+    manifest = load_manifest(dataset, archive_dir)
+    start = date.fromisoformat(start) if isinstance(start, str) else start
+    end = date.fromisoformat(end) if isinstance(end, str) else end
+    columns = list(columns) if columns else SCHEMA.names
+    needed = columns if "sale_date" in columns or not (start or end) else columns + ["sale_date"]
+
+    tables = []
+    for part, path in zip(manifest["parts"], _part_paths(manifest, archive_dir)):
+        low, high = date.fromisoformat(part["min_date"]), date.fromisoformat(part["max_date"])
+        if (start and high < start) or (end and low > end):
+            continue
+        table = _read_part(path).select(needed)
+        if (start and low < start) or (end and high > end):
+            mask = pc.and_(pc.greater_equal(table["sale_date"], pa.scalar(start or low, pa.date32())),
+                           pc.less_equal(table["sale_date"], pa.scalar(end or high, pa.date32())))
+            table = table.filter(mask)
+        tables.append(table.select(columns))
+    if not tables:
+        return SCHEMA.empty_table().select(columns)
+    return pa.concat_tables(tables)
+
+
+def daily_totals(dataset="sales", start=None, end=None, archive_dir=ARCHIVE_DIR):
+    """Quantity per (product_id, category, sale_date), the frame training.read_daily builds from a CSV.
+
+    Sums go through one bincount over product x day; each product takes the
+    category it was last archived with.
+    """
+    table = read(dataset, ["product_id", "category", "quantity", "sale_date"], start, end, archive_dir)
+    if not table.num_rows:
+        return pd.DataFrame({"product_id": pd.Series(dtype=np.int32), "category": pd.Categorical([]),
+                             "sale_date": pd.Series(dtype="datetime64[ns]"), "quantity": pd.Series(dtype=np.int64)})
+    table = table.unify_dictionaries()
+    product_ids = table["product_id"].to_numpy()
+    days = table["sale_date"].cast(pa.int32()).to_numpy()
+    first_day = int(days.min())
+    span = int(days.max()) - first_day + 1
+    # Sparse id ranges are renumbered first so the bins stay dense
+    ids = None
+    if (int(product_ids.max()) + 1) * span > 50_000_000:
+        ids, product_ids = np.unique(product_ids, return_inverse=True)
+    keys = product_ids.astype(np.int64) * span + (days - first_day)
+    present = np.flatnonzero(np.bincount(keys))
+    quantities = np.bincount(keys, weights=table["quantity"].to_numpy())[present].astype(np.int64)
+
+    category = table["category"]
+    names = category.chunk(0).dictionary.to_pylist() if category.num_chunks else []
+    codes = pa.chunked_array([pc.fill_null(c.indices, -1) for c in category.chunks], pa.int32()).to_numpy()
+    product_category = np.full(int(product_ids.max()) + 1, -1, dtype=np.int32)
+    product_category[product_ids] = codes
+
+    out_products = present // span
+    return pd.DataFrame({
+        "product_id": (out_products if ids is None else ids[out_products]).astype(np.int32),
+        "category": pd.Categorical.from_codes(product_category[out_products], categories=names),
+        "sale_date": np.datetime64("1970-01-01", "D") + (present % span + first_day).astype("timedelta64[D]"),
+        "quantity": quantities,
+    })
+
+
+def totals(dataset="sales", archive_dir=ARCHIVE_DIR):
+    """(per-product, per-month) quantity sums over the whole dataset, and its watermark."""
+    manifest = load_manifest(dataset, archive_dir)
+    table = read(dataset, ["product_id", "quantity", "sale_date"], archive_dir=archive_dir)
+    by_product = table.group_by("product_id").aggregate([("quantity", "sum")])
+    by_month = pa.table({"month": pc.strftime(table["sale_date"], format="%Y-%m"), "quantity": table["quantity"]}) \
+        .group_by("month").aggregate([("quantity", "sum")])
+    return (dict(zip(by_product["product_id"].to_pylist(), by_product["quantity_sum"].to_pylist())),
+            dict(zip(by_month["month"].to_pylist(), by_month["quantity_sum"].to_pylist())),
+            manifest["watermark"])
+
+
+def info(dataset="sales", archive_dir=ARCHIVE_DIR):
+    manifest = load_manifest(dataset, archive_dir)
+    paths = _part_paths(manifest, archive_dir)
+    return {
+        "dataset": dataset,
+        "watermark": manifest["watermark"],
+        "parts": len(manifest["parts"]),
+        "months": len({p["month"] for p in manifest["parts"]}),
+        "rows": sum(p["rows"] for p in manifest["parts"]),
+        "bytes": sum(os.path.getsize(p) for p in paths if os.path.exists(p)),
+        "first_date": min((p["min_date"] for p in manifest["parts"]), default=None),
+        "last_date": max((p["max_date"] for p in manifest["parts"]), default=None),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["sync", "import", "info"])
+    parser.add_argument("csv", nargs="?", help="CSV file for import")
+    parser.add_argument("--dataset", help="dataset name (default: sales, or the CSV's file name)")
+    parser.add_argument("--archive", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "sync":
+            import mysql.connector
+            from db import db_connection
+            try:
+                with db_connection() as conn:
+                    written = sync(conn, args.dataset or "sales", args.archive)
+            except mysql.connector.Error as err:
+                sys.exit(str(err))
+            print(json.dumps({"appended": written, **info(args.dataset or "sales", args.archive)}, indent=2))
+        elif args.command == "import":
+            if not args.csv:
+                sys.exit("import needs a CSV path")
+            dataset = args.dataset or os.path.splitext(os.path.basename(args.csv))[0]
+            written = import_csv(args.csv, dataset, args.archive)
+            print(json.dumps({"appended": written, **info(dataset, args.archive)}, indent=2))
+        else:
+            print(json.dumps(info(args.dataset or "sales", args.archive), indent=2))
+    except ArchiveError as e:
+        sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+# Async serving mode.
+#
+#   uvicorn asgi:app --port 5000
+#
+# The till-facing routes are native async handlers: blocking MySQL work runs
+# on a thread pool sized to the connection pool and model inference on its
+# own pool, so the event loop only parses requests and writes responses.
+# Every other route is served by the Flask app through a WSGI bridge.
+# /changes, the live stock feed, is held open on the event loop
+# (changefeed.py).
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import mysql.connector
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import HTTPConnection
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as flask_app
+import changefeed
+import db
+import http_cache
+import listing
+import metrics
+import replicas
+from routes import analytics as analytics_routes
+from routes.forecasting import forecasting, sync_sales_index
+import services
+
+# One thread per pooled connection; more would only queue on the pool
+DB_THREADS = int(os.environ.get("ASYNC_DB_THREADS", db.POOL_SIZE + db.POOL_MAX_OVERFLOW))
+INFERENCE_THREADS = int(os.environ.get("ASYNC_INFERENCE_THREADS", os.cpu_count() or 1))
+WSGI_THREADS = int(os.environ.get("ASYNC_WSGI_THREADS", 10))
+
+db_executor = ThreadPoolExecutor(DB_THREADS, thread_name_prefix="db")
+inference_executor = ThreadPoolExecutor(INFERENCE_THREADS, thread_name_prefix="inference")
+
+
+# run_in_executor doesn't carry context variables over, so the route label
+# the slow-query log reads is passed along explicitly
+async def run_db(fn, *args, **kwargs):
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(db_executor, context.run, partial(fn, *args, **kwargs))
+
+
+async def run_inference(fn, *args, **kwargs):
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        inference_executor, context.run, partial(fn, *args, **kwargs))
+
+
+class RequestTimer:
+    # Times the native routes up to the response headers, as the Flask hooks
+    # do; requests handed to the Flask app are left to those hooks
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics.METRICS:
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        token = metrics.current_route.set(scope["path"])
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                if isinstance(route, Route):
+                    metrics.observe_request(scope["method"], route.path, message["status"],
+                                            time.perf_counter() - start)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            metrics.current_route.reset(token)
+
+
+class ReadYourWrites:
+    # The read_after cookie (replicas.py) for the native routes; requests
+    # handed to the Flask app get it from that app's hooks
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replicas.replicas.replicas:
+            return await self.app(scope, receive, send)
+        token = replicas.read_after.set(
+            replicas.session_after(HTTPConnection(scope).cookies.get(replicas.READ_AFTER_COOKIE)))
+
+        async def cookie_send(message):
+            if message["type"] == "http.response.start" and isinstance(scope.get("route"), Route) \
+                    and replicas.wrote(scope["method"], message["status"]):
+                cookie = (f"{replicas.READ_AFTER_COOKIE}={time.time()!r}; Max-Age={replicas.READ_AFTER_MAX_AGE}; "
+                          "Path=/; HttpOnly; SameSite=Lax")
+                message = {**message, "headers": [*message["headers"], (b"set-cookie", cookie.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, cookie_send)
+        finally:
+            replicas.read_after.reset(token)
+
+
+async def json_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+class RowsResponse(JSONResponse):
+    # Dates and decimals rendered the way the Flask routes render them
+    def render(self, content):
+        return listing.dumps(content).encode("utf-8")
+
+
+def reply(result):
+    payload, status = result
+    return JSONResponse(payload, status_code=status)
+
+
+async def drain(chunks, close):
+    # Rows are fetched on the DB pool; the connection goes back when the
+    # body is done or the client disconnects
+    try:
+        while True:
+            chunk = await run_db(next, chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        db_executor.submit(close)
+
+
+def listing_route(spec, datasets=("catalogue", "inventory")):
+    async def handler(request):
+        args = request.query_params
+        path = request.url.path + ("?" + request.url.query if request.url.query else "?")
+        # The same validators the Flask route hands out, so either can answer a 304
+        tag, modified = http_cache.data_version(path, datasets)
+        headers = http_cache.validators(tag, modified)
+        if http_cache.not_modified(request.headers, tag, modified):
+            return Response(status_code=304, headers=headers)
+        reads = replicas.Reads()
+        token = replicas.current_reads.set(reads)
+        try:
+            if args.get("limit"):
+                rows = await run_db(listing.page, spec, args)
+            else:
+                ndjson = args.get("format") == "ndjson"
+                chunks, close = await run_db(listing.stream, spec, args, ndjson=ndjson)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        except mysql.connector.Error as err:
+            return JSONResponse({"error": str(err)}, status_code=500)
+        finally:
+            replicas.current_reads.reset(token)
+        if reads.upto < modified:
+            # Served by a replica that hasn't applied the change the tag names
+            headers = None
+        if args.get("limit"):
+            return RowsResponse(rows, headers=headers)
+        return StreamingResponse(drain(chunks, close), headers=headers,
+                                 media_type="application/x-ndjson" if ndjson else "application/json")
+    return handler
+
+
+async def analytics(request):
+    try:
+        body = analytics_routes.analytics_bodies.body(await run_db(analytics_routes.analytics_store.snapshot))
+    except mysql.connector.Error as err:
+        return JSONResponse({"error": str(err)}, status_code=500)
+    status, data, headers = body.representation(request.headers)
+    return Response(data, status_code=status, headers=headers, media_type=body.mimetype if status == 200 else None)
+
+
+async def sell(request):
+    return reply(await run_db(services.sell, await json_body(request)))
+
+
+async def create_invoice(request):
+    return reply(await run_db(services.create_invoice, await json_body(request), request.headers.get("Idempotency-Key")))
+
+
+def model_cache(request):
+    try:
+        state = forecasting()
+        sync_sales_index(state.lags)
+        return state.caches.get(request.query_params.get("model")), None
+    except KeyError as e:
+        return None, JSONResponse({"error": e.args[0]}, status_code=400)
+    except Exception as e:
+        return None, JSONResponse({"error": f"ML model not loaded: {e}"}, status_code=500)
+
+
+async def predict_demand(request):
+    # First use of a model loads it from disk, so even the lookup is off-loop
+    cache, error = await run_inference(model_cache, request)
+    if error:
+        return error
+    return reply(await run_inference(services.predict_demand, cache, request.query_params))
+
+
+async def predict_demand_batch(request):
+    cache, error = await run_inference(model_cache, request)
+    if error:
+        return error
+    try:
+        product_ids, months, weeks = services.parse_predict_batch(await json_body(request))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    try:
+        predictions = await run_inference(cache.lookup, product_ids, months, weeks)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+    import forecast
+    ndjson = request.query_params.get("format") == "ndjson"
+    return StreamingResponse(forecast.stream_predictions(product_ids, months, weeks, predictions, ndjson=ndjson),
+                             media_type="application/x-ndjson" if ndjson else "application/json")
+
+
+# One wake-up per feed move for all of this loop's subscribers
+change_wake = changefeed.AsyncWake(changefeed.feed)
+
+
+async def changes(request):
+    subscription = changefeed.Subscription(
+        changefeed.feed, request.headers.get("last-event-id") or request.query_params.get("last_event_id"))
+    return StreamingResponse(change_wake.stream(subscription), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+app = Starlette(
+    routes=[
+        Route("/products", listing_route(listing.PRODUCTS), methods=["GET"]),
+        Route("/inventory", listing_route(listing.INVENTORY), methods=["GET"]),
+        Route("/analytics", analytics),
+        Route("/sales/sell", sell, methods=["POST"]),
+        Route("/create-invoice", create_invoice, methods=["POST"]),
+        Route("/predict_demand", predict_demand, methods=["GET"]),
+        Route("/predict_demand/batch", predict_demand_batch, methods=["POST"]),
+        Route("/changes", changes, methods=["GET"]),
+        Mount("/", WSGIMiddleware(flask_app.app, workers=WSGI_THREADS)),
+    ],
+    middleware=[
+        Middleware(RequestTimer),
+        Middleware(ReadYourWrites),
+        Middleware(http_cache.CompressionMiddleware),
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+    ],
+)
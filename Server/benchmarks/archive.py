@@ -0,0 +1,82 @@
+# Sales CSV parsing vs the columnar archive on a synthetic multi-year history.
+#
+#   python -m benchmarks.archive --rows 5000000 --days 1095
+#
+# Each reader runs in its own subprocess so wall time and peak RSS are
+# measured independently; the archive is built once up front (not timed).
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.training import generate
+
+
+def measure(reader, csv_path, archive_dir):
+    os.environ["SALES_ARCHIVE_DIR"] = archive_dir
+    import archive
+    import training
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if reader == "csv_daily":
+        rows = len(training.read_daily(csv_path))
+    elif reader == "archive_daily":
+        rows = len(archive.daily_totals("bench"))
+    elif reader == "archive_quarter":
+        # Two columns of one quarter, left memory-mapped
+        table = archive.read("bench", ["product_id", "quantity"], "2024-01-01", "2024-03-31")
+        rows = table.num_rows
+        int(table["quantity"].to_numpy().sum())
+    else:
+        raise ValueError(reader)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Growth over the interpreter with pandas, pyarrow and sklearn imported;
+    # mapped archive pages count here too, though they are clean page cache
+    return {"reader": reader, "seconds": round(elapsed, 3), "rows": rows,
+            "peak_rss_growth_mb": round((peak - baseline) / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=1095)
+    parser.add_argument("--measure", nargs=3, metavar=("READER", "CSV", "ARCHIVE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+
+    workdir = tempfile.mkdtemp(prefix="smartretail-archive-")
+    csv_path = os.path.join(workdir, "history.csv")
+    archive_dir = os.path.join(workdir, "archive")
+    generate(csv_path, args.rows, args.products, days=args.days)
+
+    os.environ["SALES_ARCHIVE_DIR"] = archive_dir
+    import archive
+    start = time.perf_counter()
+    archive.import_csv(csv_path, "bench", archive_dir)
+    built = time.perf_counter() - start
+
+    results = []
+    for reader in ("csv_daily", "archive_daily", "archive_quarter"):
+        out = subprocess.run([sys.executable, "-m", "benchmarks.archive", "--measure", reader, csv_path, archive_dir],
+                             capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    print(json.dumps({
+        "rows": args.rows,
+        "csv_mb": round(os.path.getsize(csv_path) / 2**20, 1),
+        "archive": {**archive.info("bench", archive_dir), "build_s": round(built, 3)},
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
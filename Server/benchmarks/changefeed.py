@@ -0,0 +1,167 @@
+# Fan-out of the /changes feed to many subscribers.
+#
+#   python -m benchmarks.changefeed --subscribers 500 --writes 200
+#   python -m benchmarks.changefeed --workers 2      # gunicorn, uvicorn workers, preloaded
+#
+# Serves asgi:app against a seeded SQLite stand-in (uvicorn, or gunicorn
+# with --workers), opens --subscribers SSE streams from one asyncio client,
+# then sends --writes sales one at a time. Reports, per sale, the time from
+# sending the request to each subscriber receiving its event, whether every
+# subscriber saw every event in order, the server's PSS, and the bytes a
+# client receives per change against a GET /inventory refetch.
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import prefork
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start(env, port, workers):
+    if workers:
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "asgi:app"]
+        env = {**env, "BIND": f"127.0.0.1:{port}", "WEB_CONCURRENCY": str(workers),
+               "WORKER_CLASS": "uvicorn.workers.UvicornWorker"}
+    else:
+        command = [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port), "--log-level", "warning"]
+    process = subprocess.Popen(command, cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/admin/changes", timeout=5).read()
+            return process
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("server did not start")
+
+
+class Subscriber:
+    def __init__(self):
+        self.ids = []
+        self.received = []
+        self.bytes = 0
+
+    async def run(self, port, ready):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /changes HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n")
+        await writer.drain()
+        reset = False
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.bytes += len(line)
+                if line.startswith(b"event: reset"):
+                    reset = True
+                    ready.release()
+                elif line.startswith(b"id: ") and not reset:
+                    self.ids.append(line[4:].strip().decode())
+                    self.received.append(time.perf_counter())
+                elif line == b"\n":
+                    reset = False
+        finally:
+            writer.close()
+
+
+def post(url, body):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), method="POST",
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.status
+
+
+async def measure(port, subscribers, writes, product_ids):
+    ready = asyncio.Semaphore(0)
+    subs = [Subscriber() for _ in range(subscribers)]
+    tasks = [asyncio.create_task(s.run(port, ready)) for s in subs]
+    for _ in subs:
+        await asyncio.wait_for(ready.acquire(), 60)
+    base = f"http://127.0.0.1:{port}"
+    rng = random.Random(1)
+    loop = asyncio.get_running_loop()
+    sent = []
+    for _ in range(writes):
+        sent.append(time.perf_counter())
+        body = {"user_id": 1, "product_id": rng.choice(product_ids), "quantity": 1}
+        await loop.run_in_executor(None, post, base + "/sales/sell", body)
+    # Let the last events arrive
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and any(len(s.received) < writes for s in subs):
+        await asyncio.sleep(0.05)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies = [s.received[i] - sent[i] for s in subs for i in range(min(writes, len(s.received)))]
+    first = subs[0].ids
+    latencies.sort()
+    return {
+        "subscribers": subscribers,
+        "writes": writes,
+        "complete": sum(len(s.received) == writes for s in subs),
+        "same_order": all(s.ids == first for s in subs),
+        "delivery_ms": {
+            "p50": round(statistics.median(latencies) * 1000, 1),
+            "p99": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+            "max": round(latencies[-1] * 1000, 1),
+        },
+        "stream_bytes_per_write": round(statistics.mean(s.bytes for s in subs) / writes, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", default=os.path.join(SERVER_DIR, "sales_data.csv"))
+    parser.add_argument("--subscribers", type=int, default=500)
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=0, help="gunicorn workers (0: one uvicorn process)")
+    args = parser.parse_args()
+
+    from benchmarks.seed import seed
+    db_path = os.path.join(tempfile.mkdtemp(prefix="changefeed-"), "bench.sqlite3")
+    seed(db_path, args.csv)
+    with sqlite3.connect(db_path) as conn:
+        product_ids = [pid for (pid,) in conn.execute("SELECT id FROM products")]
+    env = {**os.environ, "DB_BACKEND": "sqlite", "SQLITE_PATH": db_path, "PYTHONWARNINGS": "ignore",
+           "WARM_UP": "0"}
+
+    port = _free_port()
+    process = start(env, port, args.workers)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/inventory", timeout=30) as response:
+            refetch = len(response.read())
+        report = asyncio.run(measure(port, args.subscribers, args.writes, product_ids))
+        memory = prefork.deployment_memory(process.pid) if args.workers else prefork.memory(process.pid)
+        report.update({
+            "workers": args.workers,
+            "inventory_refetch_bytes": refetch,
+            "server_pss_mb": memory["total_pss_mb"] if args.workers else memory["pss_mb"],
+        })
+    finally:
+        process.terminate()
+        process.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# Expiry index vs scanning the batch table, on synthetic batches in SQLite.
+#
+#   python -m benchmarks.expiry --batches 300000 --products 5000
+#
+# The scan baseline is what the inventory page does today: fetch every
+# batch ordered by expiry and filter/group the result.
+import argparse
+import json
+import sqlite3
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import numpy as np
+
+from expiry import ExpiryIndex
+
+
+class _Cursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, sql, params=()):
+        self.cursor.execute(sql.replace("%s", "?"), params)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def close(self):
+        self.cursor.close()
+
+
+class _Connection:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def cursor(self):
+        return _Cursor(self.conn.cursor())
+
+
+def seed(batches, products, seed=7):
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+    conn.executescript("""
+        CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, price REAL);
+        CREATE TABLE product_inventory_batches (
+            id INTEGER PRIMARY KEY, product_id INT, quantity INT, expiry_date DATE, supplier_name TEXT);
+    """)
+    conn.executemany("INSERT INTO products VALUES (?, ?, ?)",
+                     [(i, f"Product {i}", float(rng.integers(10, 500))) for i in range(1, products + 1)])
+    today = date.today()
+    expiries = [(today + timedelta(days=int(d))).isoformat() for d in rng.integers(-30, 365, batches)]
+    conn.executemany(
+        "INSERT INTO product_inventory_batches (product_id, quantity, expiry_date, supplier_name) VALUES (?, ?, ?, ?)",
+        zip(rng.integers(1, products + 1, batches).tolist(), rng.integers(1, 200, batches).tolist(), expiries,
+            [f"Supplier {s}" for s in rng.integers(1, 50, batches).tolist()]))
+    conn.commit()
+    return conn
+
+
+def scan(conn, days):
+    today = date.today()
+    cutoff = today + timedelta(days=days)
+    cursor = conn.execute("""
+        SELECT b.id, b.product_id, b.quantity, b.expiry_date, p.price
+        FROM product_inventory_batches b JOIN products p ON b.product_id = p.id
+        ORDER BY b.expiry_date ASC
+    """)
+    groups = defaultdict(lambda: [0, 0.0, 0])
+    for _, product_id, quantity, expiry_date, price in cursor.fetchall():
+        if quantity > 0 and today <= expiry_date <= cutoff:
+            group = groups[product_id]
+            group[0] += quantity
+            group[1] += quantity * price
+            group[2] += 1
+    return groups
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(float(np.median(samples)), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batches", type=int, default=300_000)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    conn = seed(args.batches, args.products)
+
+    @contextmanager
+    def connection():
+        yield _Connection(conn)
+
+    index = ExpiryIndex(connection=connection)
+    start = time.perf_counter()
+    index.expiring(0)
+    load_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    results = {"batches": args.batches, "products": args.products, "index_load_ms": load_ms, "windows": []}
+    for days in (3, 30, 365):
+        results["windows"].append({
+            "days": days,
+            "at_risk_batches": index.expiring(days)["batches"],
+            "index_ms": timed(lambda: index.expiring(days), args.repeat),
+            "index_by_supplier_ms": timed(lambda: index.expiring(days, group_by="supplier"), args.repeat),
+            "scan_ms": timed(lambda: scan(conn, days), args.repeat),
+        })
+
+    # Sales trickling in between queries, as the signal handlers see them
+    ids = np.random.default_rng(1).integers(1, args.batches + 1, 10_000).tolist()
+    start = time.perf_counter()
+    for batch_id in ids:
+        index.on_inventory_changed("bench", [{"op": "update", "product_id": 0, "batch_id": batch_id, "delta": -1}])
+    results["updates_per_s"] = round(len(ids) / (time.perf_counter() - start))
+    results["index"] = index.stats()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
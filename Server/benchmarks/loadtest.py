@@ -0,0 +1,175 @@
+# Concurrency scaling: Flask dev server (app.py) vs the ASGI app (asgi.py).
+#
+#   python -m benchmarks.loadtest --path "/predict_demand?product_id=1&month=5&week=20"
+#   python -m benchmarks.loadtest --path /sales/sell --body '{"user_id": 1, "product_id": 1, "quantity": 1}'
+#
+# Each server is started in its own process and driven by N concurrent
+# clients (one connection each, keep-alive when the server allows it) for
+# a fixed duration per concurrency level. Use --url to drive a server that
+# is already running instead.
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+SERVERS = {
+    "flask": [sys.executable, "-m", "flask", "--app", "app", "run", "--port", "{port}"],
+    "asgi": [sys.executable, "-m", "uvicorn", "asgi:app", "--port", "{port}", "--log-level", "warning"],
+}
+
+
+class Connection:
+    """Just enough HTTP/1.1 for a load generator."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        headers = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", "Connection: keep-alive"]
+        if body is not None:
+            headers += ["Content-Type: application/json", f"Content-Length: {len(body)}"]
+        self.writer.write(("\r\n".join(headers) + "\r\n\r\n").encode() + (body or b""))
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed")
+        version, status = status_line.split(b" ", 2)[:2]
+        length, chunked, keep_alive = None, False, version == b"HTTP/1.1"
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "transfer-encoding" and "chunked" in value:
+                chunked = True
+            elif name == "connection":
+                keep_alive = value == "keep-alive" or (keep_alive and value != "close")
+
+        if chunked:
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif length is not None:
+            await self.reader.readexactly(length)
+        else:
+            await self.reader.read()
+            keep_alive = False
+        if not keep_alive:
+            await self.close()
+        return int(status)
+
+
+async def client(url, method, body, deadline, latencies, errors):
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    conn = Connection(parts.hostname, parts.port or 80)
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status = await conn.request(method, path, body)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+                await conn.close()
+                errors["connection"] += 1
+                await asyncio.sleep(0.01)
+                continue
+            latencies.append(time.perf_counter() - start)
+            if status >= 500:
+                errors["5xx"] += 1
+    finally:
+        await conn.close()
+
+
+async def level(url, method, body, concurrency, duration):
+    latencies, errors = [], {"connection": 0, "5xx": 0}
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(client(url, method, body, deadline, latencies, errors) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    ms = np.asarray(latencies) * 1000
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2) if len(ms) else None,
+        "p99_ms": round(float(np.percentile(ms, 99)), 2) if len(ms) else None,
+        **{f"errors_{k}": v for k, v in errors.items()},
+    }
+
+
+def wait_ready(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            asyncio.run(Connection(urlsplit(url).hostname, urlsplit(url).port).request("GET", "/"))
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not come up")
+
+
+def run_levels(url, args):
+    results = []
+    body = args.body.encode() if args.body else None
+    method = "POST" if body is not None else "GET"
+    for concurrency in args.concurrency:
+        result = asyncio.run(level(url + args.path, method, body, concurrency, args.duration))
+        print(result, flush=True)
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default="/predict_demand?product_id=1&month=5&week=20")
+    parser.add_argument("--body", help="JSON body; sends POST when given")
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 10, 50, 100, 200])
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per concurrency level")
+    parser.add_argument("--servers", default="flask,asgi")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--url", help="drive an already running server instead")
+    args = parser.parse_args()
+
+    if args.url:
+        print(json.dumps({"url": args.url, "results": run_levels(args.url.rstrip("/"), args)}, indent=2))
+        return
+
+    report = {"path": args.path, "duration_s": args.duration, "servers": {}}
+    for name in args.servers.split(","):
+        cmd = [part.format(port=args.port) for part in SERVERS[name]]
+        server = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                  cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        try:
+            url = f"http://127.0.0.1:{args.port}"
+            wait_ready(url)
+            print(f"{name}:", flush=True)
+            report["servers"][name] = run_levels(url, args)
+        finally:
+            server.terminate()
+            server.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
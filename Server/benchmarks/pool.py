@@ -0,0 +1,76 @@
+# Connect-per-request vs pooled throughput.
+#
+#   python -m benchmarks.pool                      # against db_config (MySQL)
+#   python -m benchmarks.pool --sqlite bench.db    # local SQLite stand-in
+import argparse
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from db import ConnectionPool, db_connection, get_db_connection
+
+
+def run(workers, requests_per_worker, handler):
+    errors = []
+
+    def worker():
+        for _ in range(requests_per_worker):
+            try:
+                handler()
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    total = workers * requests_per_worker
+    return {"requests": total, "errors": len(errors), "seconds": round(elapsed, 3),
+            "req_per_s": round(total / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sqlite", help="benchmark against a SQLite file instead of MySQL")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per worker")
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--query", default="SELECT 1")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        def connect():
+            return sqlite3.connect(args.sqlite, check_same_thread=False)
+    else:
+        connect = get_db_connection
+
+    def query(conn):
+        with closing(conn.cursor()) as cursor:
+            cursor.execute(args.query)
+            cursor.fetchall()
+
+    def per_request():
+        conn = connect()
+        try:
+            query(conn)
+        finally:
+            conn.close()
+
+    pool = ConnectionPool(connect=connect, size=args.pool_size)
+
+    def pooled():
+        with db_connection(pool) as conn:
+            query(conn)
+
+    print("connect-per-request:", run(args.workers, args.requests, per_request))
+    print("pooled:             ", run(args.workers, args.requests, pooled))
+    print("pool stats:         ", pool.stats())
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
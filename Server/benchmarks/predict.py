@@ -0,0 +1,56 @@
+# Per-call DataFrame prediction vs one vectorized batch.
+#
+#   python -m benchmarks.predict --model model.pkl --products 2000
+import argparse
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import forecast
+
+
+def per_call(model, product_ids, months, weeks):
+    # What /predict_demand did for every request: one-row DataFrame + predict
+    names = forecast.feature_names(model)
+    out = []
+    for product_id, month, week in zip(product_ids.tolist(), months.tolist(), weeks.tolist()):
+        row = {"product_id": product_id, "month": month, "week": week,
+               "season_encoded": int(forecast.SEASON_BY_MONTH[month])}
+        row.update({name: 0 for name in forecast.LAG_FEATURES})
+        df = pd.DataFrame([{name: row[name] for name in names}])
+        out.append(model.predict(df)[0])
+    return np.asarray(out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="model.pkl")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--weeks-ahead", type=int, default=1)
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    product_ids, months, weeks = forecast.parse_batch_request({
+        "product_ids": list(range(1, args.products + 1)), "weeks_ahead": args.weeks_ahead
+    })
+    n = len(product_ids)
+
+    start = time.perf_counter()
+    slow = per_call(model, product_ids, months, weeks)
+    per_call_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast = forecast.predict_batch(model, product_ids, months, weeks)
+    batch_s = time.perf_counter() - start
+
+    print(f"predictions:   {n}")
+    print(f"per-call:      {per_call_s:.3f}s ({n / per_call_s:,.0f}/s)")
+    print(f"batched:       {batch_s:.4f}s ({n / batch_s:,.0f}/s)")
+    print(f"speed-up:      {per_call_s / batch_s:,.1f}x")
+    print(f"max abs diff:  {np.abs(slow - fast).max():.6f}")
+
+
+if __name__ == "__main__":
+    main()
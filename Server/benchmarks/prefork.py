@@ -0,0 +1,143 @@
+# Throughput and memory of the pre-fork deployment by worker count.
+#
+#   python -m benchmarks.prefork --workers 1 2 4 --seconds 10
+#
+# Starts gunicorn with gunicorn.conf.py against a seeded SQLite stand-in,
+# once with the app preloaded in the master and once with each worker
+# importing and warming its own copy (PRELOAD=0). For each run it waits
+# until every worker has answered a forecast, drives a read mix (listings,
+# stock, forecasts, analytics) from --clients threads, then reads the PSS of
+# the master and workers from /proc (prefork.deployment_memory).
+import argparse
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import prefork
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get(url, timeout=30):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        response.read()
+        return response.status
+
+
+def paths(product_ids, rng):
+    pid = rng.choice(product_ids)
+    return rng.choice([
+        "/products?limit=50",
+        f"/stock?product_ids={pid}",
+        f"/inventory/{pid}",
+        f"/predict_demand?product_id={pid}&month={rng.randint(1, 12)}&week={rng.randint(1, 52)}",
+        "/analytics",
+    ])
+
+
+def wait_ready(base, workers, timeout):
+    # Each worker's pid shows up on /admin/memory once it answers with a forecast
+    seen = set()
+    deadline = time.monotonic() + timeout
+    while len(seen) < workers and time.monotonic() < deadline:
+        try:
+            _get(base + "/predict_demand?product_id=1&month=1&week=1")
+            with urllib.request.urlopen(base + "/admin/memory", timeout=5) as response:
+                seen.add(json.load(response)["pid"])
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.05)
+    return len(seen) >= workers
+
+
+def drive(base, product_ids, clients, seconds):
+    counts = [0] * clients
+    errors = [0] * clients
+    stop = time.monotonic() + seconds
+
+    def run(i):
+        rng = random.Random(i)
+        while time.monotonic() < stop:
+            try:
+                _get(base + paths(product_ids, rng))
+                counts[i] += 1
+            except (urllib.error.URLError, ConnectionError):
+                errors[i] += 1
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {"requests": sum(counts), "rps": round(sum(counts) / seconds, 1), "errors": sum(errors)}
+
+
+def run(env, workers, preload, product_ids, args):
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"], cwd=SERVER_DIR,
+        env={**env, "BIND": f"127.0.0.1:{port}", "WEB_CONCURRENCY": str(workers), "PRELOAD": "1" if preload else "0"},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        started = time.monotonic()
+        if not wait_ready(base, workers, args.timeout):
+            return {"error": "workers not ready"}
+        ready = time.monotonic() - started
+        load = drive(base, product_ids, args.clients, args.seconds)
+        memory = prefork.deployment_memory(process.pid)
+        return {
+            "ready_seconds": round(ready, 2),
+            **load,
+            "total_pss_mb": memory["total_pss_mb"],
+            "total_rss_mb": memory["total_rss_mb"],
+            "master_pss_mb": memory["processes"][0]["pss_mb"],
+            "worker_private_mb": [p["private_mb"] for p in memory["processes"][1:]],
+        }
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", default=os.path.join(SERVER_DIR, "sales_data.csv"))
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    from benchmarks.seed import seed
+    db_path = os.path.join(tempfile.mkdtemp(prefix="prefork-"), "bench.sqlite3")
+    seed(db_path, args.csv)
+    with sqlite3.connect(db_path) as conn:
+        product_ids = [pid for (pid,) in conn.execute("SELECT id FROM products")]
+    env = {**os.environ, "DB_BACKEND": "sqlite", "SQLITE_PATH": db_path, "PYTHONWARNINGS": "ignore",
+           "WORKER_THREADS": "4"}
+
+    report = {"cpus": os.cpu_count(), "clients": args.clients, "seconds": args.seconds, "runs": []}
+    for workers in args.workers:
+        for preload in (True, False):
+            result = run(env, workers, preload, product_ids, args)
+            report["runs"].append({"workers": workers, "preload": preload, **result})
+            print(json.dumps(report["runs"][-1]), file=sys.stderr)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
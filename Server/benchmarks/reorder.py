@@ -0,0 +1,89 @@
+# Reorder planning over a synthetic catalogue on the SQLite stand-in.
+#
+#   python -m benchmarks.reorder --products 5000 --batches 12 --weeks 8
+#
+# Times the forecast lookup cold (the cache predicts every product's grid)
+# and warm, and the full plan() with a warm cache: load, forecast and the
+# vectorised planning pass.
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+import forecast
+import reorder
+import sqlite_backend
+from model_registry import registry
+
+
+def build(path, products, batches, seed=11):
+    rng = np.random.default_rng(seed)
+    today = date.today()
+    sqlite_backend.create_schema(path)
+    conn = sqlite3.connect(path)
+    try:
+        conn.executemany("INSERT INTO categories (id, name) VALUES (?, ?)", [(i, f"Category {i}") for i in range(1, 21)])
+        conn.executemany("INSERT INTO products (id, name, category_id, price, inventory) VALUES (?, ?, ?, 10, 0)",
+                         [(pid, f"Product {pid}", pid % 20 + 1) for pid in range(1, products + 1)])
+        n = products * batches
+        product_ids = np.repeat(np.arange(1, products + 1), batches)
+        ordered = rng.integers(-120, 0, n)
+        delivered = ordered + rng.integers(2, 15, n)
+        expiry = delivered + rng.integers(5, 90, n)
+        # Older batches are mostly sold out, as in a live shop
+        quantity = np.where(expiry < 0, 0, rng.integers(0, 60, n))
+        day = lambda offset: (today + timedelta(days=int(offset))).isoformat()
+        conn.executemany("""
+            INSERT INTO product_inventory_batches
+                (product_id, quantity, expiry_date, supplier_name, order_date, delivery_date)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(int(p), int(q), day(e), f"Supplier {int(p) % 40 + 1}", day(o), day(d))
+              for p, q, e, o, d in zip(product_ids, quantity, expiry, ordered, delivered)])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--batches", type=int, default=12, help="batches per product, live and sold out")
+    parser.add_argument("--weeks", type=int, default=8)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="smartretail-reorder-"), "reorder.sqlite3")
+    build(path, args.products, args.batches)
+    cache = forecast.ForecastCache(registry.get(), max_products=args.products)
+    product_ids = np.arange(1, args.products + 1, dtype=np.int64)
+
+    timings = {}
+    for label in ("forecast_cold_s", "forecast_warm_s"):
+        start = time.perf_counter()
+        reorder.forecast_demand(cache, product_ids, args.weeks, date.today())
+        timings[label] = round(time.perf_counter() - start, 3)
+
+    conn = sqlite_backend.connect(path)
+    try:
+        start = time.perf_counter()
+        columns = reorder.load(conn)
+        timings["load_s"] = round(time.perf_counter() - start, 3)
+        demand = reorder.forecast_demand(cache, columns["product_ids"], args.weeks, date.today())
+        start = time.perf_counter()
+        reorder.compute(columns, demand, date.today())
+        timings["compute_s"] = round(time.perf_counter() - start, 3)
+        start = time.perf_counter()
+        result = reorder.plan(cache, conn, args.weeks)
+        timings["plan_s"] = round(time.perf_counter() - start, 3)
+    finally:
+        conn.close()
+    print(json.dumps({"products": args.products, "batches": args.products * args.batches, "weeks": args.weeks,
+                      "ordering": result["ordering"], **timings}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
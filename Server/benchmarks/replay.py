@@ -0,0 +1,241 @@
+# Replay sales_data.csv through the API against a seeded SQLite stand-in.
+#
+#   python -m benchmarks.replay --concurrency 8 --read-ratio 0.3
+#   python -m benchmarks.replay --speedup 86400 --limit 2000     # one day of sales per second
+#   python -m benchmarks.replay --ledger --out after.json --baseline before.json
+#
+# Sales lines sharing a user and day become one /create-invoice call, lone
+# lines a /sales/sell call. After each write a read (/analytics, /inventory
+# or /predict_demand) is mixed in with probability --read-ratio. Requests go
+# through Flask's test client in worker threads, so latency is server time
+# and every statement the app sends to the database is counted per route.
+import argparse
+import json
+import os
+import platform
+import queue
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from itertools import groupby
+
+import numpy as np
+
+READS = (("/analytics", 1), ("/inventory", 1), ("/predict_demand", 2))
+
+
+def build_events(lines, read_ratio, seed=7):
+    """(offset_seconds, route, method, path, body) in replay order."""
+    rng = random.Random(seed)
+    first_day = lines[0]["sale_date"]
+    reads, weights = zip(*READS)
+    events = []
+    for day, day_lines in groupby(lines, key=lambda r: r["sale_date"]):
+        invoices = []
+        for user_id, user_lines in groupby(sorted(day_lines, key=lambda r: r["user_id"]), key=lambda r: r["user_id"]):
+            invoices.append((user_id, list(user_lines)))
+        for i, (user_id, user_lines) in enumerate(invoices):
+            # Spread a day's invoices evenly over the day
+            offset = ((day - first_day).days + i / len(invoices)) * 86400
+            if len(user_lines) == 1:
+                line = user_lines[0]
+                events.append((offset, "/sales/sell", "POST", "/sales/sell",
+                               {"user_id": user_id, "product_id": line["product_id"], "quantity": line["quantity"]}))
+            else:
+                events.append((offset, "/create-invoice", "POST", "/create-invoice", {
+                    "user_id": user_id,
+                    "items": [{"product_id": r["product_id"], "quantity": r["quantity"]} for r in user_lines],
+                }))
+            if rng.random() < read_ratio:
+                route = rng.choices(reads, weights)[0]
+                path = route
+                if route == "/predict_demand":
+                    line = rng.choice(user_lines)
+                    path = (f"/predict_demand?product_id={line['product_id']}&month={day.month}"
+                            f"&week={day.isocalendar()[1]}")
+                events.append((offset, route, "GET", path, None))
+    return events
+
+
+class StatementCounter:
+    """Attributes every statement the stand-in executes to the calling thread's route."""
+
+    def __init__(self):
+        self.local = threading.local()
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def __call__(self, sql, many):
+        route = getattr(self.local, "route", None) or "background"
+        with self.lock:
+            self.counts[route] += 1
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ms = np.asarray(samples) * 1000
+    return {f"p{p}_ms": round(float(np.percentile(ms, p)), 3) for p in (50, 95, 99)} | \
+        {"max_ms": round(float(ms.max()), 3)}
+
+
+def git_revision():
+    try:
+        sha = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True).stdout.strip())
+        return {"sha": sha, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"sha": None, "dirty": None}
+
+
+def compare(report, baseline, tolerance):
+    rows = {}
+    for route, now in report["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if not before or not before.get("p95_ms") or not now.get("p95_ms"):
+            continue
+        p95_ratio = now["p95_ms"] / before["p95_ms"]
+        rps_ratio = now["rps"] / before["rps"] if before.get("rps") else None
+        rows[route] = {"p95_ratio": round(p95_ratio, 3), "rps_ratio": round(rps_ratio, 3) if rps_ratio else None,
+                       "db_statements_delta": round(now["db_statements_per_request"]
+                                                    - before.get("db_statements_per_request", 0), 2),
+                       "regressed": p95_ratio > 1 + tolerance}
+    return {"baseline_sha": baseline.get("git", {}).get("sha"), "tolerance": tolerance, "routes": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", default="sales_data.csv")
+    parser.add_argument("--db", help="SQLite file to seed (default: a temporary file)")
+    parser.add_argument("--history", type=float, default=0.5, help="fraction of sales seeded as history")
+    parser.add_argument("--limit", type=int, help="replay at most this many sales lines")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--speedup", type=float, default=0,
+                        help="replay at this multiple of real time (0 = as fast as possible)")
+    parser.add_argument("--read-ratio", type=float, default=0.3)
+    parser.add_argument("--ledger", action="store_true", help="serve stock from the in-memory ledger")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="p95 slowdown counted as a regression")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="smartretail-replay-")
+    db_path = args.db or os.path.join(workdir, "replay.sqlite3")
+    # Configure before the app (and db.py) are imported
+    os.environ["DB_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = db_path
+    os.environ["STOCK_JOURNAL"] = os.path.join(workdir, "stock.journal")
+    os.environ["STOCK_LEDGER"] = "1" if args.ledger else ""
+
+    from benchmarks.seed import seed
+    lines, seeded = seed(db_path, args.csv, history=args.history)
+    if args.limit:
+        lines = lines[:args.limit]
+    events = build_events(lines, args.read_ratio)
+
+    import sqlite_backend
+    counter = StatementCounter()
+    sqlite_backend.statement_listeners.append(counter)
+
+    import app as server
+    from db import db_connection
+    from ledger import get_ledger, reconcile
+    server.app.logger.setLevel("WARNING")
+    # Load the ledger and models before the clock starts, so one-off loads
+    # don't land in the percentiles
+    get_ledger()
+    warm = server.app.test_client()
+    for route in {e[1]: e[3] for e in events if e[2] == "GET"}.values():
+        warm.get(route).close()
+    counter.counts.clear()
+
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    work = queue.Queue()
+    for event in events:
+        work.put(event)
+
+    def worker():
+        client = server.app.test_client()
+        while True:
+            try:
+                offset, route, method, path, body = work.get_nowait()
+            except queue.Empty:
+                return
+            if args.speedup:
+                delay = started + offset / args.speedup - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            counter.local.route = route
+            start = time.perf_counter()
+            response = client.open(path, method=method, json=body)
+            response.get_data()
+            response.close()
+            elapsed = time.perf_counter() - start
+            counter.local.route = None
+            latencies[route].append(elapsed)
+            statuses[route][response.status_code] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    stock = get_ledger()
+    if stock is not None:
+        stock.drain()
+    with db_connection() as conn:
+        drift = reconcile(conn)["drifted"]
+
+    routes = {}
+    for route in sorted(latencies):
+        n = len(latencies[route])
+        routes[route] = {
+            "requests": n,
+            "rps": round(n / wall, 1),
+            **percentiles(latencies[route]),
+            "errors": sum(c for s, c in statuses[route].items() if s >= 500),
+            "statuses": {str(s): c for s, c in sorted(statuses[route].items())},
+            "db_statements_per_request": round(counter.counts[route] / n, 2),
+        }
+    total = sum(len(v) for v in latencies.values())
+    report = {
+        "benchmark": "replay",
+        "git": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "seed": seeded,
+        "wall_s": round(wall, 3),
+        "requests": total,
+        "rps": round(total / wall, 1),
+        "background_db_statements": counter.counts["background"],
+        "stock_drift_products": drift,
+        "routes": routes,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report, json.load(f), args.tolerance)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    if stock is not None:
+        stock.close()
+    if report.get("comparison") and any(r["regressed"] for r in report["comparison"]["routes"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
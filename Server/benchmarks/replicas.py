@@ -0,0 +1,203 @@
+# Read routing against a primary and a lagging replica (two SQLite files).
+#
+#   python -m benchmarks.replicas --delay 0.5 --reads 2000
+#
+# The replica is refreshed from the primary with SQLite's backup API every
+# --delay seconds, standing in for asynchronous replication. Three phases:
+#   steady           readers and writers in parallel; share of reads the replica served
+#   read-your-writes each POST /inventory is read straight back by the same
+#                    session (must see it) and by a fresh one (may not)
+#   replica stalled  replication stops; reads move to the primary once the
+#                    replica is REPLICA_MAX_LAG behind
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+
+class Replicator:
+    def __init__(self, primary, replica, delay):
+        self.primary = primary
+        self.replica = replica
+        self.delay = delay
+        self.paused = threading.Event()
+        self._stop = threading.Event()
+        self.copies = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def copy(self):
+        source = sqlite3.connect(self.primary)
+        target = sqlite3.connect(self.replica, timeout=30)
+        try:
+            source.backup(target)
+            self.copies += 1
+        finally:
+            target.close()
+            source.close()
+
+    def _run(self):
+        while not self._stop.wait(self.delay):
+            if not self.paused.is_set():
+                self.copy()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def read_paths(product_ids, rng):
+    pid = rng.choice(product_ids)
+    end = date.today()
+    return rng.choice([
+        "/inventory?limit=50",
+        "/products?limit=50",
+        f"/inventory/{pid}",
+        f"/stock?product_ids={pid}",
+        f"/sales/timeseries?start={end - timedelta(days=90)}&end={end}&granularity=week",
+    ])
+
+
+def served(replicas):
+    stats = replicas.stats()
+    return stats["primary_reads"], sum(r["reads"] for r in stats["replicas"])
+
+
+def steady(app, replicas, product_ids, reads, writers, readers):
+    primary_before, replica_before = served(replicas)
+    done = threading.Event()
+    errors = []
+
+    def read_loop(n, seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        for _ in range(n):
+            response = client.get(read_paths(product_ids, rng))
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+    def write_loop(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        while not done.is_set():
+            client.post("/sales/sell", json={"user_id": 1, "product_id": rng.choice(product_ids), "quantity": 1})
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=write_loop, args=(i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    start = time.perf_counter()
+    read_threads = [threading.Thread(target=read_loop, args=(reads // readers, 100 + i)) for i in range(readers)]
+    for t in read_threads:
+        t.start()
+    for t in read_threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for t in threads:
+        t.join()
+    primary_after, replica_after = served(replicas)
+    on_primary, on_replica = primary_after - primary_before, replica_after - replica_before
+    return {
+        "reads": reads,
+        "rps": round(reads / elapsed, 1),
+        "connections_on_replica": on_replica,
+        "connections_on_primary": on_primary,
+        "replica_share": round(on_replica / max(on_primary + on_replica, 1), 3),
+        "errors": len(errors),
+    }
+
+
+def read_your_writes(app, product_ids, trials):
+    writer = app.test_client()
+    own_missed = other_missed = 0
+    for i in range(trials):
+        pid = product_ids[i % len(product_ids)]
+        supplier = f"rw-check-{i}"
+        today = date.today()
+        writer.post("/inventory", json={
+            "product_id": pid, "quantity": 1, "supplier_name": supplier,
+            "expiry_date": str(today + timedelta(days=30)), "order_date": str(today), "delivery_date": str(today),
+        })
+        own = writer.get(f"/inventory/{pid}").get_json()
+        other = app.test_client().get(f"/inventory/{pid}").get_json()
+        own_missed += not any(b["supplier_name"] == supplier for b in own)
+        other_missed += not any(b["supplier_name"] == supplier for b in other)
+    return {"trials": trials, "own_session_missed": own_missed, "other_session_missed": other_missed}
+
+
+def stalled(app, replicas, replicator, product_ids, max_lag):
+    replicator.paused.set()
+    client = app.test_client()
+    rng = random.Random(5)
+    timeline = []
+    start = time.monotonic()
+    while time.monotonic() - start < max_lag + 2:
+        primary_before, replica_before = served(replicas)
+        for _ in range(20):
+            client.get(read_paths(product_ids, rng))
+        primary_after, replica_after = served(replicas)
+        lag = replicas.stats()["replicas"][0]["lag_seconds"]
+        timeline.append({"t": round(time.monotonic() - start, 2), "lag_seconds": lag,
+                         "on_replica": replica_after - replica_before, "on_primary": primary_after - primary_before})
+        time.sleep(0.5)
+    replicator.paused.clear()
+    return timeline
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", default="sales_data.csv")
+    parser.add_argument("--delay", type=float, default=0.5, help="seconds between replica refreshes")
+    parser.add_argument("--max-lag", type=float, default=3)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=1)
+    parser.add_argument("--trials", type=int, default=50, help="read-your-writes round trips")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="replicas-")
+    primary = os.path.join(workdir, "primary.sqlite3")
+    replica = os.path.join(workdir, "replica.sqlite3")
+    os.environ.update({
+        "DB_BACKEND": "sqlite", "SQLITE_PATH": primary, "SQLITE_REPLICAS": replica,
+        "REPLICA_MAX_LAG": str(args.max_lag), "REPLICA_HEARTBEAT": str(min(args.delay, 1.0) / 2),
+        "REPLICA_RETRY_SECONDS": "1",
+    })
+
+    from benchmarks.seed import seed
+    seed(primary, args.csv)
+    replicator = Replicator(primary, replica, args.delay)
+    replicator.copy()
+
+    import app as flask_app
+    from replicas import replicas
+
+    with sqlite3.connect(primary) as conn:
+        product_ids = [pid for (pid,) in conn.execute("SELECT id FROM products")]
+    replicator.start()
+    # Let the heartbeat reach the replica once
+    replicas.choose(0.0)
+    time.sleep(args.delay * 2 + 0.5)
+
+    report = {
+        "delay_seconds": args.delay,
+        "max_lag_seconds": args.max_lag,
+        "steady": steady(flask_app.app, replicas, product_ids, args.reads, args.writers, args.readers),
+        "read_your_writes": read_your_writes(flask_app.app, product_ids, args.trials),
+        "replica_stalled": stalled(flask_app.app, replicas, replicator, product_ids, args.max_lag),
+        "replication_copies": replicator.copies,
+    }
+    replicator.stop()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# Seed a SQLite stand-in database from sales_data.csv.
+#
+#   python -m benchmarks.seed --db bench.sqlite3 --history 0.5
+#
+# The first ``history`` fraction of the sales (by date) is inserted as past
+# sales; batches are stocked with enough headroom to sell the rest, which
+# benchmarks.replay sends through the API.
+import argparse
+import csv
+import json
+import math
+import os
+import sqlite3
+from collections import defaultdict
+from contextlib import closing
+from datetime import date, timedelta
+
+import rollups
+import sqlite_backend
+
+
+def read_sales(path="sales_data.csv"):
+    with open(path, newline="") as f:
+        rows = [
+            {"user_id": int(r["user_id"]), "product_id": int(r["product_id"]), "category": r["category"],
+             "quantity": int(r["quantity"]), "sale_date": date.fromisoformat(r["sale_date"]),
+             "batch_id": int(r["batch_id"])}
+            for r in csv.DictReader(f)
+        ]
+    # Stable, so lines within a day keep their file order
+    rows.sort(key=lambda r: r["sale_date"])
+    return rows
+
+
+def seed(path, csv_path="sales_data.csv", history=0.5, headroom=1.2):
+    """Create ``path`` and return the sales lines left for replay."""
+    if os.path.exists(path):
+        os.remove(path)
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    sqlite_backend.create_schema(path)
+
+    rows = read_sales(csv_path)
+    split = int(len(rows) * history)
+    past, replay = rows[:split], rows[split:]
+
+    categories = sorted({r["category"] for r in rows})
+    category_ids = {name: i for i, name in enumerate(categories, start=1)}
+    products = sorted({(r["product_id"], r["category"]) for r in rows})
+
+    # One stocked batch per (product, CSV batch) pair, sized for the replay
+    needed = defaultdict(int)
+    for r in replay:
+        needed[r["product_id"], r["batch_id"]] += r["quantity"]
+    pairs = sorted({(r["product_id"], r["batch_id"]) for r in rows})
+    today = date.today()
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.executemany("INSERT INTO categories (id, name) VALUES (?, ?)",
+                         [(i, name) for name, i in category_ids.items()])
+        conn.executemany("INSERT INTO products (id, name, category_id, price, inventory) VALUES (?, ?, ?, ?, 0)",
+                         [(pid, category, category_ids[category], 20 + 10 * pid) for pid, category in products])
+        batch_ids = {}
+        for pid, csv_batch in pairs:
+            cursor = conn.execute("""
+                INSERT INTO product_inventory_batches
+                    (product_id, quantity, expiry_date, supplier_name, order_date, delivery_date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (pid, math.ceil(needed[pid, csv_batch] * headroom),
+                  (today + timedelta(days=1 + (csv_batch * 7 + pid) % 180)).isoformat(),
+                  f"Supplier {csv_batch % 12 + 1}", (today - timedelta(days=30)).isoformat(),
+                  (today - timedelta(days=25)).isoformat()))
+            batch_ids[pid, csv_batch] = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO sales (user_id, product_id, quantity, sale_date, batch_id) VALUES (?, ?, ?, ?, ?)",
+            [(r["user_id"], r["product_id"], r["quantity"], r["sale_date"].isoformat(),
+              batch_ids[r["product_id"], r["batch_id"]]) for r in past])
+        conn.execute("""
+            UPDATE products SET inventory = COALESCE(
+                (SELECT SUM(quantity) FROM product_inventory_batches WHERE product_id = products.id), 0)
+        """)
+        conn.commit()
+        with closing(sqlite_backend.connect(path)) as rollup_conn:
+            rollups.backfill(rollup_conn)
+        # Planner statistics, as a long-running database would have
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return replay, {"products": len(products), "batches": len(pairs), "history_sales": len(past),
+                    "replay_lines": len(replay)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="bench.sqlite3")
+    parser.add_argument("--csv", default="sales_data.csv")
+    parser.add_argument("--history", type=float, default=0.5, help="fraction of sales inserted as history")
+    args = parser.parse_args()
+    _, summary = seed(args.db, args.csv, history=args.history)
+    print(json.dumps({"db": args.db, **summary}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# Time from process start to the first served request.
+#
+#   python -m benchmarks.startup --runs 5
+#   python -m benchmarks.startup --server-dir /path/to/other/checkout/Server   # compare a tree
+#
+# Each run starts the app in a fresh interpreter behind werkzeug's server
+# against a seeded SQLite stand-in and polls it, recording when the first
+# /products page and the first /predict_demand answer come back (the
+# latter needs the model, loaded by the warm-up or on first use). A
+# separate probe imports the app with WARM_UP=0 and lists the heavy
+# modules the import alone pulled in.
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("numpy", "pandas", "sklearn", "scipy", "joblib", "pyarrow")
+
+SERVE = """
+import app
+from werkzeug.serving import make_server
+make_server("127.0.0.1", {port}, app.app, threaded=True).serve_forever()
+"""
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+print(json.dumps({{"import_seconds": time.perf_counter() - start,
+                  "heavy_modules": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url, started, timeout):
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.005)
+    return None
+
+
+def serve_once(server_dir, env, timeout):
+    port = _free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", SERVE.format(port=port)], cwd=server_dir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f"http://127.0.0.1:{port}"
+        first = _wait_for(base + "/products?limit=1", started, timeout)
+        forecast = _wait_for(base + "/predict_demand?product_id=1&month=1&week=1", started, timeout)
+        return first, forecast
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def probe(server_dir, env):
+    out = subprocess.run([sys.executable, "-c", PROBE.format(heavy=HEAVY)], cwd=server_dir,
+                         env={**env, "WARM_UP": "0"}, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _summary(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    return {"median_ms": round(statistics.median(values) * 1000, 1), "max_ms": round(max(values) * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server-dir", default=SERVER_DIR)
+    parser.add_argument("--csv", default=os.path.join(SERVER_DIR, "sales_data.csv"))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--out", help="write the JSON report here")
+    args = parser.parse_args()
+
+    from benchmarks.seed import seed
+    workdir = tempfile.mkdtemp(prefix="startup-")
+    db_path = os.path.join(workdir, "bench.sqlite3")
+    seed(db_path, args.csv)
+    env = {**os.environ, "DB_BACKEND": "sqlite", "SQLITE_PATH": db_path, "PYTHONWARNINGS": "ignore"}
+
+    report = {"server_dir": args.server_dir, "import": probe(args.server_dir, env)}
+    for label, warm in (("warm_up", "1"), ("no_warm_up", "0")):
+        runs = [serve_once(args.server_dir, {**env, "WARM_UP": warm}, args.timeout) for _ in range(args.runs)]
+        report[label] = {
+            "first_request": _summary([first for first, _ in runs]),
+            "first_forecast": _summary([forecast for _, forecast in runs]),
+        }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# Legacy train_model.py vs the chunked, parallel pipeline on a synthetic history.
+#
+#   python -m benchmarks.training --rows 10000000 --products 2000
+#
+# Each variant runs in its own subprocess so wall time and peak RSS are
+# measured independently.
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+CATEGORIES = np.array(["Soup", "Shampoo", "Cold Drink", "Milk", "Rice", "Flour", "Heater", "Ice Cream",
+                       "Mango Juice", "Biscuits"])
+
+
+def generate(path, rows, products, days=730, chunk=1_000_000, seed=7):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2023-01-01")
+    product_category = CATEGORIES[rng.integers(0, len(CATEGORIES), products + 1)]
+    # Seasonal swing so the models have something to learn
+    seasonal = 1 + 0.5 * np.sin(np.arange(days) / 365 * 2 * np.pi)
+    day_weights = seasonal / seasonal.sum()
+    written = 0
+    with open(path, "w") as f:
+        f.write("user_id,product_id,category,quantity,sale_date,batch_id\n")
+        while written < rows:
+            n = min(chunk, rows - written)
+            product_ids = rng.integers(1, products + 1, n)
+            frame = pd.DataFrame({
+                "user_id": rng.integers(1, 500, n),
+                "product_id": product_ids,
+                "category": product_category[product_ids],
+                "quantity": rng.poisson(3, n) + 1,
+                "sale_date": (start + np.sort(rng.choice(days, n, p=day_weights))).astype("datetime64[D]"),
+                "batch_id": rng.integers(1, 5000, n),
+            })
+            frame.to_csv(f, header=False, index=False)
+            written += n
+    return path
+
+
+def legacy(path):
+    # The original train_model.py, kept verbatim in behaviour for comparison
+    from sklearn.linear_model import LinearRegression
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+
+    training_data = pd.read_csv(path)
+    training_data['sale_date'] = pd.to_datetime(training_data['sale_date'])
+    training_data['month'] = training_data['sale_date'].dt.month
+    training_data['week'] = training_data['sale_date'].dt.isocalendar().week
+
+    def get_season(month):
+        if month in [12, 1, 2]:
+            return 'winter'
+        elif month in [3, 4, 5]:
+            return 'spring'
+        elif month in [6, 7, 8]:
+            return 'summer'
+        else:
+            return 'autumn'
+
+    training_data['season_encoded'] = training_data['month'].apply(lambda x: get_season(x))
+    season_map = {"winter": 0, "spring": 1, "summer": 2, "autumn": 3}
+    training_data['season_encoded'] = training_data['season_encoded'].map(season_map)
+    features = training_data[['month', 'week', 'season_encoded']]
+    target = training_data['quantity']
+    X_train, X_test, y_train, y_test = train_test_split(features, target, test_size=0.2, random_state=42)
+    scaler = StandardScaler()
+    model = LinearRegression()
+    model.fit(scaler.fit_transform(X_train), y_train)
+    return {}
+
+
+def pipeline(path, workers, out_dir):
+    import training
+    return training.run(path, workers=workers, out_dir=out_dir)
+
+
+def child(args):
+    start = time.perf_counter()
+    if args.variant == "legacy":
+        extra = legacy(args.data)
+    else:
+        extra = pipeline(args.data, args.workers, args.out)
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    print(json.dumps({
+        "variant": args.variant,
+        "wall_s": round(time.perf_counter() - start, 2),
+        "peak_rss_mb": round(max(own, children) / 1024, 1),
+        **{k: v for k, v in extra.items() if k.endswith("_s") or k == "groups"},
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--data", default="synthetic_sales.csv")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default="bench_models")
+    parser.add_argument("--variant", choices=["legacy", "pipeline"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        child(args)
+        return
+
+    if not os.path.exists(args.data):
+        start = time.perf_counter()
+        generate(args.data, args.rows, args.products)
+        print(f"generated {args.rows:,} rows in {time.perf_counter() - start:.1f}s -> {args.data}")
+
+    results = []
+    for variant in ("legacy", "pipeline"):
+        cmd = [sys.executable, "-m", "benchmarks.training", "--variant", variant,
+               "--data", args.data, "--out", args.out]
+        if args.workers:
+            cmd += ["--workers", str(args.workers)]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+        print(results[-1])
+    print(json.dumps({"rows": args.rows, "products": args.products, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+# Live stock change feed: compact deltas with sequence numbers, over SSE
+#
+#   GET /changes             text/event-stream; resumes from Last-Event-ID
+#
+# Every committed stock change (POST /inventory, /inventory/reduce,
+# /inventory/upload_csv, /sales/sell, /create-invoice, DELETE /products/<id>)
+# is published from the write signals as an event:
+#
+#   id: 5f3a91c0-1042
+#   data: {"type":"inventory","changes":[{"op":"update","product_id":3,"batch_id":17,"delta":-2,"quantity":40}]}
+#
+# "quantity" is the batch's quantity after the change, so applying an event
+# twice is harmless. "add" changes carry the batch's columns as /inventory
+# renders them; changes without a batch id (CSV ingestion) collapse into one
+# {"type":"inventory","refetch":true}. Products come as {"type":"catalogue",
+# "product_id":3,"action":"deleted"}.
+#
+# Events are kept in a ring of CHANGEFEED_SLOTS fixed-size slots in an
+# anonymous shared mapping, like versions.py, so workers forked from one
+# parent publish into and read from the same sequence. The id is the feed's
+# epoch (new each start) and the sequence number. A subscriber resuming
+# with an id still in the ring gets every event after it; otherwise (and on
+# a first connect) it gets a "reset" event first and should load its
+# snapshot then, applying the events that follow on top.
+#
+# Each process has one watcher thread polling the ring's head every
+# CHANGEFEED_POLL seconds for its siblings' events; a publish or a moved
+# head wakes all of the process's subscribers at once, and each event is
+# encoded once, when published. The async route in asgi.py holds hundreds
+# of subscribers on one event loop. The Flask route holds a thread for each,
+# so under gunicorn serve the feed with WORKER_CLASS=uvicorn.workers.UvicornWorker
+# and asgi:app.
+import asyncio
+import logging
+import mmap
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from datetime import date
+
+from http_cache import dumps
+from signals import catalogue_changed, inventory_changed
+
+log = logging.getLogger("smartretail")
+
+CHANGEFEED_SLOTS = int(os.environ.get("CHANGEFEED_SLOTS", 4096))
+CHANGEFEED_SLOT_BYTES = int(os.environ.get("CHANGEFEED_SLOT_BYTES", 1024))
+CHANGEFEED_POLL = float(os.environ.get("CHANGEFEED_POLL", 0.05))
+# A comment line this often keeps idle streams open through proxies
+CHANGEFEED_KEEPALIVE = float(os.environ.get("CHANGEFEED_KEEPALIVE", 15))
+# Reconnect delay suggested to EventSource, in ms
+CHANGEFEED_RETRY_MS = int(os.environ.get("CHANGEFEED_RETRY_MS", 2000))
+# Events written per wake-up, so one subscriber far behind can't hog a thread
+CHANGEFEED_BATCH = 256
+
+_HEAD = struct.Struct("<Q")
+_SLOT = struct.Struct("<QI")
+ADD_FIELDS = ("expiry_date", "supplier_name", "order_date", "delivery_date")
+KEEPALIVE = b": keepalive\n\n"
+
+
+def _day(value):
+    # The add route passes the request's ISO strings; /inventory renders dates
+    if isinstance(value, str):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+
+def compact(change):
+    event = {k: change[k] for k in ("op", "product_id", "batch_id", "delta") if k in change}
+    if change.get("quantity") is not None:
+        event["quantity"] = change["quantity"]
+    if change.get("op") == "add":
+        event.update((k, _day(change[k])) for k in ADD_FIELDS if k in change)
+    return event
+
+
+class ChangeFeed:
+    def __init__(self, slots=CHANGEFEED_SLOTS, slot_bytes=CHANGEFEED_SLOT_BYTES, poll=CHANGEFEED_POLL):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.poll = poll
+        self.epoch = os.urandom(4).hex()
+        self._ring = mmap.mmap(-1, _HEAD.size + slots * slot_bytes)
+        # Inherited by forked workers, so it orders every process's publishes
+        self._publish_lock = multiprocessing.Lock()
+        self.after_fork()
+
+    def after_fork(self):
+        # Threads and their locks stay with the parent; the ring is shared
+        self._lock = threading.Lock()
+        self._wake = threading.Condition()
+        self._watchers = []
+        self._thread = None
+        self._seen = self.head()
+        self.subscribers = 0
+        self.published = 0
+        self.resets = 0
+
+    def head(self):
+        return _HEAD.unpack_from(self._ring)[0]
+
+    def _offset(self, seq):
+        return _HEAD.size + (seq - 1) % self.slots * self.slot_bytes
+
+    def publish(self, event):
+        data = dumps(event).encode("utf-8")
+        if _SLOT.size + len(data) > self.slot_bytes:
+            data = dumps({"type": event["type"], "refetch": True}).encode("utf-8")
+        with self._publish_lock:
+            seq = self.head() + 1
+            offset = self._offset(seq)
+            # Zeroed first, so a reader copying the old event sees it go
+            _SLOT.pack_into(self._ring, offset, 0, 0)
+            start = offset + _SLOT.size
+            self._ring[start:start + len(data)] = data
+            _SLOT.pack_into(self._ring, offset, seq, len(data))
+            _HEAD.pack_into(self._ring, 0, seq)
+        self.published += 1
+        self._notify()
+        return seq
+
+    def publish_changes(self, kind, changes):
+        """Publish changes as few events as fit the slots."""
+        if not changes:
+            return
+        prefix = len(dumps({"type": kind, "changes": []}))
+        batch, size = [], prefix
+        for change in changes:
+            length = len(dumps(change).encode("utf-8")) + 1
+            if batch and _SLOT.size + size + length > self.slot_bytes:
+                self.publish({"type": kind, "changes": batch})
+                batch, size = [], prefix
+            batch.append(change)
+            size += length
+        self.publish({"type": kind, "changes": batch})
+
+    def read(self, after, limit=CHANGEFEED_BATCH):
+        """Up to ``limit`` (seq, data) after ``after``, and False if some were already overwritten."""
+        head = self.head()
+        if after > head or head - after > self.slots:
+            return [], False
+        events = []
+        for seq in range(after + 1, min(head, after + limit) + 1):
+            offset = self._offset(seq)
+            stored, length = _SLOT.unpack_from(self._ring, offset)
+            start = offset + _SLOT.size
+            data = self._ring[start:start + length]
+            if stored != seq or _SLOT.unpack_from(self._ring, offset)[0] != seq:
+                return events, False
+            events.append((seq, data))
+        return events, True
+
+    def resume(self, last_event_id):
+        """Sequence to continue after, and why the subscriber must resync (None if it needn't)."""
+        head = self.head()
+        epoch, _, seq = (last_event_id or "").partition("-")
+        if not last_event_id:
+            return head, "new"
+        if epoch != self.epoch or not seq.isdigit():
+            return head, "restarted"
+        seq = int(seq)
+        if seq > head or head - seq > self.slots:
+            return head, "gap"
+        return seq, None
+
+    def frame(self, seq, data):
+        return b"id: %s-%d\ndata: %s\n\n" % (self.epoch.encode(), seq, data)
+
+    def reset_frame(self, seq, reason):
+        self.resets += 1
+        data = dumps({"type": "reset", "reason": reason}).encode("utf-8")
+        return b"event: reset\nid: %s-%d\ndata: %s\n\n" % (self.epoch.encode(), seq, data)
+
+    # Waking subscribers
+
+    def _notify(self):
+        with self._wake:
+            self._seen = max(self._seen, self.head())
+            self._wake.notify_all()
+        for callback in self._watchers:
+            callback()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="changefeed-watcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        # Siblings' publishes only show up as a moved head
+        while True:
+            time.sleep(self.poll)
+            if self.head() != self._seen:
+                self._notify()
+
+    def watch(self, callback):
+        """Run ``callback`` on a feed thread whenever new events may be readable."""
+        self._watchers.append(callback)
+        self._start()
+
+    def wait(self, after, timeout):
+        """Block until the feed moves past ``after``; False on timeout."""
+        self._start()
+        with self._wake:
+            return self._wake.wait_for(lambda: self.head() != after, timeout)
+
+    def subscribed(self, delta):
+        with self._lock:
+            self.subscribers += delta
+
+    def stats(self):
+        head = self.head()
+        return {
+            "epoch": self.epoch,
+            "head": head,
+            "retained": min(head, self.slots),
+            "slots": self.slots,
+            "slot_bytes": self.slot_bytes,
+            "subscribers": self.subscribers,
+            "published": self.published,
+            "resets": self.resets,
+        }
+
+
+class Subscription:
+    """One subscriber's position; frames() returns what it hasn't been sent yet."""
+
+    def __init__(self, feed, last_event_id=None):
+        self.feed = feed
+        self.after, reason = feed.resume(last_event_id)
+        self._pending = [b"retry: %d\n\n" % CHANGEFEED_RETRY_MS]
+        if reason:
+            self._pending.append(feed.reset_frame(self.after, reason))
+
+    def frames(self):
+        out, self._pending = self._pending, []
+        events, complete = self.feed.read(self.after)
+        out.extend(self.feed.frame(seq, data) for seq, data in events)
+        if events:
+            self.after = events[-1][0]
+        if not complete:
+            self.after = self.feed.head()
+            out.append(self.feed.reset_frame(self.after, "gap"))
+        return b"".join(out)
+
+    def stream(self, keepalive=CHANGEFEED_KEEPALIVE):
+        """Blocking generator for a WSGI response."""
+        self.feed.subscribed(1)
+        try:
+            while True:
+                chunk = self.frames()
+                if chunk:
+                    yield chunk
+                elif not self.feed.wait(self.after, keepalive):
+                    yield KEEPALIVE
+        finally:
+            self.feed.subscribed(-1)
+
+
+class AsyncWake:
+    """Wakes every subscriber on one event loop with one call per feed move."""
+
+    def __init__(self, feed):
+        self.feed = feed
+        self._loop = None
+        self._moved = None
+
+    def _fire(self):
+        moved, self._moved = self._moved, asyncio.Event()
+        moved.set()
+
+    async def wait(self, after, timeout):
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._moved = asyncio.Event()
+            self.feed.watch(lambda: self._loop.call_soon_threadsafe(self._fire))
+        moved = self._moved
+        if self.feed.head() != after:
+            return True
+        try:
+            await asyncio.wait_for(moved.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def stream(self, subscription, keepalive=CHANGEFEED_KEEPALIVE):
+        self.feed.subscribed(1)
+        try:
+            while True:
+                chunk = subscription.frames()
+                if chunk:
+                    yield chunk
+                elif not await self.wait(subscription.after, keepalive):
+                    yield KEEPALIVE
+        finally:
+            self.feed.subscribed(-1)
+
+
+feed = ChangeFeed()
+os.register_at_fork(after_in_child=feed.after_fork)
+
+
+def on_inventory_changed(sender, changes=(), **kwargs):
+    known = [compact(c) for c in changes if c.get("batch_id") is not None]
+    try:
+        if len(known) < len(changes):
+            feed.publish({"type": "inventory", "refetch": True})
+        feed.publish_changes("inventory", known)
+    except Exception:
+        log.exception("change feed publish failed")
+
+
+def on_catalogue_changed(sender, product_id=None, action=None, **kwargs):
+    try:
+        feed.publish({"type": "catalogue", "product_id": product_id, "action": action})
+    except Exception:
+        log.exception("change feed publish failed")
+
+
+inventory_changed.connect(on_inventory_changed)
+catalogue_changed.connect(on_catalogue_changed)
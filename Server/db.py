@@ -1,10 +1,249 @@
 # backend/db.py
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import mysql.connector
+from mysql.connector import errors
+
+import metrics
+
+db_config = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'user': os.environ.get('DB_USER', 'root'),
+    'password': os.environ.get('DB_PASSWORD', '12345678'),
+    'database': os.environ.get('DB_NAME', 'smartretail')
+}
+
+# Pool tuning, overridable per deployment
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', 4))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+POOL_RECYCLE = float(os.environ.get('DB_POOL_RECYCLE', 1800))
+# Connections idle for longer than this are pinged before being handed out
+POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', 30))
+
+
+# "sqlite" swaps MySQL for the local stand-in in sqlite_backend.py
+DB_BACKEND = os.environ.get('DB_BACKEND', 'mysql')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'smartretail.sqlite3')
+
 
 def get_db_connection():
-    return mysql.connector.connect(
-        host= 'localhost',
-        user='root',
-        password= '12345678',
-        database='smartretail'
-    )
+    if DB_BACKEND == 'sqlite':
+        import sqlite_backend
+        return metrics.instrument(sqlite_backend.connect(SQLITE_PATH))
+    return metrics.instrument(mysql.connector.connect(**db_config))
+
+
+class PoolTimeout(errors.PoolError):
+    pass
+
+
+class _Entry:
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = self.last_used = time.monotonic()
+
+
+def _is_alive(conn):
+    try:
+        if hasattr(conn, 'ping'):
+            conn.ping(reconnect=False)
+        else:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+        return True
+    except Exception:
+        return False
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    def __init__(self, connect=get_db_connection, size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW,
+                 timeout=POOL_TIMEOUT, recycle=POOL_RECYCLE, ping_after=POOL_PING_AFTER):
+        self._connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._open = 0
+        self._in_use = 0
+
+        self.acquired = 0
+        self.created = 0
+        self.discarded = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def acquire(self):
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    # LIFO so the hottest connection is reused and the rest can age out
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    entry = None
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(msg=f"Timed out after {self.timeout}s waiting for a database connection")
+                self._cond.wait(remaining)
+
+            waited = time.perf_counter() - start
+            self.acquired += 1
+            self._in_use += 1
+            if waited > 0.001:
+                self.waits += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+        try:
+            if entry is not None:
+                entry = self._check(entry)
+            if entry is None:
+                entry = self._new_entry()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return entry
+
+    def _new_entry(self):
+        conn = self._connect()
+        with self._cond:
+            self.created += 1
+        return _Entry(conn)
+
+    def _check(self, entry):
+        now = time.monotonic()
+        stale = self.recycle and now - entry.created_at > self.recycle
+        if not stale and now - entry.last_used <= self.ping_after:
+            return entry
+        if not stale and _is_alive(entry.conn):
+            return entry
+        _close_quietly(entry.conn)
+        with self._cond:
+            self.discarded += 1
+        return None
+
+    def release(self, entry, discard=False):
+        entry.last_used = time.monotonic()
+        with self._cond:
+            self._in_use -= 1
+            # Overflow connections are closed instead of parked once the pool is full
+            if discard or len(self._idle) >= self.size:
+                self._open -= 1
+                if discard:
+                    self.discarded += 1
+                close = True
+            else:
+                self._idle.append(entry)
+                close = False
+            self._cond.notify()
+        if close:
+            _close_quietly(entry.conn)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._open -= len(idle)
+        for entry in idle:
+            _close_quietly(entry.conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "acquired": self.acquired,
+                "created": self.created,
+                "discarded": self.discarded,
+                "timeouts": self.timeouts,
+                "waits": self.waits,
+                "wait_avg_ms": round(self.wait_total / self.acquired * 1000, 3) if self.acquired else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+
+def _reset(conn):
+    # Drain unread results and drop any transaction the caller left open
+    if hasattr(conn, 'consume_results'):
+        conn.consume_results()
+    if getattr(conn, 'in_transaction', False):
+        conn.rollback()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def _after_fork():
+    # A forked worker opens its own connections; the parent's sockets stay the parent's
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+@contextmanager
+def db_connection(pool=None):
+    pool = pool or get_pool()
+    start = time.perf_counter()
+    entry = pool.acquire()
+    metrics.observe_acquire(time.perf_counter() - start)
+    broken = False
+    try:
+        yield entry.conn
+    except BaseException:
+        try:
+            entry.conn.rollback()
+        except Exception:
+            broken = True
+        raise
+    finally:
+        if not broken:
+            try:
+                _reset(entry.conn)
+            except Exception:
+                broken = True
+        pool.release(entry, discard=broken)
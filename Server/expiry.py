@@ -0,0 +1,296 @@
+# Live batches indexed by expiry date, behind /inventory/expiring
+import os
+import threading
+import time
+from contextlib import closing
+from datetime import date, datetime
+
+import numpy as np
+
+from replicas import cache_connection
+from signals import catalogue_changed, inventory_changed
+import versions
+
+# Full reload interval, absorbs writes made outside the app. Sibling workers'
+# writes (see versions.foreign) reload on the next query, since the route's
+# ETag already reflects them.
+EXPIRY_REFRESH_SECONDS = float(os.environ.get("EXPIRY_REFRESH_SECONDS", 3600))
+MAX_LISTED_BATCHES = 1000
+# Widest window /inventory/expiring accepts; keys past it would overflow int64
+MAX_EXPIRY_DAYS = int(os.environ.get("MAX_EXPIRY_DAYS", 3650))
+
+BATCHES_SQL = """
+    SELECT id, product_id, quantity, expiry_date, supplier_name
+    FROM product_inventory_batches
+    WHERE quantity > 0 AND id > %s
+"""
+
+PRODUCTS_SQL = "SELECT id, name, price FROM products"
+
+
+def _ordinal(value):
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return value.toordinal()
+
+
+def _key(ordinal, batch_id):
+    # Sorts by expiry then batch id; both fit comfortably in 32 bits
+    return (ordinal << 32) | batch_id
+
+
+class ExpiryIndex:
+    """Batches with stock left, as columns sorted by (expiry_date, id).
+
+    A window query is two binary searches plus vectorised grouping over the
+    slice. Quantity changes are applied in place; new batches collect in a
+    small pending set merged on the next query, and emptied batches are
+    left as zero-quantity tombstones until they make up a quarter of the
+    index.
+    """
+
+    def __init__(self, refresh=EXPIRY_REFRESH_SECONDS, connection=cache_connection):
+        self.refresh = refresh
+        self._connection = connection
+        self._lock = threading.RLock()
+        self._clear()
+        self._loaded_at = None
+        self._mark = None
+        self._catalogue_stale = True
+        self.products = {}
+        self._price_ids = np.empty(0, dtype=np.int64)
+        self._price_values = np.zeros(1)
+        self.full_loads = 0
+        self.queries = 0
+
+    def _clear(self):
+        self._keys = np.empty(0, dtype=np.int64)
+        self._qty = np.empty(0, dtype=np.int64)
+        self._product = np.empty(0, dtype=np.int64)
+        self._supplier = np.empty(0, dtype=np.int64)
+        self._expiry = {}
+        self._pending = {}
+        self._tombstones = 0
+        self._suppliers = []
+        self._supplier_codes = {}
+        self._max_batch_id = 0
+        self._fetch_new = False
+
+    def _supplier_code(self, name):
+        code = self._supplier_codes.get(name)
+        if code is None:
+            code = self._supplier_codes[name] = len(self._suppliers)
+            self._suppliers.append(name)
+        return code
+
+    # Loading
+
+    def _load_catalogue(self, cursor):
+        cursor.execute(PRODUCTS_SQL)
+        self.products = {pid: (name, float(price or 0)) for pid, name, price in cursor.fetchall()}
+        self._price_ids = np.array(sorted(self.products), dtype=np.int64)
+        self._price_values = np.array([self.products[pid][1] for pid in self._price_ids.tolist()] + [0.0])
+        self._catalogue_stale = False
+
+    def _load_batches(self, cursor, after=0):
+        cursor.execute(BATCHES_SQL, (after,))
+        for batch_id, product_id, quantity, expiry_date, supplier_name in cursor.fetchall():
+            self._max_batch_id = max(self._max_batch_id, batch_id)
+            if batch_id in self._expiry or batch_id in self._pending or expiry_date is None:
+                continue
+            self._pending[batch_id] = [_ordinal(expiry_date), product_id, self._supplier_code(supplier_name),
+                                       int(quantity)]
+        self._fetch_new = False
+
+    def _ensure_loaded(self):
+        full = (self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh
+                or versions.foreign(self._mark))
+        if not (full or self._fetch_new or self._catalogue_stale):
+            return
+        with self._connection() as conn, closing(conn.cursor()) as cursor:
+            if full:
+                self._mark = versions.mark("catalogue", "inventory")
+                self._clear()
+                self._load_batches(cursor)
+                self._loaded_at = time.monotonic()
+                self.full_loads += 1
+            elif self._fetch_new:
+                self._load_batches(cursor, after=self._max_batch_id)
+            if full or self._catalogue_stale:
+                self._load_catalogue(cursor)
+
+    def _merge(self):
+        if self._pending:
+            ids = np.fromiter(self._pending, dtype=np.int64, count=len(self._pending))
+            rows = np.array(list(self._pending.values()), dtype=np.int64).reshape(-1, 4)
+            keys = (rows[:, 0] << 32) | ids
+            order = np.argsort(keys)
+            keys, rows = keys[order], rows[order]
+            at = np.searchsorted(self._keys, keys)
+            self._keys = np.insert(self._keys, at, keys)
+            self._product = np.insert(self._product, at, rows[:, 1])
+            self._supplier = np.insert(self._supplier, at, rows[:, 2])
+            self._qty = np.insert(self._qty, at, rows[:, 3])
+            self._expiry.update(zip(ids[order].tolist(), rows[:, 0].tolist()))
+            self._pending = {}
+        if self._tombstones and self._tombstones * 4 > len(self._keys):
+            live = self._qty > 0
+            self._keys, self._qty = self._keys[live], self._qty[live]
+            self._product, self._supplier = self._product[live], self._supplier[live]
+            self._expiry = {int(k & 0xFFFFFFFF): int(k >> 32) for k in self._keys.tolist()}
+            self._tombstones = 0
+
+    def _position(self, batch_id):
+        ordinal = self._expiry.get(batch_id)
+        if ordinal is None:
+            return None
+        return int(np.searchsorted(self._keys, _key(ordinal, batch_id)))
+
+    # Queries
+
+    def expiring(self, days, group_by="product", include_expired=False, list_batches=False, today=None):
+        today = (today or date.today()).toordinal()
+        with self._lock:
+            self._ensure_loaded()
+            self._merge()
+            self.queries += 1
+            lo = 0 if include_expired else int(np.searchsorted(self._keys, _key(today, 0)))
+            hi = int(np.searchsorted(self._keys, _key(today + days + 1, 0)))
+            keys, qty = self._keys[lo:hi], self._qty[lo:hi]
+            live = qty > 0
+            keys, qty = keys[live], qty[live]
+            products = self._product[lo:hi][live]
+            suppliers = self._supplier[lo:hi][live]
+            names, prices = self.products, self._prices(products)
+            supplier_names = list(self._suppliers)
+
+        value = qty * prices
+        groups_of = products if group_by == "product" else suppliers
+        # The slice is in expiry order, so a group's first row is its earliest batch
+        group_ids, first, inverse = np.unique(groups_of, return_index=True, return_inverse=True)
+        quantities = np.bincount(inverse, weights=qty, minlength=len(group_ids))
+        values = np.bincount(inverse, weights=value, minlength=len(group_ids))
+        counts = np.bincount(inverse, minlength=len(group_ids))
+        expiries = (keys >> 32)[first]
+
+        if group_by == "product":
+            tiebreak = group_ids
+        else:
+            # Supplier codes follow arrival order; break ties by name instead
+            tiebreak = np.argsort(np.argsort(np.array([str(supplier_names[g]) for g in group_ids.tolist()])))
+        order = np.lexsort((tiebreak, -quantities, expiries))
+        day_names = {}
+        groups = []
+        for gid, quantity, value_sum, count, expiry in zip(
+                group_ids[order].tolist(), quantities[order].astype(np.int64).tolist(),
+                np.round(values[order], 2).tolist(), counts[order].tolist(), expiries[order].tolist()):
+            if group_by == "product":
+                group = {"product_id": gid, "product_name": names.get(gid, (None, 0))[0]}
+            else:
+                group = {"supplier_name": supplier_names[gid]}
+            if expiry not in day_names:
+                day_names[expiry] = date.fromordinal(expiry).isoformat()
+            group["quantity_at_risk"] = quantity
+            group["value_at_risk"] = value_sum
+            group["batches"] = count
+            group["earliest_expiry"] = day_names[expiry]
+            groups.append(group)
+
+        if list_batches:
+            by_group = {}
+            for key, q, pid, sup in zip(keys[:MAX_LISTED_BATCHES].tolist(), qty.tolist(), products.tolist(),
+                                        suppliers.tolist()):
+                by_group.setdefault(pid if group_by == "product" else sup, []).append({
+                    "batch_id": key & 0xFFFFFFFF,
+                    "product_id": pid,
+                    "supplier_name": supplier_names[sup],
+                    "quantity": q,
+                    "expiry_date": date.fromordinal(key >> 32).isoformat(),
+                })
+            for i, group in zip(order.tolist(), groups):
+                group["batch_list"] = by_group.get(int(group_ids[i]), [])
+
+        return {
+            "as_of": date.fromordinal(today).isoformat(),
+            "days": days,
+            "group_by": group_by,
+            "batches": int(len(qty)),
+            "quantity_at_risk": int(qty.sum()),
+            "value_at_risk": round(float(value.sum()), 2),
+            "groups": groups,
+        }
+
+    def _prices(self, product_ids):
+        # Products missing from the catalogue land on the trailing 0.0
+        n = len(self._price_ids)
+        if not n:
+            return np.zeros(len(product_ids))
+        at = np.searchsorted(self._price_ids, product_ids)
+        known = self._price_ids[np.minimum(at, n - 1)] == product_ids
+        return self._price_values[np.where(known, at, n)]
+
+    # Signal handlers
+
+    def on_inventory_changed(self, sender, changes):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for change in changes:
+                batch_id = change["batch_id"]
+                if change["op"] == "add":
+                    if batch_id is None or not change.get("expiry_date"):
+                        # Bulk CSV inserts don't report ids; pick them up by id range
+                        self._fetch_new = True
+                        continue
+                    try:
+                        ordinal = _ordinal(change["expiry_date"])
+                    except (TypeError, ValueError):
+                        self._fetch_new = True
+                        continue
+                    self._pending[batch_id] = [ordinal, change["product_id"],
+                                               self._supplier_code(change.get("supplier_name")), change["delta"]]
+                elif batch_id in self._pending:
+                    pending = self._pending[batch_id]
+                    pending[3] = 0 if change["op"] == "delete" else pending[3] + change["delta"]
+                    if pending[3] <= 0:
+                        del self._pending[batch_id]
+                else:
+                    pos = self._position(batch_id)
+                    if pos is None:
+                        if batch_id > self._max_batch_id:
+                            self._fetch_new = True
+                        continue
+                    before = self._qty[pos]
+                    self._qty[pos] = 0 if change["op"] == "delete" else before + change["delta"]
+                    if before > 0 >= self._qty[pos]:
+                        self._tombstones += 1
+                        del self._expiry[batch_id]
+
+    def on_catalogue_changed(self, sender, product_id, action):
+        with self._lock:
+            self._catalogue_stale = True
+            if action != "deleted" or self._loaded_at is None:
+                return
+            self._pending = {k: v for k, v in self._pending.items() if v[1] != product_id}
+            gone = (self._product == product_id) & (self._qty > 0)
+            for key in self._keys[gone].tolist():
+                self._expiry.pop(key & 0xFFFFFFFF, None)
+            self._qty[gone] = 0
+            self._tombstones += int(gone.sum())
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def stats(self):
+        with self._lock:
+            return {"batches": len(self._expiry) + len(self._pending), "tombstones": self._tombstones,
+                    "pending": len(self._pending), "suppliers": len(self._suppliers),
+                    "full_loads": self.full_loads, "queries": self.queries}
+
+
+index = ExpiryIndex()
+inventory_changed.connect(index.on_inventory_changed)
+catalogue_changed.connect(index.on_catalogue_changed)
@@ -0,0 +1,232 @@
+# EXPLAIN every query the app sends and fail on full scans or sorts
+#
+#   python explain_check.py                       # configured MySQL database, seeded
+#   DB_BACKEND=sqlite python explain_check.py     # seeds a throwaway stand-in first
+#
+# Queries are pulled out of the route modules with ast: module-level *_SQL
+# constants and string literals passed to execute()/executemany(), with
+# {placeholders} and f-string holes filled by a two-value IN list. The
+# listing queries are built by listing.py at request time, so its specs are
+# rendered directly, as are a few /sales/timeseries shapes. Each plan fails
+# if a table is read without an index (MySQL type=ALL, SQLite "SCAN t") or
+# rows are sorted after reading ("Using filesort", "TEMP B-TREE FOR ORDER
+# BY"). Queries that aggregate a
+# whole table on purpose are listed in ALLOWED_SCANS with the reason.
+import argparse
+import ast
+import json
+import os
+import re
+import sys
+import tempfile
+from contextlib import closing
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODULES = ("allocation.py", "analytics_store.py", "archive.py", "expiry.py", "ingest.py", "invoice_queue.py",
+           "ledger.py", "reorder.py", "replicas.py", "rollups.py", "sales_index.py",
+           "routes/catalogue.py", "routes/forecasting.py", "routes/inventory.py", "routes/sales.py")
+
+ALLOWED_SCANS = {
+    "analytics_store.PRODUCTS_SQL": "full catalogue load for /analytics, hourly",
+    "analytics_store.CATEGORIES_SQL": "full catalogue load for /analytics, hourly",
+    "analytics_store.PRODUCT_SALES_SQL": "whole-table aggregate for /analytics, hourly",
+    "analytics_store.MONTHLY_SALES_SQL": "whole-table aggregate for /analytics, hourly",
+    "analytics_store.INVENTORY_SQL": "whole-table aggregate for /analytics, hourly",
+    "forecasting.precompute_forecasts": "reads every product id once at start-up",
+    "expiry.PRODUCTS_SQL": "price table load for the expiry index",
+    "expiry.BATCHES_SQL": "expiry index load, reads every live batch",
+    "ledger.LIVE_BATCHES_SQL": "ledger start-up load, reads every live batch",
+    "ledger.DRIFT_SQL": "admin reconcile over every product",
+    "ledger.BATCH_TOTALS_SQL": "ledger verify over every product",
+    "reorder.PRODUCTS_SQL": "reorder plan covers the whole catalogue",
+    "reorder.BATCHES_SQL": "reorder plan reads every batch once for stock and lead times",
+    "sales_index.WINDOW_SALES_SQL": "warm-up reads the whole sales window",
+    "listing.PRODUCTS": "first page walks the primary key and stops at LIMIT",
+}
+
+_EXPLAINABLE = re.compile(r"^\s*\(?\s*(SELECT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+_PLACEHOLDER = re.compile(r"%s")
+_DATE_BEFORE = re.compile(r"date\w*\W*(?:[<>=!]+|BETWEEN|AND)\s*\(?$", re.IGNORECASE)
+_IN_LIST = "%s, %s"
+
+
+def _repeated(node):
+    # sep.join([literal] * n), the way the app builds IN lists and CASE arms,
+    # rendered with n = 2
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "join" \
+            and isinstance(node.func.value, ast.Constant) and len(node.args) == 1:
+        arg = node.args[0]
+        if isinstance(arg, ast.BinOp) and isinstance(arg.op, ast.Mult) and isinstance(arg.left, ast.List) \
+                and len(arg.left.elts) == 1 and isinstance(arg.left.elts[0], ast.Constant):
+            return node.func.value.value.join([arg.left.elts[0].value] * 2)
+    return None
+
+
+def _render(node, assigned=None):
+    # Literal text of a str constant, f-string or "...".format(...) call
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value.replace("{placeholders}", _IN_LIST)
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                parts.append(value.value)
+            else:
+                hole = value.value
+                source = (assigned or {}).get(hole.id) if isinstance(hole, ast.Name) else None
+                parts.append(_repeated(source) or _IN_LIST)
+        return "".join(parts)
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "format":
+        return _render(node.func.value)
+    return None
+
+
+def extract(path):
+    """[(query id, sql)] for one module."""
+    module = os.path.splitext(os.path.basename(path))[0]
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    queries = []
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) \
+                and node.targets[0].id.endswith("_SQL"):
+            sql = _render(node.value)
+            if sql:
+                queries.append((f"{module}.{node.targets[0].id}", sql))
+
+    # Innermost function first, so a nested helper's query is named after it
+    functions = [n for n in ast.walk(tree) if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    seen = set()
+    for function in reversed(functions):
+        assigned = {n.targets[0].id: n.value for n in ast.walk(function)
+                    if isinstance(n, ast.Assign) and len(n.targets) == 1 and isinstance(n.targets[0], ast.Name)}
+        for node in ast.walk(function):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) \
+                    and node.func.attr in ("execute", "executemany") and node.args and id(node) not in seen:
+                seen.add(id(node))
+                sql = _render(node.args[0], assigned)
+                if sql:
+                    queries.append((f"{module}.{function.name}", sql))
+    return [(qid, sql) for qid, sql in queries if _EXPLAINABLE.match(sql)]
+
+
+def listing_queries():
+    import listing
+    queries = []
+    for name, spec in (("PRODUCTS", listing.PRODUCTS), ("INVENTORY", listing.INVENTORY)):
+        sql, params, _, _ = spec.build({}, limit=50)
+        queries.append((f"listing.{name}", sql, params))
+        cursor = listing.encode_cursor([_sample_key(k) for k in spec.order])
+        sql, params, _, _ = spec.build({}, cursor=cursor, limit=50)
+        queries.append((f"listing.{name}:next_page", sql, params))
+    return queries
+
+
+def rollup_queries():
+    import rollups
+    queries = []
+    for granularity, group_by, filters in (("day", "total", {}), ("week", "product", {"product_ids": [1, 2]}),
+                                           ("month", "category", {"category_id": 1})):
+        sql, params = rollups.timeseries_query(granularity, group_by, "2024-01-01", "2024-03-31", **filters)
+        queries.append((f"rollups.timeseries:{granularity}/{group_by}", sql, params))
+    return queries
+
+
+def _sample_key(name):
+    return "2030-01-01" if "date" in name else 1
+
+
+def sample_params(sql):
+    # A value per %s; dates for placeholders compared against a date column
+    params = []
+    for match in _PLACEHOLDER.finditer(sql):
+        before = sql[max(0, match.start() - 40):match.start()]
+        params.append("2024-06-01" if _DATE_BEFORE.search(before.rstrip()) else 1)
+    return params
+
+
+def problems(backend, plan):
+    found = []
+    if backend == "sqlite":
+        for row in plan:
+            detail = row[-1]
+            if detail.startswith("SCAN ") and "INDEX" not in detail:
+                found.append(f"full scan: {detail}")
+            if "TEMP B-TREE FOR ORDER BY" in detail:
+                found.append(f"sort: {detail}")
+    else:
+        for row in plan:
+            table, access, extra = row.get("table"), row.get("type"), row.get("Extra") or ""
+            if access == "ALL" and not str(table or "").startswith("<"):
+                found.append(f"full scan of {table}")
+            if "Using filesort" in extra:
+                found.append(f"filesort on {table}")
+    return found
+
+
+def explain(conn, backend, sql, params):
+    prefix = "EXPLAIN QUERY PLAN " if backend == "sqlite" else "EXPLAIN "
+    with closing(conn.cursor(dictionary=backend != "sqlite")) as cursor:
+        cursor.execute(prefix + sql, params)
+        plan = cursor.fetchall()
+    conn.rollback()
+    return plan
+
+
+def run(conn, backend):
+    queries = []
+    for module in MODULES:
+        for qid, sql in extract(os.path.join(SERVER_DIR, module)):
+            queries.append((qid, sql, sample_params(sql)))
+    queries.extend(listing_queries())
+    queries.extend(rollup_queries())
+
+    results = []
+    for qid, sql, params in queries:
+        plan = explain(conn, backend, sql, params)
+        found = problems(backend, plan)
+        allowed = ALLOWED_SCANS.get(qid.split(":")[0])
+        results.append({
+            "query": qid,
+            "status": "ok" if not found else "allowed" if allowed else "fail",
+            "problems": found,
+            "reason": allowed if found else None,
+            "plan": [list(r.values()) if isinstance(r, dict) else list(r) for r in plan],
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    parser.add_argument("--csv", default="sales_data.csv", help="seed data for the SQLite stand-in")
+    args = parser.parse_args()
+
+    from db import DB_BACKEND, get_db_connection
+    if DB_BACKEND == "sqlite":
+        # Seed a fresh stand-in so the planner sees realistic row counts
+        import sqlite_backend
+        from benchmarks.seed import seed
+        path = os.path.join(tempfile.mkdtemp(prefix="smartretail-explain-"), "explain.sqlite3")
+        seed(path, args.csv)
+        conn = sqlite_backend.connect(path)
+    else:
+        conn = get_db_connection()
+
+    with closing(conn):
+        results = run(conn, DB_BACKEND)
+
+    if args.json:
+        print(json.dumps(results, indent=2, default=str))
+    else:
+        for r in results:
+            note = "; ".join(r["problems"]) + (f" ({r['reason']})" if r["reason"] else "")
+            print(f"{r['status']:<8} {r['query']:<44} {note}")
+    failed = [r["query"] for r in results if r["status"] == "fail"]
+    if failed:
+        sys.exit(f"{len(failed)} hot-path queries scan or sort: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+# Feature construction and batched inference for the demand models
+import json
+import os
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import numpy as np
+
+import metrics
+
+# Models fitted on DataFrames warn when handed a bare array; the column order
+# below always follows the model's own feature_names_in_.
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+DEFAULT_FEATURES = ("product_id", "month", "week")
+LAG_FEATURES = ("last_week_sales", "last_2w_sales", "last_month_sales")
+# Days each lag feature sums, ending the day before the forecast is made;
+# served by sales_index and used to build the training frame (training.py)
+LAG_WINDOWS = (7, 14, 30)
+
+# Season code per month (index 0 unused): winter 0, spring 1, summer 2, autumn 3
+SEASON_BY_MONTH = np.array([0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 0], dtype=np.int64)
+
+MAX_BATCH = 200_000
+STREAM_CHUNK = 1000
+
+# Products whose full (month, week) table is kept; about 2.8 KB each
+FORECAST_CACHE_PRODUCTS = int(os.environ.get("FORECAST_CACHE_PRODUCTS", 10_000))
+
+
+def feature_names(model):
+    names = getattr(model, "feature_names_in_", None)
+    return tuple(names) if names is not None else DEFAULT_FEATURES
+
+
+def validate(product_ids, months, weeks):
+    product_ids = np.asarray(product_ids, dtype=np.int64)
+    months = np.asarray(months, dtype=np.int64)
+    weeks = np.asarray(weeks, dtype=np.int64)
+    if not (product_ids.shape == months.shape == weeks.shape) or product_ids.ndim != 1:
+        raise ValueError("product_id, month and week must have the same length")
+    if len(product_ids) > MAX_BATCH:
+        raise ValueError(f"At most {MAX_BATCH} predictions per request")
+    if len(months) and (months.min() < 1 or months.max() > 12):
+        raise ValueError("month must be between 1 and 12")
+    if len(weeks) and (weeks.min() < 1 or weeks.max() > 53):
+        raise ValueError("week must be between 1 and 53")
+    return product_ids, months, weeks
+
+
+def uses_lags(model):
+    return any(name in LAG_FEATURES for name in feature_names(model))
+
+
+def build_features(model, product_ids, months, weeks, lags=None):
+    columns = {
+        "product_id": product_ids,
+        "month": months,
+        "week": weeks,
+        "season_encoded": SEASON_BY_MONTH[months],
+    }
+    if uses_lags(model):
+        # Recent sales per product from the rolling index; zeros without one
+        lag_values = lags.lag_features(product_ids) if lags is not None else np.zeros((len(product_ids), 3))
+        for i, name in enumerate(LAG_FEATURES):
+            columns[name] = lag_values[:, i]
+    n = len(product_ids)
+    X = np.empty((n, len(feature_names(model))), dtype=np.float64)
+    for i, name in enumerate(feature_names(model)):
+        if name in columns:
+            X[:, i] = columns[name]
+        else:
+            raise ValueError(f"Model expects unsupported feature {name!r}")
+    return X
+
+
+def predict_batch(model, product_ids, months, weeks, lags=None):
+    product_ids, months, weeks = validate(product_ids, months, weeks)
+    if not len(product_ids):
+        return np.empty(0, dtype=np.float64)
+    X = build_features(model, product_ids, months, weeks, lags=lags)
+    start = time.perf_counter()
+    predictions = model.predict(X)
+    metrics.observe_inference(model, len(X), time.perf_counter() - start)
+    return np.asarray(predictions, dtype=np.float64)
+
+
+def predict_one(model, product_id, month, week, lags=None):
+    return float(predict_batch(model, [product_id], [month], [week], lags=lags)[0])
+
+
+class ForecastCache:
+    """Precomputed predictions indexed by [product row, month, week].
+
+    The first lookup for a product predicts its whole 12 x 53 grid in one
+    vectorized call; later lookups are array indexing. Rows are evicted
+    least-recently-used once ``max_products`` is reached, and the table is
+    dropped whenever the model changes. For models with lag features a row
+    is refilled once the sales index reports new sales for that product.
+    """
+
+    def __init__(self, model=None, max_products=FORECAST_CACHE_PRODUCTS, lags=None):
+        self.max_products = max_products
+        self.lags = lags
+        self._lock = threading.Lock()
+        self._grid_months, self._grid_weeks = np.meshgrid(np.arange(1, 13), np.arange(1, 54), indexing="ij")
+        self.reset(model)
+
+    def reset(self, model):
+        with self._lock:
+            self.model = model
+            self._table = np.full((0, 13, 54), np.nan, dtype=np.float32)
+            self._rows = OrderedDict()
+            self._stamps = {}
+            self._free = []
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def _grow(self, needed):
+        size = len(self._table)
+        if size >= needed:
+            return
+        new_size = min(self.max_products, max(needed, size * 2, 64))
+        table = np.full((new_size, 13, 54), np.nan, dtype=np.float32)
+        table[:size] = self._table
+        self._free.extend(range(new_size - 1, size - 1, -1))
+        self._table = table
+
+    def _fill(self, product_ids):
+        # One predict call for every missing product's full grid
+        n = len(product_ids)
+        cells = self._grid_months.size
+        stamps = self._lag_stamps(product_ids)
+        # Whole grids, as many products per predict call as MAX_BATCH allows
+        step = MAX_BATCH // cells
+        predictions = np.concatenate([predict_batch(
+            self.model,
+            np.repeat(np.asarray(product_ids[i:i + step], dtype=np.int64), cells),
+            np.tile(self._grid_months.ravel(), len(product_ids[i:i + step])),
+            np.tile(self._grid_weeks.ravel(), len(product_ids[i:i + step])),
+            lags=self.lags,
+        ) for i in range(0, n, step)]).reshape(n, 12, 53)
+        self._grow(min(self.max_products, len(self._rows) + n))
+        for product_id, grid, stamp in zip(product_ids, predictions, stamps):
+            row = self._rows.pop(product_id, None)
+            if row is None:
+                if not self._free:
+                    evicted, row = self._rows.popitem(last=False)
+                    self._stamps.pop(evicted, None)
+                    self.evictions += 1
+                else:
+                    row = self._free.pop()
+            self._table[row, 1:, 1:] = grid
+            self._rows[product_id] = row
+            self._stamps[product_id] = stamp
+
+    def _lag_stamps(self, product_ids):
+        if self.lags is None or not uses_lags(self.model):
+            return [None] * len(product_ids)
+        return self.lags.stamps(product_ids)
+
+    def lookup(self, product_ids, months, weeks):
+        product_ids, months, weeks = validate(product_ids, months, weeks)
+        unique = np.unique(product_ids).tolist()
+        if len(unique) > self.max_products:
+            # Bigger than the whole cache, so just predict directly
+            with self._lock:
+                self.misses += len(product_ids)
+            return predict_batch(self.model, product_ids, months, weeks, lags=self.lags)
+        with self._lock:
+            missing = []
+            for pid, stamp in zip(unique, self._lag_stamps(unique)):
+                if pid in self._rows and self._stamps.get(pid) == stamp:
+                    # Touch before filling so eviction never picks a product we need
+                    self._rows.move_to_end(pid)
+                else:
+                    missing.append(pid)
+            if missing:
+                self._fill(missing)
+            rows = np.fromiter((self._rows[pid] for pid in product_ids.tolist()), dtype=np.int64,
+                               count=len(product_ids))
+            result = self._table[rows, months, weeks].astype(np.float64)
+            missed = np.isin(product_ids, missing).sum() if missing else 0
+            self.misses += int(missed)
+            self.hits += len(product_ids) - int(missed)
+        return result
+
+    def get(self, product_id, month, week):
+        return float(self.lookup([product_id], [month], [week])[0])
+
+    def warm(self, product_ids):
+        product_ids = list(dict.fromkeys(int(p) for p in product_ids))[:self.max_products]
+        with self._lock:
+            stamps = self._lag_stamps(product_ids)
+            missing = [pid for pid, stamp in zip(product_ids, stamps)
+                       if pid not in self._rows or self._stamps.get(pid) != stamp]
+            if missing:
+                self._fill(missing)
+        return len(missing)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "products": len(self._rows),
+                "capacity": self.max_products,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+class ForecastCaches:
+    """One ForecastCache per registry model, reset whenever that model is swapped."""
+
+    def __init__(self, registry, lags=None):
+        self.registry = registry
+        self.lags = lags
+        self._caches = {}
+        self._lock = threading.Lock()
+        registry.on_swap(self._on_swap)
+
+    def _on_swap(self, name, model):
+        cache = self._caches.get(name)
+        if cache is not None:
+            cache.reset(model)
+
+    def get(self, name=None):
+        name = name or self.registry.default
+        model = self.registry.get(name)
+        with self._lock:
+            cache = self._caches.get(name)
+            if cache is None:
+                cache = self._caches[name] = ForecastCache(model, lags=self.lags)
+        return cache
+
+    def stats(self):
+        with self._lock:
+            return {name: cache.stats() for name, cache in self._caches.items()}
+
+
+def horizon(weeks_ahead, start=None):
+    # (month, ISO week) for each of the next `weeks_ahead` weeks
+    start = start or date.today()
+    points = []
+    for i in range(weeks_ahead):
+        day = start + timedelta(weeks=i)
+        points.append((day.month, day.isocalendar()[1]))
+    return points
+
+
+def parse_batch_request(data):
+    """Turn a batch request body into (product_ids, months, weeks) arrays.
+
+    Accepts either explicit ``items`` ([{product_id, month, week}, ...]) or a
+    horizon grid: ``product_ids`` with ``weeks_ahead`` (and optional ISO
+    ``start`` date), forecasting every product for every upcoming week.
+    """
+    if "items" in data:
+        items = data["items"]
+        if not isinstance(items, list):
+            raise ValueError("'items' must be a list")
+        return (
+            [int(i["product_id"]) for i in items],
+            [int(i["month"]) for i in items],
+            [int(i["week"]) for i in items],
+        )
+    if "product_ids" in data:
+        product_ids = np.asarray([int(p) for p in data["product_ids"]], dtype=np.int64)
+        weeks_ahead = int(data.get("weeks_ahead", 4))
+        if weeks_ahead < 1 or weeks_ahead > 53:
+            raise ValueError("weeks_ahead must be between 1 and 53")
+        start = date.fromisoformat(data["start"]) if data.get("start") else None
+        points = np.asarray(horizon(weeks_ahead, start), dtype=np.int64)
+        return (
+            np.repeat(product_ids, len(points)),
+            np.tile(points[:, 0], len(product_ids)),
+            np.tile(points[:, 1], len(product_ids)),
+        )
+    raise ValueError("Provide either 'items' or 'product_ids'")
+
+
+def stream_predictions(product_ids, months, weeks, predictions, ndjson=False):
+    # Serialize in chunks so a large batch never sits in memory as one string
+    rows = zip(product_ids.tolist(), months.tolist(), weeks.tolist(), np.rint(predictions).astype(np.int64).tolist())
+    if not ndjson:
+        yield '{"count": %d, "predictions": [' % len(predictions)
+    first = True
+    chunk = []
+    for product_id, month, week, demand in rows:
+        chunk.append(json.dumps({"product_id": product_id, "month": month, "week": week,
+                                 "predicted_demand": demand}))
+        if len(chunk) >= STREAM_CHUNK:
+            yield _join(chunk, ndjson, first)
+            first = False
+            chunk = []
+    if chunk:
+        yield _join(chunk, ndjson, first)
+    if not ndjson:
+        yield "]}"
+
+
+def _join(chunk, ndjson, first):
+    if ndjson:
+        return "\n".join(chunk) + "\n"
+    return ("" if first else ",") + ",".join(chunk)
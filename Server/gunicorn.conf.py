@@ -0,0 +1,57 @@
+# Production pre-fork deployment.
+#
+#   gunicorn -c gunicorn.conf.py app:app
+#   kill -HUP <master pid>      # graceful reload: new workers fork from a refreshed master
+#
+# The app is imported once in the master (preload_app) and prefork.preload()
+# loads the models and read-only reference data there before the first
+# worker forks, so every worker shares those pages copy-on-write instead of
+# loading its own copy. Workers are recycled after MAX_REQUESTS (with
+# jitter so they don't all restart at once); a recycled worker forks from
+# the same warm master and is serving immediately.
+import multiprocessing
+import os
+
+# PRELOAD=0 imports and warms the app in each worker instead (for comparison)
+preload_app = os.environ.get("PRELOAD", "1") not in ("0", "false")
+# With preload the warm-up runs in the master below, not on a thread in every worker
+os.environ.setdefault("WARM_UP", "0" if preload_app else "1")
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# uvicorn.workers.UvicornWorker with asgi:app for the async routes (and /changes)
+worker_class = os.environ.get("WORKER_CLASS", "gthread")
+threads = int(os.environ.get("WORKER_THREADS", 4))
+max_requests = int(os.environ.get("MAX_REQUESTS", 5000))
+max_requests_jitter = int(os.environ.get("MAX_REQUESTS_JITTER", max_requests // 10))
+timeout = int(os.environ.get("WORKER_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("KEEPALIVE", 5))
+
+
+def on_starting(server):
+    from ledger import STOCK_LEDGER
+    if STOCK_LEDGER and server.num_workers > 1:
+        # The ledger holds stock in process memory; workers would oversell
+        raise RuntimeError("STOCK_LEDGER=1 needs a single worker (WEB_CONCURRENCY=1)")
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    import prefork
+    models = prefork.preload()
+    server.log.info("Preloaded models %s; master %s", models, prefork.memory())
+
+
+def on_reload(server):
+    if not preload_app:
+        return
+    import prefork
+    server.log.info("Reloaded models %s before forking new workers", prefork.refresh())
+
+
+def worker_exit(server, worker):
+    # Runs in the exiting worker: how much it grew past what it shares with the master
+    import prefork
+    server.log.info("Worker %s exiting after %s requests; %s", worker.pid, worker.nr, prefork.memory())
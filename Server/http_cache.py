@@ -0,0 +1,347 @@
+# Conditional requests, compression and fast JSON for the read routes
+#
+# - Routes over the database take their ETag from versions.current() of the
+#   datasets they read plus the request path, so a conditional request for
+#   unchanged data is answered 304 before any query runs (@versioned).
+# - Payloads built once and served many times (/schemes, the /analytics
+#   snapshot) are serialized once into a Body that keeps its gzip and brotli
+#   encodings and an ETag over the bytes.
+# - Any other JSON GET gets a weak ETag hashed from its body, and is
+#   compressed on the way out (streamed listings chunk by chunk) when the
+#   client accepts it and it is at least COMPRESS_MIN_BYTES.
+# orjson and brotli are used when installed; without them the stdlib json
+# and gzip do the same job, slower and without br.
+import gzip
+import hashlib
+import json
+import os
+import threading
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from functools import wraps
+
+from flask import make_response, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date, parse_date
+
+import replicas
+import versions
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/")
+# Browsers keep the response but revalidate it on every fetch
+CACHE_CONTROL = "no-cache"
+
+
+def json_default(value):
+    # Same representations Flask's jsonify uses: HTTP dates, decimals as strings
+    if isinstance(value, date):
+        if not isinstance(value, datetime):
+            value = datetime(value.year, value.month, value.day)
+        return http_date(value)
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value, sort_keys=False):
+    if orjson is not None:
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(value, default=json_default, option=option).decode("utf-8")
+    return json.dumps(value, default=json_default, ensure_ascii=False, separators=(",", ":"), sort_keys=sort_keys)
+
+
+class JSONProvider(DefaultJSONProvider):
+    """jsonify through orjson when it is installed; indented debug output stays on json."""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.get("indent"):
+            return super().dumps(obj, **kwargs)
+        return dumps(obj, sort_keys=kwargs.get("sort_keys", self.sort_keys))
+
+
+# Validators
+
+def etag(*parts):
+    return 'W/"%s"' % hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def body_etag(data):
+    return 'W/"%s"' % hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def _opaque(tag):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def not_modified(headers, tag, modified=None):
+    # If-None-Match wins when both are sent (RFC 9110 13.2.2)
+    match = headers.get("If-None-Match")
+    if match is not None:
+        return match.strip() == "*" or _opaque(tag) in {_opaque(t) for t in match.split(",")}
+    since = parse_date(headers.get("If-Modified-Since")) if modified else None
+    return since is not None and int(modified) <= since.timestamp()
+
+
+def validators(tag, modified=None):
+    headers = {"ETag": tag, "Cache-Control": CACHE_CONTROL}
+    if modified:
+        headers["Last-Modified"] = http_date(modified)
+    return headers
+
+
+def data_version(path, datasets):
+    """(ETag, last modified) of a request path over the given datasets."""
+    tokens, modified = versions.current(*datasets)
+    return etag(path, *tokens), modified
+
+
+# Compression
+
+def negotiate(accept_encoding):
+    best, best_q = None, 0.0
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                continue
+        if name not in ("gzip", "br") or (name == "br" and brotli is None) or q <= 0:
+            continue
+        if q > best_q or (q == best_q and name == "br"):
+            best, best_q = name, q
+    return best
+
+
+def compressible(content_type):
+    # Event streams go out event by event; a compressor would hold them back
+    content_type = content_type or ""
+    return content_type.startswith(COMPRESSIBLE) and not content_type.startswith("text/event-stream")
+
+
+def compress(data, encoding, best=False):
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if best else BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+
+
+class Compressor:
+    """Incremental gzip or brotli for bodies sent in chunks."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self._stream = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._stream = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def process(self, data):
+        return self._stream.process(data) if self.encoding == "br" else self._stream.compress(data)
+
+    def finish(self):
+        return self._stream.finish() if self.encoding == "br" else self._stream.flush()
+
+
+def compress_chunks(chunks, encoding):
+    compressor = Compressor(encoding)
+    for chunk in chunks:
+        out = compressor.process(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        if out:
+            yield out
+    yield compressor.finish()
+
+
+# Serialize-once bodies
+
+class Body:
+    """A JSON body serialized once, with its ETag and compressed encodings.
+
+    ``best`` compresses every encoding up front at the highest level, for
+    payloads that never change; otherwise each encoding is made at normal
+    speed the first time a client asks for it.
+    """
+
+    def __init__(self, data, mimetype="application/json", best=False):
+        self.data = data
+        self.mimetype = mimetype
+        self.etag = body_etag(data)
+        self._encoded = {}
+        self._lock = threading.Lock()
+        if best and len(data) >= COMPRESS_MIN_BYTES:
+            for encoding in ("gzip", "br") if brotli is not None else ("gzip",):
+                self._encoded[encoding] = compress(data, encoding, best=True)
+
+    @classmethod
+    def json(cls, value, best=False):
+        # Sorted keys, as jsonify renders them
+        return cls(dumps(value, sort_keys=True).encode("utf-8"), best=best)
+
+    def encoded(self, encoding):
+        if encoding is None or len(self.data) < COMPRESS_MIN_BYTES:
+            return None, self.data
+        with self._lock:
+            data = self._encoded.get(encoding)
+            if data is None:
+                data = self._encoded[encoding] = compress(self.data, encoding)
+        return encoding, data
+
+    def representation(self, headers):
+        """(status, body bytes, headers) answering a request with these headers."""
+        out = {**validators(self.etag), "Vary": "Accept-Encoding"}
+        if not_modified(headers, self.etag):
+            return 304, b"", out
+        encoding, data = self.encoded(negotiate(headers.get("Accept-Encoding")))
+        if encoding:
+            out["Content-Encoding"] = encoding
+        return 200, data, out
+
+
+class Memo:
+    """The Body of the last payload object seen; a new object is serialized again."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._payload = None
+        self._body = None
+
+    def body(self, payload):
+        with self._lock:
+            if self._payload is not payload:
+                self._payload, self._body = payload, Body.json(payload)
+            return self._body
+
+
+# Flask
+
+def respond(body):
+    status, data, headers = body.representation(request.headers)
+    response = make_response(data, status, headers)
+    if status == 200:
+        response.mimetype = body.mimetype
+    return response
+
+
+def versioned(*datasets):
+    """Serve a view with data-version validators, answering 304 without running it."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Read before the view runs, so the body is never older than its tag
+            tag, modified = data_version(request.full_path, datasets)
+            headers = validators(tag, modified)
+            if not_modified(request.headers, tag, modified):
+                return make_response("", 304, headers)
+            reads = replicas.Reads()
+            token = replicas.current_reads.set(reads)
+            try:
+                response = make_response(view(*args, **kwargs))
+            finally:
+                replicas.current_reads.reset(token)
+            # A replica behind the last bump served older data than the tag names
+            if response.status_code == 200 and reads.upto >= modified:
+                response.headers.update(headers)
+            return response
+        return wrapper
+    return decorator
+
+
+def finish(response):
+    """after_request: ETag any other JSON GET and compress what the client accepts."""
+    if request.method not in ("GET", "HEAD") or response.status_code != 200 \
+            or "Content-Encoding" in response.headers or not compressible(response.content_type):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate(request.headers.get("Accept-Encoding"))
+    if response.is_streamed:
+        if encoding:
+            response.response = compress_chunks(response.iter_encoded(), encoding)
+            response.headers["Content-Encoding"] = encoding
+            response.headers.pop("Content-Length", None)
+        return response
+
+    data = response.get_data()
+    if "ETag" not in response.headers:
+        tag = body_etag(data)
+        response.headers.update(validators(tag))
+        if not_modified(request.headers, tag):
+            return make_response("", 304, {**validators(tag), "Vary": "Accept-Encoding"})
+    if encoding and len(data) >= COMPRESS_MIN_BYTES:
+        response.set_data(compress(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_app(app):
+    app.json = JSONProvider(app)
+    app.after_request(finish)
+
+
+# ASGI
+
+class CompressionMiddleware:
+    """Compress the native async routes' JSON; responses already encoded pass through."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+        accept = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"accept-encoding"), None)
+        encoding = negotiate(accept)
+        if encoding is None:
+            return await self.app(scope, receive, send)
+        held = None
+        compressor = None
+
+        async def compressing_send(message):
+            nonlocal held, compressor
+            if message["type"] == "http.response.start":
+                headers = {k.lower(): v for k, v in message["headers"]}
+                if message["status"] == 200 and b"content-encoding" not in headers \
+                        and compressible(headers.get(b"content-type", b"").decode("latin-1")):
+                    # Held until the first body chunk shows whether it's worth compressing
+                    held = message
+                    return
+                return await send(message)
+            if message["type"] != "http.response.body" or held is None:
+                return await send(message)
+            body, more = message.get("body", b""), message.get("more_body", False)
+            if compressor is None:
+                if not more and len(body) < COMPRESS_MIN_BYTES:
+                    start, held = held, None
+                    await send(start)
+                    return await send(message)
+                compressor = Compressor(encoding)
+                headers = [(k, v) for k, v in held["headers"] if k.lower() != b"content-length"]
+                headers += [(b"content-encoding", encoding.encode()), (b"vary", b"Accept-Encoding")]
+                if not more:
+                    data = compress(body, encoding)
+                    await send({**held, "headers": headers + [(b"content-length", str(len(data)).encode())]})
+                    return await send({"type": "http.response.body", "body": data, "more_body": False})
+                await send({**held, "headers": headers})
+            data = compressor.process(body)
+            if not more:
+                data += compressor.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, compressing_send)
@@ -0,0 +1,144 @@
+# Streaming CSV ingestion for /inventory/upload_csv
+import codecs
+import csv
+import os
+from collections import defaultdict
+from contextlib import closing
+from datetime import datetime
+
+import mysql.connector
+
+from signals import inventory_changed
+
+INGEST_CHUNK_SIZE = int(os.environ.get("INGEST_CHUNK_SIZE", 2000))
+# Cap the error report so a completely broken file can't blow up the response
+MAX_REPORTED_ERRORS = int(os.environ.get("INGEST_MAX_REPORTED_ERRORS", 500))
+
+REQUIRED_COLUMNS = ("product_id", "quantity", "expiry_date", "supplier_name", "order_date", "delivery_date")
+
+INSERT_BATCH_SQL = """
+    INSERT INTO product_inventory_batches
+    (product_id, quantity, expiry_date, supplier_name, order_date, delivery_date)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+UPDATE_INVENTORY_SQL = """
+    UPDATE products
+    SET inventory = inventory + %s
+    WHERE id = %s
+"""
+
+
+class IngestReport:
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.chunks = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self):
+        return {
+            "message": f"Inserted {self.inserted} rows successfully",
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "chunks": self.chunks,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors)
+        }
+
+
+def _parse_date(value):
+    return datetime.strptime(value.strip(), "%Y-%m-%d").date()
+
+
+def parse_row(row):
+    product_id = int(row["product_id"])
+    quantity = int(row["quantity"])
+    if quantity <= 0:
+        raise ValueError("quantity must be positive")
+    supplier_name = (row["supplier_name"] or "").strip()
+    if not supplier_name:
+        raise ValueError("supplier_name is required")
+    expiry_date = _parse_date(row["expiry_date"])
+    order_date = _parse_date(row["order_date"])
+    delivery_date = _parse_date(row["delivery_date"])
+    if delivery_date < order_date:
+        raise ValueError("delivery_date is before order_date")
+    return (product_id, quantity, expiry_date, supplier_name, order_date, delivery_date)
+
+
+def _known_products(cursor, product_ids, known):
+    missing = [pid for pid in product_ids if pid not in known]
+    if missing:
+        placeholders = ", ".join(["%s"] * len(missing))
+        cursor.execute(f"SELECT id FROM products WHERE id IN ({placeholders})", missing)
+        known.update(pid for (pid,) in cursor.fetchall())
+    return known
+
+
+def _flush(conn, cursor, chunk, report, known):
+    report.chunks += 1
+    _known_products(cursor, {values[0] for _, values in chunk}, known)
+
+    rows = []
+    totals = defaultdict(int)
+    for line, values in chunk:
+        if values[0] not in known:
+            report.error(line, f"unknown product_id {values[0]}")
+            continue
+        rows.append(values)
+        totals[values[0]] += values[1]
+    if not rows:
+        return
+
+    try:
+        cursor.executemany(INSERT_BATCH_SQL, rows)
+        cursor.executemany(UPDATE_INVENTORY_SQL, [(qty, pid) for pid, qty in totals.items()])
+        conn.commit()
+    except mysql.connector.Error as err:
+        conn.rollback()
+        for line, values in chunk:
+            if values[0] in known:
+                report.error(line, f"chunk rolled back: {err}")
+        return
+
+    report.inserted += len(rows)
+    inventory_changed.send("ingest", changes=[
+        {"op": "add", "product_id": pid, "batch_id": None, "delta": qty,
+         "expiry_date": expiry_date, "supplier_name": supplier_name}
+        for pid, qty, expiry_date, supplier_name, _, _ in rows
+    ])
+
+
+def ingest_inventory_csv(stream, conn, chunk_size=INGEST_CHUNK_SIZE):
+    """Parse, validate and insert an inventory CSV chunk by chunk.
+
+    Only one chunk of parsed rows is held in memory at a time; each chunk is
+    written with one multi-row INSERT, one UPDATE per product and one commit.
+    """
+    reader = csv.DictReader(codecs.getreader("utf-8-sig")(stream))
+    missing = [c for c in REQUIRED_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    report = IngestReport()
+    known = set()
+    chunk = []
+    with closing(conn.cursor()) as cursor:
+        for row in reader:
+            line = reader.line_num
+            try:
+                chunk.append((line, parse_row(row)))
+            except (KeyError, TypeError, ValueError) as e:
+                report.error(line, str(e))
+            if len(chunk) >= chunk_size:
+                _flush(conn, cursor, chunk, report, known)
+                chunk = []
+        if chunk:
+            _flush(conn, cursor, chunk, report, known)
+    return report
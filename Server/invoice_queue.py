@@ -0,0 +1,281 @@
+# Group-commit queue behind /create-invoice
+#
+# Requests are validated and handed to one writer thread, which takes every
+# invoice already queued (up to INVOICE_GROUP_MAX, waiting at most
+# INVOICE_GROUP_WAIT_MS for more) and records the group in one transaction:
+# one locking SELECT over every product in the group, first-expiry-first-out
+# allocation invoice by invoice against those rows, one sales insert and one
+# commit. Each request still waits for its own result, so responses are
+# what they were; under load many invoices share a commit. If the group's
+# transaction fails, each invoice is written again in its own, so one the
+# database rejects doesn't take the rest of the group down with it.
+#
+# Every invoice carries an idempotency key, from the Idempotency-Key header
+# or made up here. A recorded invoice's key and response go into
+# invoice_requests in the same transaction as its sales, so a retry is
+# answered from there instead of selling twice, and a retry arriving while
+# the original is still queued waits for the same result.
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import closing
+from datetime import date, datetime, timedelta, timezone
+
+from allocation import Allocation, allocate, lock_batches, merge_items, notify, write_sale_rows
+from db import db_connection
+
+log = logging.getLogger("smartretail")
+
+INVOICE_QUEUE = os.environ.get("INVOICE_QUEUE", "1") not in ("0", "false")
+INVOICE_GROUP_MAX = int(os.environ.get("INVOICE_GROUP_MAX", 64))
+INVOICE_GROUP_WAIT_MS = float(os.environ.get("INVOICE_GROUP_WAIT_MS", 2))
+INVOICE_WAIT_SECONDS = float(os.environ.get("INVOICE_WAIT_SECONDS", 10))
+# Stored keys older than this are pruned; retries must come sooner
+INVOICE_KEY_TTL_HOURS = float(os.environ.get("INVOICE_KEY_TTL_HOURS", 72))
+PRUNE_INTERVAL = 3600
+RECENT_KEYS = 10_000
+MAX_KEY_LENGTH = 64
+
+RECORDED_SQL = """
+    SELECT idempotency_key, request_hash, response
+    FROM invoice_requests
+    WHERE idempotency_key IN ({placeholders})
+"""
+
+RECORD_SQL = """
+    INSERT INTO invoice_requests (idempotency_key, user_id, request_hash, response, created_at)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+PRUNE_SQL = "DELETE FROM invoice_requests WHERE created_at < %s"
+
+KEY_REUSED = {"error": "Idempotency-Key was already used for a different invoice"}
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def request_hash(user_id, requested):
+    body = json.dumps([str(user_id), sorted(requested.items())])
+    return hashlib.blake2b(body.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class _Pending:
+    __slots__ = ("key", "user_id", "requested", "hash", "queued_at", "done", "result")
+
+    def __init__(self, key, user_id, requested):
+        self.key = key
+        self.user_id = user_id
+        self.requested = requested
+        self.hash = request_hash(user_id, requested)
+        self.queued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+
+
+class InvoiceQueue:
+    def __init__(self, connection=db_connection, group_max=INVOICE_GROUP_MAX, group_wait_ms=INVOICE_GROUP_WAIT_MS,
+                 wait_seconds=INVOICE_WAIT_SECONDS):
+        self._connection = connection
+        self.group_max = group_max
+        self.group_wait = group_wait_ms / 1000
+        self.wait_seconds = wait_seconds
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._recent = OrderedDict()
+        self._thread = None
+        self._pruned_at = 0.0
+        self.groups = 0
+        self.invoices = 0
+        self.replayed = 0
+        self.largest_group = 0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="invoice-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, user_id, items, key=None):
+        """(payload, status) once the invoice is committed, rejected or found already recorded."""
+        key = key or uuid.uuid4().hex
+        if len(key) > MAX_KEY_LENGTH or not key.isprintable():
+            return {"error": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} printable characters"}, 400
+        pending = _Pending(key, user_id, merge_items(items))
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent is not None:
+                self.replayed += 1
+                return (recent[1], 200) if recent[0] == pending.hash else (KEY_REUSED, 422)
+            queued = self._inflight.get(key)
+            if queued is None:
+                self._inflight[key] = pending
+                self._queue.put(pending)
+            elif queued.hash != pending.hash:
+                return KEY_REUSED, 422
+            else:
+                pending = queued
+        self._start()
+        if not pending.done.wait(self.wait_seconds):
+            return {"error": "Invoice is still queued; retry with the same Idempotency-Key", "idempotency_key": key}, 503
+        return pending.result
+
+    def _run(self):
+        while True:
+            group = [self._queue.get()]
+            if group[0] is None:
+                return
+            # Everything already waiting, then whatever arrives within the wait
+            deadline = time.monotonic() + self.group_wait
+            stop = False
+            while len(group) < self.group_max:
+                try:
+                    remaining = deadline - time.monotonic()
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                group.append(item)
+            self._commit(group)
+            if stop:
+                return
+
+    def _attempt(self, group):
+        """(results, allocations, replays) for the group, falling back to one transaction per invoice."""
+        for attempt in (1, 2):
+            try:
+                results, allocation, replays = self._write(group)
+                return results, [allocation], replays
+            except Exception as err:
+                log.warning("invoice group of %d failed (attempt %d): %s", len(group), attempt, err)
+                if len(group) > 1:
+                    break
+                # A deadlock, or a key another worker recorded meanwhile: the
+                # second attempt reads the keys again and sees it
+                error = err
+        if len(group) == 1:
+            return {group[0].key: ({"error": str(error)}, 500)}, [], 0
+        results, allocations, replays = {}, [], 0
+        for p in group:
+            r, a, n = self._attempt([p])
+            results.update(r)
+            allocations.extend(a)
+            replays += n
+        return results, allocations, replays
+
+    def _commit(self, group):
+        results, allocations, replays = self._attempt(group)
+        now = time.perf_counter()
+        with self._lock:
+            for p in group:
+                payload, status = results[p.key]
+                if status == 200:
+                    self._recent[p.key] = (p.hash, payload)
+                    if len(self._recent) > RECENT_KEYS:
+                        self._recent.popitem(last=False)
+                self._inflight.pop(p.key, None)
+                p.result = ({**payload, "latency_ms": round((now - p.queued_at) * 1000, 3)}, status)
+                p.done.set()
+            self.groups += 1
+            self.invoices += len(group)
+            self.replayed += replays
+            self.largest_group = max(self.largest_group, len(group))
+        for allocation in allocations:
+            notify("invoice_queue", allocation)
+        self._prune()
+
+    def _write(self, group):
+        sale_date = date.today()
+        combined = Allocation({})
+        combined.sale_date = sale_date
+        results, rows, records = {}, [], []
+        with self._connection() as conn, closing(conn.cursor()) as cursor:
+            placeholders = ", ".join(["%s"] * len(group))
+            cursor.execute(RECORDED_SQL.format(placeholders=placeholders), [p.key for p in group])
+            recorded = {key: (hash_, json.loads(response)) for key, hash_, response in cursor.fetchall()}
+
+            fresh = [p for p in group if p.key not in recorded]
+            batches = lock_batches(cursor, sorted({pid for p in fresh for pid in p.requested}))
+            # What is left in each locked batch as the group's invoices take from it
+            left = {batch_id: qty for product_batches in batches.values() for batch_id, qty in product_batches}
+            for p in group:
+                if p.key in recorded:
+                    stored_hash, payload = recorded[p.key]
+                    results[p.key] = (payload, 200) if stored_hash == p.hash else (KEY_REUSED, 422)
+                    continue
+                available = {pid: [(b, left[b]) for b, _ in batches.get(pid, ()) if left[b] > 0]
+                             for pid in p.requested}
+                allocation = allocate(available, p.requested)
+                if allocation.shortfall:
+                    product_id = next(iter(allocation.shortfall))
+                    results[p.key] = ({
+                        "error": f"Insufficient stock for product ID {product_id}",
+                        "shortfall": allocation.shortfall,
+                    }, 400)
+                    continue
+                for product_id, batch_id, qty in allocation.lines:
+                    left[batch_id] -= qty
+                    rows.append((p.user_id, product_id, qty, sale_date, batch_id))
+                combined.lines.extend(allocation.lines)
+                combined.left.update((batch_id, left[batch_id]) for _, batch_id, _ in allocation.lines)
+                payload = {"message": "Invoice created successfully", "idempotency_key": p.key}
+                records.append((p.key, p.user_id, p.hash, json.dumps(payload), _utcnow()))
+                results[p.key] = (payload, 200)
+
+            write_sale_rows(cursor, rows)
+            if records:
+                cursor.executemany(RECORD_SQL, records)
+            conn.commit()
+        combined.committed = True
+        return results, combined, len(recorded)
+
+    def _prune(self):
+        if time.monotonic() - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = time.monotonic()
+        try:
+            with self._connection() as conn, closing(conn.cursor()) as cursor:
+                cursor.execute(PRUNE_SQL, (_utcnow() - timedelta(hours=INVOICE_KEY_TTL_HOURS),))
+                conn.commit()
+        except Exception:
+            log.exception("pruning invoice_requests failed")
+
+    def close(self, timeout=10):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def after_fork(self):
+        # The writer thread is not copied into a forked worker; start over empty
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._thread = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": INVOICE_QUEUE,
+                "queued": self._queue.qsize(),
+                "groups": self.groups,
+                "invoices": self.invoices,
+                "mean_group": round(self.invoices / self.groups, 2) if self.groups else 0.0,
+                "largest_group": self.largest_group,
+                "replayed": self.replayed,
+            }
+
+
+invoices = InvoiceQueue()
+atexit.register(invoices.close)
+os.register_at_fork(after_in_child=invoices.after_fork)
@@ -0,0 +1,542 @@
+# In-process stock ledger with a write-behind journal (opt-in via STOCK_LEDGER=1)
+#
+# Sales and batch reductions are checked and applied in memory, made durable
+# by appending to a local journal (one fsync per group of records), and
+# written to MySQL by a background flusher. On start-up any journal records
+# the database hasn't seen are replayed before stock is loaded.
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from array import array
+from collections import defaultdict
+from contextlib import closing
+from datetime import date, datetime
+
+from allocation import allocate, merge_items, notify, reduce_batch, write_sale_rows
+from db import db_connection
+from signals import inventory_changed
+import versions
+
+log = logging.getLogger("smartretail")
+
+STOCK_LEDGER = os.environ.get("STOCK_LEDGER", "").lower() in ("1", "true", "yes")
+STOCK_JOURNAL = os.environ.get("STOCK_JOURNAL", "stock.journal")
+# How long the journal writer lingers to gather a group before fsync
+JOURNAL_GROUP_MS = float(os.environ.get("STOCK_JOURNAL_GROUP_MS", 1))
+# Write-behind cadence and the most records applied per transaction
+FLUSH_INTERVAL = float(os.environ.get("STOCK_FLUSH_INTERVAL", 0.2))
+FLUSH_MAX_RECORDS = 1000
+
+# Also created by migrations/0004; kept so the ledger runs on older schemas
+CHECKPOINT_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS stock_ledger_checkpoint (
+        id TINYINT PRIMARY KEY,
+        seq BIGINT NOT NULL
+    )
+"""
+READ_CHECKPOINT_SQL = "SELECT seq FROM stock_ledger_checkpoint WHERE id = 1"
+WRITE_CHECKPOINT_SQL = "REPLACE INTO stock_ledger_checkpoint (id, seq) VALUES (1, %s)"
+
+LIVE_BATCHES_SQL = """
+    SELECT id, product_id, quantity, expiry_date
+    FROM product_inventory_batches
+    WHERE quantity > 0 AND id > %s
+    ORDER BY product_id, expiry_date, id
+"""
+
+DRIFT_SQL = """
+    SELECT p.id, p.inventory, COALESCE(SUM(b.quantity), 0)
+    FROM products p
+    LEFT JOIN product_inventory_batches b ON b.product_id = p.id
+    GROUP BY p.id, p.inventory
+    HAVING p.inventory <> COALESCE(SUM(b.quantity), 0)
+"""
+
+FIX_DRIFT_SQL = """
+    UPDATE products
+    SET inventory = COALESCE(
+        (SELECT SUM(quantity) FROM product_inventory_batches WHERE product_id = products.id), 0)
+    WHERE id IN ({placeholders})
+"""
+
+BATCH_TOTALS_SQL = """
+    SELECT product_id, SUM(quantity)
+    FROM product_inventory_batches
+    GROUP BY product_id
+"""
+
+
+class LedgerError(RuntimeError):
+    pass
+
+
+def _ordinal(value):
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return value.toordinal()
+
+
+class Journal:
+    """Append-only JSON-lines file with group commit.
+
+    ``append`` only buffers; a writer thread writes whatever has gathered
+    and fsyncs once for the whole group, then wakes everyone in ``wait``.
+    After a failed write the journal refuses records; ``reopen`` cuts the
+    file back to its last durable group and starts a fresh one.
+    """
+
+    def __init__(self, path, group_ms=JOURNAL_GROUP_MS, durable_seq=0):
+        self.path = path
+        self.group_ms = group_ms
+        self._file = open(path, "ab")
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._buffer = []
+        self._last_seq = durable_seq
+        self.durable_seq = durable_seq
+        self.durable_bytes = self._file.tell()
+        self.failed = None
+        self.groups = 0
+        self.records = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="stock-journal", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def read(path):
+        # Stops at the first torn line; those records were never acknowledged
+        records = []
+        if not os.path.exists(path):
+            return records
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+        return records
+
+    def append(self, record):
+        with self._cond:
+            if self.failed:
+                raise LedgerError(f"journal unavailable: {self.failed}")
+            self._buffer.append(record)
+            self._last_seq = record["seq"]
+            self._cond.notify_all()
+
+    def wait(self, seq):
+        with self._cond:
+            while self.durable_seq < seq and not self.failed:
+                self._cond.wait()
+            if self.durable_seq < seq:
+                raise LedgerError(f"journal write failed: {self.failed}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if not self._buffer:
+                    return
+            if self.group_ms:
+                time.sleep(self.group_ms / 1000)
+            with self._cond:
+                group, self._buffer = self._buffer, []
+            try:
+                with self._io_lock:
+                    self._file.write(b"".join(json.dumps(r, separators=(",", ":")).encode() + b"\n" for r in group))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+            except OSError as e:
+                with self._cond:
+                    self.failed = str(e)
+                    self._cond.notify_all()
+                log.exception("stock journal write failed")
+                return
+            with self._cond:
+                self.durable_seq = group[-1]["seq"]
+                self.durable_bytes = self._file.tell()
+                self.groups += 1
+                self.records += len(group)
+                self._cond.notify_all()
+
+    def truncate_if_applied(self, applied_seq):
+        # Only when nothing newer is buffered or being written
+        with self._io_lock, self._cond:
+            if not self._buffer and self.durable_seq == self._last_seq == applied_seq:
+                self._file.truncate(0)
+                self._file.seek(0)
+                return True
+        return False
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        self._file.close()
+
+    def reopen(self):
+        """A new journal continuing this failed one; a torn or unsynced group is dropped."""
+        self.close()
+        os.truncate(self.path, self.durable_bytes)
+        return Journal(self.path, group_ms=self.group_ms, durable_seq=self.durable_seq)
+
+
+class StockLedger:
+    """Per-product FEFO batch quantities held in memory.
+
+    Each product keeps parallel arrays of batch ids, expiry ordinals and
+    quantities in (expiry_date, id) order, so availability is a dict lookup
+    and an allocation walks a few array slots under one lock. Journal
+    records look like::
+
+        {"seq": 7, "type": "sale", "user_id": 3, "date": "2025-01-31", "lines": [[pid, batch_id, qty], ...]}
+        {"seq": 8, "type": "reduce", "product_id": 4, "batch_id": 12, "quantity": 5, "delete": false}
+    """
+
+    def __init__(self, journal_path=STOCK_JOURNAL, connection=db_connection, flush_interval=FLUSH_INTERVAL,
+                 group_ms=JOURNAL_GROUP_MS):
+        self.journal_path = journal_path
+        self.flush_interval = flush_interval
+        self.group_ms = group_ms
+        self._connection = connection
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._ids = {}
+        self._expiry = {}
+        self._qty = {}
+        self._totals = defaultdict(int)
+        self._product_of = {}
+        self._max_batch_id = 0
+        self._seq = 0
+        self._unapplied = []
+        self.applied_seq = 0
+        self.replayed = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.journal_reopens = 0
+        self.journal = None
+        self._stop = threading.Event()
+        self._flusher = None
+
+    # Start-up
+
+    def start(self):
+        records = Journal.read(self.journal_path)
+        with self._connection() as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(CHECKPOINT_TABLE_SQL)
+            cursor.execute(READ_CHECKPOINT_SQL)
+            row = cursor.fetchone()
+            checkpoint = row[0] if row else 0
+            pending = [r for r in records if r["seq"] > checkpoint]
+            for i in range(0, len(pending), FLUSH_MAX_RECORDS):
+                chunk = pending[i:i + FLUSH_MAX_RECORDS]
+                self._apply(cursor, chunk)
+                cursor.execute(WRITE_CHECKPOINT_SQL, (chunk[-1]["seq"],))
+                conn.commit()
+            self.replayed = len(pending)
+            self._seq = self.applied_seq = max([checkpoint] + [r["seq"] for r in records])
+            self._load(cursor)
+        if self.replayed:
+            log.warning("stock ledger replayed %d journal records", self.replayed)
+        # Everything in the old journal is now in the database
+        open(self.journal_path, "wb").close()
+        self.journal = Journal(self.journal_path, group_ms=self.group_ms)
+        self._flusher = threading.Thread(target=self._flush_loop, name="stock-flusher", daemon=True)
+        self._flusher.start()
+        inventory_changed.connect(self.on_inventory_changed)
+        atexit.register(self.close)
+        return self
+
+    def _load(self, cursor, after=0):
+        cursor.execute(LIVE_BATCHES_SQL, (after,))
+        for batch_id, product_id, quantity, expiry_date in cursor.fetchall():
+            self._max_batch_id = max(self._max_batch_id, batch_id)
+            if batch_id not in self._product_of:
+                self._insert(product_id, batch_id, _ordinal(expiry_date), int(quantity))
+
+    def _insert(self, product_id, batch_id, ordinal, quantity):
+        ids = self._ids.get(product_id)
+        if ids is None:
+            ids = self._ids[product_id] = array("q")
+            self._expiry[product_id] = array("l")
+            self._qty[product_id] = array("q")
+        expiry = self._expiry[product_id]
+        at = len(ids)
+        while at and (expiry[at - 1], ids[at - 1]) > (ordinal, batch_id):
+            at -= 1
+        ids.insert(at, batch_id)
+        expiry.insert(at, ordinal)
+        self._qty[product_id].insert(at, quantity)
+        self._totals[product_id] += quantity
+        self._product_of[batch_id] = product_id
+
+    def _take(self, product_id, batch_id, quantity):
+        ids = self._ids[product_id]
+        at = ids.index(batch_id)
+        ordinal = self._expiry[product_id][at]
+        qty = self._qty[product_id]
+        qty[at] -= quantity
+        self._totals[product_id] -= quantity
+        if qty[at] <= 0:
+            del ids[at], self._expiry[product_id][at], qty[at]
+            del self._product_of[batch_id]
+        return ordinal
+
+    def _give(self, product_id, batch_id, ordinal, quantity):
+        if batch_id in self._product_of:
+            self._qty[product_id][self._ids[product_id].index(batch_id)] += quantity
+            self._totals[product_id] += quantity
+        else:
+            self._insert(product_id, batch_id, ordinal, quantity)
+
+    # Stock operations
+
+    def available(self, product_ids):
+        with self._lock:
+            return {pid: self._totals.get(pid, 0) for pid in product_ids}
+
+    def _record(self, record):
+        # Returns the journal to wait on; it may be replaced once this lock is released
+        if self.journal.failed:
+            self._reopen_journal()
+        self._seq += 1
+        record["seq"] = self._seq
+        self.journal.append(record)
+        self._unapplied.append(record)
+        return self.journal
+
+    def _reopen_journal(self):
+        failed = self.journal.failed
+        try:
+            journal = self.journal.reopen()
+        except OSError as e:
+            raise LedgerError(f"journal unavailable: {e}") from e
+        # Records the old journal lost are being undone by their callers; the
+        # new one's durable_seq will pass theirs, so keep flush() off them now
+        self._unapplied[:] = [r for r in self._unapplied if r["seq"] <= journal.durable_seq]
+        self.journal = journal
+        self.journal_reopens += 1
+        log.warning("stock journal reopened after a failed write (%s)", failed)
+
+    def _undo(self, record, taken):
+        # The record never became durable, so neither did the change
+        with self._lock:
+            if record in self._unapplied:
+                self._unapplied.remove(record)
+            for product_id, batch_id, quantity, ordinal in taken:
+                self._give(product_id, batch_id, ordinal, quantity)
+
+    def allocate(self, user_id, items, partial=False, sale_date=None):
+        """Same contract as allocation.allocate_fefo, without a database round trip."""
+        start = time.perf_counter()
+        requested = merge_items(items)
+        record = None
+        with self._lock:
+            batches = {
+                pid: list(zip(self._ids[pid], self._qty[pid])) for pid in requested if pid in self._ids
+            }
+            allocation = allocate(batches, requested)
+            allocation.sale_date = sale_date or date.today()
+            if allocation.lines and (partial or not allocation.shortfall):
+                if any(qty <= 0 for _, _, qty in allocation.lines):
+                    raise LedgerError("sale quantities must be positive")
+                record = {"type": "sale", "user_id": user_id, "date": allocation.sale_date.isoformat(),
+                          "lines": allocation.lines}
+                journal = self._record(record)
+                taken = [(product_id, batch_id, qty, self._take(product_id, batch_id, qty))
+                         for product_id, batch_id, qty in allocation.lines]
+        if record is not None:
+            try:
+                journal.wait(record["seq"])
+            except LedgerError:
+                self._undo(record, taken)
+                raise
+            allocation.committed = True
+        allocation.latency_ms = round((time.perf_counter() - start) * 1000, 3)
+        notify("ledger", allocation)
+        return allocation
+
+    def reduce(self, batch_id, quantity):
+        """Take ``quantity`` off a batch; returns (op, product_id) like /inventory/reduce."""
+        if quantity <= 0:
+            # The journal only ever holds decrements (see _apply)
+            raise LedgerError("quantity to reduce must be positive")
+        with self._lock:
+            product_id = self._product_of.get(batch_id)
+            if product_id is None:
+                raise KeyError(batch_id)
+            current = self._qty[product_id][self._ids[product_id].index(batch_id)]
+            if quantity > current:
+                raise ValueError("Not enough quantity to reduce")
+            op = "delete" if quantity == current else "update"
+            record = {"type": "reduce", "product_id": product_id, "batch_id": batch_id,
+                      "quantity": quantity, "delete": op == "delete"}
+            journal = self._record(record)
+            ordinal = self._take(product_id, batch_id, quantity)
+        try:
+            journal.wait(record["seq"])
+        except LedgerError:
+            self._undo(record, [(product_id, batch_id, quantity, ordinal)])
+            raise
+        inventory_changed.send("ledger", changes=[
+            {"op": op, "product_id": product_id, "batch_id": batch_id, "delta": -quantity,
+             "quantity": current - quantity}
+        ])
+        return op, product_id
+
+    # Write-behind
+
+    def _apply(self, cursor, records):
+        # Every change is a decrement, so the group can go out as one sales insert
+        sales = []
+        for record in records:
+            if record["type"] == "sale":
+                sale_date = date.fromisoformat(record["date"])
+                sales.extend((record["user_id"], pid, qty, sale_date, batch_id) for pid, batch_id, qty in record["lines"])
+            else:
+                reduce_batch(cursor, record["product_id"], record["batch_id"], record["quantity"],
+                             delete=record["delete"])
+        write_sale_rows(cursor, sales)
+
+    def flush(self):
+        with self._flush_lock:
+            durable = self.journal.durable_seq
+            with self._lock:
+                ready = [r for r in self._unapplied[:FLUSH_MAX_RECORDS] if r["seq"] <= durable]
+            if not ready:
+                return 0
+            with self._connection() as conn, closing(conn.cursor()) as cursor:
+                self._apply(cursor, ready)
+                cursor.execute(WRITE_CHECKPOINT_SQL, (ready[-1]["seq"],))
+                conn.commit()
+            # Readers of the tables (not the ledger) see these changes only now
+            versions.bump("inventory", "sales")
+            with self._lock:
+                del self._unapplied[:len(ready)]
+                self.applied_seq = ready[-1]["seq"]
+            self.flushes += 1
+            self.journal.truncate_if_applied(self.applied_seq)
+            return len(ready)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                while self.flush() == FLUSH_MAX_RECORDS:
+                    pass
+            except Exception:
+                self.flush_errors += 1
+                log.exception("stock ledger flush failed; will retry")
+
+    def drain(self, timeout=10):
+        deadline = time.monotonic() + timeout
+        while self._unapplied and time.monotonic() < deadline:
+            if not self.flush():
+                time.sleep(0.005)
+        return not self._unapplied
+
+    def close(self):
+        if self.journal is None or self._stop.is_set():
+            return
+        self._stop.set()
+        try:
+            self.drain()
+        except Exception:
+            log.exception("stock ledger could not drain; the journal will be replayed on start-up")
+        self.journal.close()
+
+    # Changes this process makes outside the ledger (new batches, CSV uploads,
+    # deleted products). Signals don't cross processes, hence a single worker.
+
+    def on_inventory_changed(self, sender, changes):
+        if sender == "ledger":
+            return
+        fetch = False
+        with self._lock:
+            for change in changes:
+                batch_id = change["batch_id"]
+                if change["op"] == "add":
+                    if batch_id is None or not change.get("expiry_date"):
+                        fetch = True
+                    elif batch_id not in self._product_of:
+                        self._insert(change["product_id"], batch_id, _ordinal(change["expiry_date"]),
+                                     change["delta"])
+                elif batch_id in self._product_of:
+                    product_id = self._product_of[batch_id]
+                    if change["op"] == "delete":
+                        current = self._qty[product_id][self._ids[product_id].index(batch_id)]
+                        self._take(product_id, batch_id, current)
+                    else:
+                        self._take(product_id, batch_id, -change["delta"])
+        if fetch:
+            # Bulk inserts don't report ids, but new batches have larger ones
+            with self._connection() as conn, closing(conn.cursor()) as cursor, self._lock:
+                self._load(cursor, after=self._max_batch_id)
+
+    # Checks
+
+    def verify(self):
+        """Compare in-memory totals with the batch table once the journal is applied."""
+        self.drain()
+        with self._connection() as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(BATCH_TOTALS_SQL)
+            stored = {pid: int(qty or 0) for pid, qty in cursor.fetchall()}
+        with self._lock:
+            live = {pid: total for pid, total in self._totals.items() if total}
+        return [
+            {"product_id": pid, "ledger": live.get(pid, 0), "batches": stored.get(pid, 0)}
+            for pid in sorted(set(live) | set(stored)) if live.get(pid, 0) != stored.get(pid, 0)
+        ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "products": len(self._ids),
+                "batches": len(self._product_of),
+                "seq": self._seq,
+                "durable_seq": self.journal.durable_seq if self.journal else None,
+                "applied_seq": self.applied_seq,
+                "unapplied": len(self._unapplied),
+                "journal_groups": self.journal.groups if self.journal else 0,
+                "journal_records": self.journal.records if self.journal else 0,
+                "replayed_on_start": self.replayed,
+                "flushes": self.flushes,
+                "flush_errors": self.flush_errors,
+                "journal_failed": self.journal.failed if self.journal else None,
+                "journal_reopens": self.journal_reopens,
+            }
+
+
+def reconcile(conn, fix=False):
+    """products.inventory vs the summed batches; with ``fix`` the batches win."""
+    with closing(conn.cursor()) as cursor:
+        cursor.execute(DRIFT_SQL)
+        drift = [{"product_id": pid, "inventory": int(inv or 0), "batches": int(total)}
+                 for pid, inv, total in cursor.fetchall()]
+        if fix and drift:
+            ids = [d["product_id"] for d in drift]
+            cursor.execute(FIX_DRIFT_SQL.format(placeholders=", ".join(["%s"] * len(ids))), ids)
+            conn.commit()
+    return {"drifted": len(drift), "fixed": bool(fix and drift), "products": drift}
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger():
+    """The process-wide ledger, started on first use; None unless STOCK_LEDGER is set."""
+    global _ledger
+    if not STOCK_LEDGER:
+        return None
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                _ledger = StockLedger().start()
+    return _ledger
@@ -0,0 +1,196 @@
+# Keyset-paginated and streamed listings for /products and /inventory
+import base64
+import json
+from contextlib import ExitStack, closing
+from datetime import date, datetime, timedelta
+
+import http_cache
+from replicas import read_connection
+
+MAX_PAGE = 1000
+STREAM_BATCH = 500
+
+
+class ListingError(ValueError):
+    pass
+
+
+class Listing:
+    """A projectable, filterable, keyset-ordered SELECT.
+
+    ``fields`` maps public names to SQL expressions; ``order`` lists the public
+    names that form the keyset (the last one must be unique).
+    """
+
+    def __init__(self, source, fields, default_fields, order, filters):
+        self.source = source
+        self.fields = fields
+        self.default_fields = default_fields
+        self.order = order
+        self.filters = filters
+
+    def build(self, args, cursor=None, limit=None):
+        names = [f.strip() for f in args.get("fields", "").split(",") if f.strip()] or list(self.default_fields)
+        unknown = [n for n in names if n not in self.fields]
+        if unknown:
+            raise ListingError(f"Unknown fields: {', '.join(unknown)}")
+        # Keyset columns ride along so the next cursor can be built, then get dropped
+        hidden = [k for k in self.order if k not in names]
+        select = ", ".join(f"{self.fields[n]} AS {n}" for n in names + hidden)
+
+        where, params = [], []
+        for arg, (clause, convert) in self.filters.items():
+            value = args.get(arg)
+            if value not in (None, ""):
+                try:
+                    converted = convert(value)
+                except (TypeError, ValueError):
+                    raise ListingError(f"Invalid value for {arg}: {value!r}")
+                where.append(clause)
+                params.extend(converted if isinstance(converted, tuple) else (converted,))
+
+        if cursor is not None:
+            keys = decode_cursor(cursor)
+            if len(keys) != len(self.order):
+                raise ListingError("Invalid cursor")
+            columns = ", ".join(self.fields[k] for k in self.order)
+            where.append(f"({columns}) > ({', '.join(['%s'] * len(keys))})")
+            params.extend(keys)
+
+        sql = f"SELECT {select} FROM {self.source}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY " + ", ".join(self.fields[k] for k in self.order)
+        if limit is not None:
+            sql += " LIMIT %s"
+            params.append(limit + 1)
+        return sql, params, names, hidden
+
+
+def _day(value):
+    return date.fromisoformat(value)
+
+
+def _within(value):
+    return date.today() + timedelta(days=int(value))
+
+
+PRODUCTS = Listing(
+    source="products p",
+    fields={
+        "id": "p.id",
+        "name": "p.name",
+        "category_id": "p.category_id",
+        "price": "p.price",
+        "inventory": "p.inventory",
+    },
+    default_fields=("id", "name", "category_id", "price", "inventory"),
+    order=("id",),
+    filters={
+        "category_id": ("p.category_id = %s", int),
+        "category": ("p.category_id IN (SELECT id FROM categories WHERE name = %s)", str),
+    },
+)
+
+INVENTORY = Listing(
+    source="""product_inventory_batches b
+        JOIN products p ON b.product_id = p.id
+        JOIN categories c ON p.category_id = c.id""",
+    fields={
+        "batch_id": "b.id",
+        "product_id": "b.product_id",
+        "product_name": "p.name",
+        "category": "c.name",
+        "quantity": "b.quantity",
+        "expiry_date": "b.expiry_date",
+        "supplier_name": "b.supplier_name",
+        "order_date": "b.order_date",
+        "delivery_date": "b.delivery_date",
+    },
+    default_fields=("batch_id", "product_name", "category", "quantity", "expiry_date", "supplier_name"),
+    order=("expiry_date", "batch_id"),
+    filters={
+        "product_id": ("b.product_id = %s", int),
+        "category_id": ("p.category_id = %s", int),
+        "category": ("c.name = %s", str),
+        "supplier": ("b.supplier_name = %s", str),
+        "expiring_after": ("b.expiry_date >= %s", _day),
+        "expiring_before": ("b.expiry_date <= %s", _day),
+        "expiring_within": ("b.expiry_date <= %s", _within),
+        "in_stock": ("b.quantity > %s", lambda v: 0 if v in ("1", "true") else -1),
+    },
+)
+
+
+def encode_cursor(keys):
+    raw = json.dumps([k.isoformat() if isinstance(k, (date, datetime)) else k for k in keys])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return json.loads(raw)
+    except (ValueError, TypeError):
+        raise ListingError("Invalid cursor")
+
+
+def dumps(value):
+    # Same representations Flask's jsonify uses, so streamed rows look identical
+    return http_cache.dumps(value)
+
+
+def _strip(row, hidden):
+    for key in hidden:
+        row.pop(key, None)
+    return row
+
+
+def page(listing, args):
+    limit = min(max(int(args.get("limit", 100)), 1), MAX_PAGE)
+    sql, params, names, hidden = listing.build(args, cursor=args.get("cursor"), limit=limit)
+    with read_connection() as conn, closing(conn.cursor(dictionary=True)) as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][k] for k in listing.order])
+    return {"items": [_strip(row, hidden) for row in rows], "next_cursor": next_cursor}
+
+
+def stream(listing, args, ndjson=False):
+    """Run the listing on an unbuffered cursor and return (chunks, close).
+
+    The query is executed before returning so errors still surface as a
+    normal error response; rows are then fetched in batches while the body
+    is written. ``close`` must be called when the response finishes.
+    """
+    sql, params, names, hidden = listing.build(args, cursor=args.get("cursor"))
+    stack = ExitStack()
+    try:
+        conn = stack.enter_context(read_connection())
+        cursor = stack.enter_context(closing(conn.cursor(dictionary=True, buffered=False)))
+        cursor.execute(sql, params)
+    except BaseException:
+        stack.close()
+        raise
+
+    def generate():
+        if not ndjson:
+            yield "["
+        first = True
+        while True:
+            rows = cursor.fetchmany(STREAM_BATCH)
+            if not rows:
+                break
+            encoded = [dumps(_strip(row, hidden)) for row in rows]
+            if ndjson:
+                yield "\n".join(encoded) + "\n"
+            else:
+                yield ("" if first else ",") + ",".join(encoded)
+            first = False
+        if not ndjson:
+            yield "]\n"
+
+    return generate(), stack.close
@@ -0,0 +1,256 @@
+# Request, query, pool and inference timings in Prometheus text format (/metrics)
+#
+# Histograms are plain bucket counters behind one lock per family, so an
+# observation is a bisect and two additions. Database statements are timed by
+# wrapping each pooled connection once (db.get_db_connection) and labelled
+# by a normalized template: runs of placeholders in IN lists, multi-row
+# VALUES and CASE arms collapse, so a statement has one series whatever its
+# batch size. Set METRICS=0 to turn all of it off, SLOW_QUERY_MS to log
+# statements slower than that.
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+
+METRICS = os.environ.get("METRICS", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 0))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Templates are cached per raw SQL string; a flood of distinct statements
+# just restarts the cache
+TEMPLATE_CACHE_SIZE = 4096
+TEMPLATE_MAX_LENGTH = 300
+
+slow_log = logging.getLogger("smartretail.slow_query")
+
+# Route template of the request being served, for the slow-query log
+current_route = contextvars.ContextVar("current_route", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (+Inf last), then sum
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def collect(self):
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_labels(self.labels, labels)} {_number(value)}" for labels, value in snapshot)
+        return lines
+
+
+REQUEST_SECONDS = Histogram("smartretail_http_request_duration_seconds",
+                            "Time from request start until the response headers are ready",
+                            ("method", "route", "status"))
+QUERY_SECONDS = Histogram("smartretail_db_query_duration_seconds", "Statement execute time by template",
+                          ("template",))
+QUERY_ROWS = Counter("smartretail_db_query_rows_total", "Rows fetched or affected by template", ("template",))
+POOL_ACQUIRE_SECONDS = Histogram("smartretail_db_pool_acquire_seconds",
+                                 "Time to get a connection from the pool, including connect and ping")
+INFERENCE_SECONDS = Histogram("smartretail_model_inference_seconds", "Model predict call time", ("model",))
+INFERENCE_ROWS = Counter("smartretail_model_inference_rows_total", "Rows passed to model predict calls",
+                         ("model",))
+
+FAMILIES = [REQUEST_SECONDS, QUERY_SECONDS, QUERY_ROWS, POOL_ACQUIRE_SECONDS, INFERENCE_SECONDS, INFERENCE_ROWS]
+
+
+def render(gauges=None):
+    """Every family in the text exposition format; ``gauges`` maps name -> (help, value)."""
+    lines = []
+    for family in FAMILIES:
+        lines.extend(family.collect())
+    for name, (help, value) in (gauges or {}).items():
+        lines.extend([f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {_number(value)}"])
+    return "\n".join(lines) + "\n"
+
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER = re.compile(r"(?<![\w%])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RUN = re.compile(r"%s(?:\s*,\s*%s)+")
+_ROW_RUN = re.compile(r"\((%s(?:, \.\.\.)?)\)(?:\s*,\s*\(\1\))+")
+_CASE_RUN = re.compile(r"(WHEN %s THEN %s)(?:\s+WHEN %s THEN %s)+", re.IGNORECASE)
+
+_READS = {"SELECT", "WITH", "SHOW", "EXPLAIN"}
+
+_templates = {}
+
+
+def template(sql):
+    """(normalized template, is_select) for a statement."""
+    cached = _templates.get(sql)
+    if cached is not None:
+        return cached
+    text = _WHITESPACE.sub(" ", sql).strip()
+    text = _STRING.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _PLACEHOLDER_RUN.sub("%s, ...", text)
+    text = _ROW_RUN.sub(r"(\1), ...", text)
+    text = _CASE_RUN.sub(r"\1 ...", text)
+    if len(text) > TEMPLATE_MAX_LENGTH:
+        text = text[:TEMPLATE_MAX_LENGTH - 3] + "..."
+    result = (text, text.lstrip("( ").split(" ", 1)[0].upper() in _READS)
+    if len(_templates) >= TEMPLATE_CACHE_SIZE:
+        _templates.clear()
+    _templates[sql] = result
+    return result
+
+
+def _slow(elapsed, name):
+    slow_log.warning("%.1f ms route=%s %s", elapsed * 1000, current_route.get() or "-", name)
+
+
+class InstrumentedCursor:
+    """Times execute/executemany and counts rows per statement template."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._template = None
+        self._rows = 0
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _flush(self):
+        if self._template is not None and self._rows:
+            QUERY_ROWS.inc(self._rows, self._template)
+        self._template = None
+        self._rows = 0
+
+    def _timed(self, method, sql, params):
+        self._flush()
+        name, is_select = template(sql)
+        start = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            elapsed = time.perf_counter() - start
+            QUERY_SECONDS.observe(elapsed, name)
+            if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+                _slow(elapsed, name)
+            self._template = name
+            if not is_select:
+                self._rows = max(self._cursor.rowcount or 0, 0)
+
+    def execute(self, sql, params=None):
+        return self._timed(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, seq_params):
+        return self._timed(self._cursor.executemany, sql, seq_params)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._flush()
+        return self._cursor.close()
+
+
+class InstrumentedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+
+def instrument(conn):
+    return InstrumentedConnection(conn) if METRICS else conn
+
+
+def observe_inference(model, rows, elapsed):
+    if METRICS:
+        name = type(model).__name__
+        INFERENCE_SECONDS.observe(elapsed, name)
+        INFERENCE_ROWS.inc(rows, name)
+
+
+def observe_acquire(elapsed):
+    if METRICS:
+        POOL_ACQUIRE_SECONDS.observe(elapsed)
+
+
+def observe_request(method, route, status, elapsed):
+    if METRICS:
+        REQUEST_SECONDS.observe(elapsed, method, route, str(status))
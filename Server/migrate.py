@@ -0,0 +1,130 @@
+# Versioned schema migrations for the smartretail database
+#
+#   python migrate.py status
+#   python migrate.py up [--to VERSION]
+#
+# Migrations are migrations/NNNN_name.sql, applied in order and recorded in
+# schema_migrations with a checksum, so an edited migration that already ran
+# is reported instead of silently diverging. MySQL commits DDL implicitly, so
+# each file is recorded as soon as its statements have run; keep one
+# concern per file so a failure leaves an obvious place to resume.
+import argparse
+import hashlib
+import os
+import re
+import sys
+from contextlib import closing
+
+import mysql.connector
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+SCHEMA_MIGRATIONS_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        checksum CHAR(64) NOT NULL,
+        applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+_FILENAME = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+        with open(path, encoding="utf-8") as f:
+            self.text = f.read()
+        self.checksum = hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+
+    def statements(self):
+        # Statements end with ';' at the end of a line; '--' lines are comments
+        body = "\n".join(line for line in self.text.splitlines() if not line.lstrip().startswith("--"))
+        return [s.strip() for s in re.split(r";\s*$", body, flags=re.MULTILINE) if s.strip()]
+
+
+def discover(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _FILENAME.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise MigrationError("Duplicate migration version in " + directory)
+    return migrations
+
+
+def applied(conn):
+    with closing(conn.cursor()) as cursor:
+        cursor.execute(SCHEMA_MIGRATIONS_SQL)
+        cursor.execute("SELECT version, checksum FROM schema_migrations")
+        return dict(cursor.fetchall())
+
+
+def status(conn, migrations=None):
+    migrations = migrations if migrations is not None else discover()
+    done = applied(conn)
+    return [{
+        "version": m.version,
+        "name": m.name,
+        "state": "pending" if m.version not in done else
+                 "applied" if done[m.version] == m.checksum else "modified",
+    } for m in migrations]
+
+
+def up(conn, target=None, migrations=None):
+    """Apply pending migrations up to ``target``; returns the versions applied."""
+    migrations = migrations if migrations is not None else discover()
+    done = applied(conn)
+    modified = [m.version for m in migrations if m.version in done and done[m.version] != m.checksum]
+    if modified:
+        raise MigrationError(f"Applied migrations changed on disk: {modified}; add a new migration instead")
+    ran = []
+    with closing(conn.cursor()) as cursor:
+        for m in migrations:
+            if m.version in done or (target is not None and m.version > target):
+                continue
+            for statement in m.statements():
+                try:
+                    cursor.execute(statement)
+                except mysql.connector.Error as err:
+                    raise MigrationError(f"{m.version:04d}_{m.name} failed: {err}") from err
+            cursor.execute("INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                           (m.version, m.name, m.checksum))
+            conn.commit()
+            ran.append(m.version)
+    return ran
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["status", "up"])
+    parser.add_argument("--to", type=int, help="stop after this version")
+    args = parser.parse_args()
+
+    from db import DB_BACKEND, get_db_connection
+    if DB_BACKEND != "mysql":
+        # The stand-in builds its schema from sqlite_backend.SCHEMA
+        sys.exit("Migrations target MySQL; DB_BACKEND=sqlite creates its schema itself")
+    try:
+        with closing(get_db_connection()) as conn:
+            if args.command == "status":
+                for row in status(conn):
+                    print(f"{row['version']:04d} {row['name']:<32} {row['state']}")
+            else:
+                ran = up(conn, target=args.to)
+                print(f"Applied {len(ran)} migration(s)" + (f": {ran}" if ran else ""))
+    except (mysql.connector.Error, MigrationError) as err:
+        sys.exit(str(err))
+
+
+if __name__ == "__main__":
+    main()
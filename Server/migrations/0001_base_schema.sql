@@ -0,0 +1,35 @@
+-- Tables the app has always expected; IF NOT EXISTS so databases created
+-- by hand before migrations existed are adopted as they are.
+
+CREATE TABLE IF NOT EXISTS categories (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS products (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    category_id INT,
+    price DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    inventory INT NOT NULL DEFAULT 0,
+    KEY idx_products_category (category_id)
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS product_inventory_batches (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    product_id INT NOT NULL,
+    quantity INT NOT NULL,
+    expiry_date DATE,
+    supplier_name VARCHAR(255),
+    order_date DATE,
+    delivery_date DATE
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS sales (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT,
+    product_id INT NOT NULL,
+    quantity INT NOT NULL,
+    sale_date DATE NOT NULL,
+    batch_id INT
+) ENGINE=InnoDB;
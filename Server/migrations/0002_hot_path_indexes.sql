@@ -0,0 +1,17 @@
+-- FEFO allocation and /inventory/<id>: WHERE product_id [IN] ... AND quantity > 0
+-- ORDER BY expiry_date, id. Covers the locking read, so it walks the index
+-- in order instead of sorting.
+ALTER TABLE product_inventory_batches
+    ADD INDEX idx_batches_product_expiry (product_id, expiry_date, id, quantity);
+
+-- /inventory keyset pages ordered by (expiry_date, id) and the expiry index
+ALTER TABLE product_inventory_batches
+    ADD INDEX idx_batches_expiry (expiry_date, id);
+
+-- Rolling sales window (sales_index.py): range on sale_date, covering
+ALTER TABLE sales
+    ADD INDEX idx_sales_date_product (sale_date, product_id, quantity);
+
+-- Per-product totals for /analytics, read from the index alone
+ALTER TABLE sales
+    ADD INDEX idx_sales_product (product_id, quantity);
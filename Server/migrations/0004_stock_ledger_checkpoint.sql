@@ -0,0 +1,5 @@
+-- Journal position the stock ledger has applied up to (ledger.py)
+CREATE TABLE IF NOT EXISTS stock_ledger_checkpoint (
+    id TINYINT PRIMARY KEY,
+    seq BIGINT NOT NULL
+) ENGINE=InnoDB;
@@ -0,0 +1,21 @@
+-- Per-product sales per day and per ISO week (Monday week_start), kept
+-- current by the sale write path and rebuilt by "python rollups.py backfill"
+CREATE TABLE IF NOT EXISTS sales_daily (
+    product_id INT NOT NULL,
+    sale_date DATE NOT NULL,
+    quantity INT NOT NULL DEFAULT 0,
+    line_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (product_id, sale_date),
+    KEY idx_sales_daily_date (sale_date, product_id)
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS sales_weekly (
+    product_id INT NOT NULL,
+    week_start DATE NOT NULL,
+    iso_year SMALLINT NOT NULL,
+    iso_week TINYINT NOT NULL,
+    quantity INT NOT NULL DEFAULT 0,
+    line_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (product_id, week_start),
+    KEY idx_sales_weekly_week (week_start, product_id)
+) ENGINE=InnoDB;
@@ -0,0 +1,11 @@
+-- Idempotency keys of recorded invoices (invoice_queue.py), written in the
+-- same transaction as the invoice's sales so a retried POST is answered
+-- from here instead of selling twice. Pruned after INVOICE_KEY_TTL_HOURS.
+CREATE TABLE IF NOT EXISTS invoice_requests (
+    idempotency_key VARCHAR(64) PRIMARY KEY,
+    user_id INT,
+    request_hash CHAR(16) NOT NULL,
+    response TEXT NOT NULL,
+    created_at DATETIME NOT NULL,
+    KEY idx_invoice_requests_created (created_at)
+) ENGINE=InnoDB;
@@ -0,0 +1,9 @@
+-- Heartbeat for replica lag (replicas.py): the app stamps beat on the
+-- primary every REPLICA_HEARTBEAT seconds and reads it back from each
+-- replica, so a replica showing T has applied everything committed before T.
+CREATE TABLE IF NOT EXISTS replication_heartbeat (
+    id TINYINT PRIMARY KEY,
+    beat DOUBLE NOT NULL
+) ENGINE=InnoDB;
+
+INSERT IGNORE INTO replication_heartbeat (id, beat) VALUES (1, 0);
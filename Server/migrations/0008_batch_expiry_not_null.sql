@@ -0,0 +1,10 @@
+-- /inventory keyset pages continue after (expiry_date, id) > (%s, %s), which
+-- is never true for a NULL expiry, so a page ending on one stopped the
+-- listing (and the stock ledger can't place such a batch). Batches stored
+-- without a date are treated as not perishable and sort after every other.
+UPDATE product_inventory_batches
+SET expiry_date = '9999-12-31'
+WHERE expiry_date IS NULL;
+
+ALTER TABLE product_inventory_batches
+    MODIFY expiry_date DATE NOT NULL;
@@ -0,0 +1,226 @@
+# Lazily loaded, hot-swappable demand models
+#
+# joblib and numpy (and sklearn, through the pickles) are imported with the
+# first model loaded, not with this module.
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger("smartretail")
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# name -> artifact, relative to MODEL_DIR. "bundle" follows models/LATEST as
+# written by train_model.py.
+MODELS = {
+    "default": "model.pkl",
+    "weekly": "weekly_model.pkl",
+    "monthly": "monthly_model.pkl",
+    "weekly_sales": "weekly_sales_model.pkl",
+    "bundle": os.path.join("models", "LATEST"),
+    "keras": "sales_prediction_model.h5",
+}
+DEFAULT_MODEL = os.environ.get("DEFAULT_MODEL", "default")
+# How often a served model's file is stat()ed for changes
+MODEL_CHECK_INTERVAL = float(os.environ.get("MODEL_CHECK_INTERVAL", 5))
+# Artifacts above this size are memory-mapped instead of read into the heap
+MMAP_THRESHOLD = int(os.environ.get("MODEL_MMAP_THRESHOLD", 1 << 20))
+
+
+class ScaledModel:
+    """weekly_model.pkl was fitted on scaler.pkl output; apply both."""
+
+    def __init__(self, scaler, model):
+        self.scaler = scaler
+        self.model = model
+        self.feature_names_in_ = scaler.feature_names_in_
+
+    def predict(self, X):
+        import numpy as np
+        return self.model.predict(self.scaler.transform(np.asarray(X, dtype=np.float64)))
+
+
+class KerasModel:
+    def __init__(self, model):
+        self.model = model
+
+    def predict(self, X):
+        import numpy as np
+        return np.asarray(self.model.predict(np.asarray(X, dtype=np.float32), verbose=0)).ravel()
+
+
+def _load_pickle(path):
+    import joblib
+    mmap_mode = "r" if os.path.getsize(path) >= MMAP_THRESHOLD else None
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+
+def _resolve(name, artifact):
+    path = os.path.join(MODEL_DIR, artifact)
+    if name == "bundle":
+        with open(path) as f:
+            version = f.read().strip()
+        return os.path.join(os.path.dirname(path), version, "bundle.joblib"), version
+    return path, None
+
+
+def load_artifact(name, artifact):
+    path, version = _resolve(name, artifact)
+    if name == "keras":
+        try:
+            from tensorflow import keras
+        except ImportError:
+            raise RuntimeError("The keras model needs tensorflow installed")
+        return KerasModel(keras.models.load_model(path, compile=False)), version
+    model = _load_pickle(path)
+    if name == "weekly":
+        model = ScaledModel(_load_pickle(os.path.join(MODEL_DIR, "scaler.pkl")), model)
+    return model, version
+
+
+class _Entry:
+    __slots__ = ("model", "version", "loaded_at", "signature", "checked_at", "load_ms", "reloading", "error",
+                 "error_at")
+
+    def __init__(self):
+        self.model = None
+        self.version = None
+        self.loaded_at = None
+        self.signature = None
+        self.checked_at = 0.0
+        self.load_ms = None
+        self.reloading = False
+        self.error = None
+        self.error_at = None
+
+
+class ModelRegistry:
+    """Loads models on first use and swaps in new versions atomically.
+
+    Callers take a reference from ``get`` and use it for the whole request,
+    so a reload never interrupts in-flight predictions: the new model is
+    loaded on the side and published with a single assignment.
+    """
+
+    def __init__(self, models=MODELS, default=DEFAULT_MODEL, check_interval=MODEL_CHECK_INTERVAL):
+        self.models = models
+        self.default = default
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in models}
+        self._entries = {name: _Entry() for name in models}
+        self._listeners = []
+
+    def on_swap(self, callback):
+        self._listeners.append(callback)
+
+    def _signature(self, name):
+        # Bundles change by rewriting LATEST; plain files by their mtime/size
+        path = os.path.join(MODEL_DIR, self.models[name])
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self, name):
+        entry = self._entries[name]
+        with self._load_locks[name]:
+            try:
+                signature = self._signature(name)
+                if entry.model is not None and signature == entry.signature:
+                    return entry.model
+                start = time.perf_counter()
+                model, version = load_artifact(name, self.models[name])
+            except Exception as e:
+                # Shown by status() until a load succeeds
+                with self._lock:
+                    entry.error = f"{type(e).__name__}: {e}"
+                    entry.error_at = time.time()
+                raise
+            with self._lock:
+                entry.model = model
+                entry.version = version or time.strftime("%Y%m%dT%H%M%S", time.localtime(signature[0] / 1e9))
+                entry.signature = signature
+                entry.loaded_at = time.time()
+                entry.checked_at = time.monotonic()
+                entry.load_ms = round((time.perf_counter() - start) * 1000, 1)
+                entry.error = entry.error_at = None
+        for callback in self._listeners:
+            callback(name, model)
+        return model
+
+    def _reload_in_background(self, name):
+        entry = self._entries[name]
+
+        def run():
+            try:
+                self._load(name)
+            except Exception:
+                log.exception("reload of %s failed; serving previous version", name)
+            finally:
+                entry.reloading = False
+
+        entry.reloading = True
+        threading.Thread(target=run, daemon=True).start()
+
+    def get(self, name=None):
+        name = name or self.default
+        if name not in self._entries:
+            raise KeyError(f"Unknown model {name!r}; choose from {', '.join(self.models)}")
+        entry = self._entries[name]
+        model = entry.model
+        if model is None:
+            return self._load(name)
+        now = time.monotonic()
+        if now - entry.checked_at > self.check_interval and not entry.reloading:
+            entry.checked_at = now
+            try:
+                changed = self._signature(name) != entry.signature
+            except OSError:
+                changed = False
+            if changed:
+                self._reload_in_background(name)
+        return model
+
+    def reload(self, name=None):
+        name = name or self.default
+        self._entries[name].signature = None
+        self._load(name)
+        return self.status()[name]
+
+    def reload_changed(self):
+        """Reload, in the caller's thread, every loaded model whose artifact changed."""
+        reloaded = []
+        for name, entry in self._entries.items():
+            if entry.model is None:
+                continue
+            try:
+                changed = self._signature(name) != entry.signature
+            except OSError:
+                changed = False
+            if changed:
+                self._load(name)
+                reloaded.append(name)
+        return reloaded
+
+    def preload(self, names=None):
+        for name in names or [self.default]:
+            self.get(name)
+
+    def status(self):
+        with self._lock:
+            return {
+                name: {
+                    "artifact": self.models[name],
+                    "loaded": entry.model is not None,
+                    "version": entry.version,
+                    "loaded_at": entry.loaded_at,
+                    "load_ms": entry.load_ms,
+                    "error": entry.error,
+                    "error_at": entry.error_at,
+                    "features": list(getattr(entry.model, "feature_names_in_", [])) if entry.model is not None else None,
+                }
+                for name, entry in self._entries.items()
+            }
+
+
+registry = ModelRegistry()
@@ -0,0 +1,164 @@
+# Pre-fork deployment helpers: preload in the master, memory per worker
+#
+#   gunicorn -c gunicorn.conf.py app:app
+#   python prefork.py memory --pid <master pid>     # PSS/RSS of the master and each worker
+#
+# preload() runs in the gunicorn master before any worker is forked: it
+# loads every model artifact present, the forecast state and tables, and
+# the catalogue-backed caches (analytics store, expiry index), then closes
+# the master's database connections and moves everything allocated so far
+# into gc's permanent generation (gc.freeze), so the collector never writes
+# to those pages and they stay shared copy-on-write across workers. Pools,
+# queues and background threads are reset in each child by the owning
+# modules' os.register_at_fork hooks.
+#
+# Each worker then keeps its own copy of those caches up to date from its
+# own write signals, which siblings never see. A worker notices siblings'
+# writes through versions.foreign() and reloads: the expiry index on its
+# next query, the analytics store when its payload expires, and the sales
+# index within SALES_INDEX_SYNC_SECONDS.
+#
+# Memory is read from /proc/<pid>/smaps_rollup. PSS splits shared pages
+# between the processes mapping them, so the PSS total over the master and
+# its workers is what the deployment really costs.
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import time
+
+log = logging.getLogger("smartretail")
+
+# Models preloaded in the master: "all" present artifacts, or a comma list
+PREFORK_MODELS = os.environ.get("PREFORK_MODELS", "all")
+# Fill the default model's forecast table in the master too
+PREFORK_PRECOMPUTE = os.environ.get("PREFORK_PRECOMPUTE", "1") not in ("0", "false")
+
+_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap")
+
+
+def memory(pid="self"):
+    """Memory of one process in MB, from /proc/<pid>/smaps_rollup."""
+    kb = dict.fromkeys(_FIELDS, 0)
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in kb:
+                kb[name] = int(rest.split()[0])
+    mb = lambda value: round(value / 1024, 1)
+    return {
+        "rss_mb": mb(kb["Rss"]),
+        "pss_mb": mb(kb["Pss"]),
+        "shared_mb": mb(kb["Shared_Clean"] + kb["Shared_Dirty"]),
+        "private_mb": mb(kb["Private_Clean"] + kb["Private_Dirty"]),
+        "swap_mb": mb(kb["Swap"]),
+    }
+
+
+def children(pid):
+    path = f"/proc/{pid}/task/{pid}/children"
+    with open(path) as f:
+        return [int(p) for p in f.read().split()]
+
+
+def deployment_memory(master_pid):
+    """memory() of the master and each worker, with PSS and RSS totals."""
+    processes = [{"pid": master_pid, "role": "master", **memory(master_pid)}]
+    for pid in children(master_pid):
+        try:
+            processes.append({"pid": pid, "role": "worker", **memory(pid)})
+        except FileNotFoundError:
+            continue  # exited while being read
+    return {
+        "processes": processes,
+        "workers": len(processes) - 1,
+        "total_pss_mb": round(sum(p["pss_mb"] for p in processes), 1),
+        "total_rss_mb": round(sum(p["rss_mb"] for p in processes), 1),
+    }
+
+
+def _model_names(registry):
+    if PREFORK_MODELS != "all":
+        return [name.strip() for name in PREFORK_MODELS.split(",") if name.strip()]
+    return [name for name, artifact in registry.models.items()
+            if os.path.exists(os.path.join(os.path.dirname(os.path.abspath(__file__)), artifact))]
+
+
+def preload_models(registry):
+    loaded = []
+    for name in _model_names(registry):
+        try:
+            registry.get(name)
+            loaded.append(name)
+        except Exception as e:
+            # e.g. the keras model without tensorflow; workers report it on use
+            log.warning("model %s not preloaded: %s", name, e)
+    return loaded
+
+
+def preload():
+    """Load what workers share into the master, then freeze it for copy-on-write."""
+    start = time.perf_counter()
+    from analytics_store import store
+    from expiry import index
+    from model_registry import registry
+    from routes import forecasting, inventory
+
+    inventory.warm_up()
+    forecasting.warm_up()
+    models = preload_models(registry)
+    if PREFORK_PRECOMPUTE:
+        forecasting.precompute_forecasts()
+    for name, load in (("analytics", store.snapshot), ("expiry", lambda: index.expiring(0))):
+        try:
+            load()
+        except Exception:
+            log.exception("%s cache not preloaded", name)
+    release_connections()
+    gc.collect()
+    gc.freeze()
+    log.info("preloaded models %s in %.0f ms; %s", models, (time.perf_counter() - start) * 1000, memory())
+    return models
+
+
+def refresh():
+    """On a graceful reload (HUP): load changed models in the master before the new workers fork."""
+    from model_registry import registry
+    try:
+        reloaded = registry.reload_changed()
+    except Exception:
+        log.exception("model reload failed, new workers start with the previous version")
+        reloaded = []
+    release_connections()
+    gc.collect()
+    gc.freeze()
+    log.info("reloaded models %s; %s", reloaded, memory())
+    return reloaded
+
+
+def release_connections():
+    # Connections opened while preloading belong to the master; workers open their own
+    import db
+    import replicas
+    db.get_pool().close()
+    replicas.replicas.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["memory"])
+    parser.add_argument("--pid", type=int, help="gunicorn master pid (default: this process)")
+    args = parser.parse_args()
+    if args.pid is None:
+        print(json.dumps({"pid": os.getpid(), **memory()}, indent=2))
+        return
+    try:
+        print(json.dumps(deployment_memory(args.pid), indent=2))
+    except FileNotFoundError:
+        sys.exit(f"No process {args.pid}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+# Catalogue-wide reorder plan behind /reorder/plan
+#
+#   python reorder.py [--weeks 4] [--all]
+#
+# One pass over the catalogue: every product's forecast for the next N weeks
+# comes from the forecast cache in one lookup, and the batch table is read
+# once into columns. For each product the plan works out
+#   - live stock that sells before it expires, first-expiry-first-out, and
+#     the rest as expected waste;
+#   - lead time from its latest supplier's order_date -> delivery_date
+#     history for the product, then for the supplier, then DEFAULT_LEAD_DAYS;
+#   - an order covering demand from arrival to the end of the horizon plus
+#     safety stock for lead-time variation, capped at what can sell within
+#     the product's usual shelf life.
+# All of it is numpy over every product at once; nothing loops per product
+# until the response rows are built.
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import closing
+from datetime import date, timedelta
+
+import numpy as np
+
+import forecast
+
+DEFAULT_LEAD_DAYS = float(os.environ.get("REORDER_DEFAULT_LEAD_DAYS", 7))
+# Standard deviations of lead time covered by safety stock (1.65 ~ 95%)
+SAFETY_Z = float(os.environ.get("REORDER_SAFETY_Z", 1.65))
+MAX_WEEKS = 26
+
+PRODUCTS_SQL = """
+    SELECT p.id, p.name, c.name
+    FROM products p LEFT JOIN categories c ON c.id = p.category_id
+"""
+
+# Every batch, emptied ones included: they carry the lead-time history
+BATCHES_SQL = """
+    SELECT product_id, supplier_name, quantity, expiry_date, order_date, delivery_date
+    FROM product_inventory_batches
+"""
+
+
+def _ordinal(value):
+    if value is None:
+        return np.nan
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return value.toordinal()
+
+
+def _days(values):
+    # Date ordinals as float64, NaN where the date is missing
+    return np.fromiter(map(_ordinal, values), dtype=np.float64, count=len(values))
+
+
+def load(conn):
+    """Catalogue and batch columns for compute()."""
+    with closing(conn.cursor()) as cursor:
+        cursor.execute(PRODUCTS_SQL)
+        products = sorted(cursor.fetchall())
+        cursor.execute(BATCHES_SQL)
+        batches = cursor.fetchall()
+    product, supplier, quantity, expiry, ordered, delivered = zip(*batches) if batches else ([],) * 6
+    suppliers, supplier_codes = np.unique(np.array([s or "" for s in supplier], dtype=object), return_inverse=True)
+    return {
+        "product_ids": np.fromiter((p[0] for p in products), dtype=np.int64, count=len(products)),
+        "names": [p[1] for p in products],
+        "categories": [p[2] for p in products],
+        "batch_product": np.asarray(product, dtype=np.int64),
+        "batch_supplier": supplier_codes.astype(np.int64),
+        "batch_quantity": np.asarray(quantity, dtype=np.float64),
+        "batch_expiry": _days(expiry),
+        "batch_ordered": _days(ordered),
+        "batch_delivered": _days(delivered),
+        "suppliers": suppliers.tolist(),
+    }
+
+
+def forecast_demand(cache, product_ids, weeks, start):
+    """(products, weeks) forecast units, one row per product, chunked under MAX_BATCH."""
+    points = np.asarray(forecast.horizon(weeks, start), dtype=np.int64)
+    demand = np.empty((len(product_ids), weeks), dtype=np.float64)
+    step = max(1, forecast.MAX_BATCH // weeks)
+    for i in range(0, len(product_ids), step):
+        chunk = product_ids[i:i + step]
+        demand[i:i + len(chunk)] = cache.lookup(
+            np.repeat(chunk, weeks), np.tile(points[:, 0], len(chunk)), np.tile(points[:, 1], len(chunk)),
+        ).reshape(len(chunk), weeks)
+    return np.clip(demand, 0, None)
+
+
+def _grouped_cumsum(values, first):
+    total = np.cumsum(values)
+    starts = np.maximum.accumulate(np.where(first, np.arange(len(values)), 0))
+    return total - (total[starts] - values[starts])
+
+
+def _grouped_cummin(values, first):
+    # Running minimum restarting at each group; values must be <= 0. Each
+    # group is shifted below everything before it, so the minimum can't leak
+    group = np.cumsum(first) - 1
+    shift = (np.abs(values).max() + 1) * group if len(values) else 0
+    return np.minimum.accumulate(values - shift) + shift
+
+
+def _mean_std(keys, values, size):
+    count = np.bincount(keys, minlength=size).astype(np.float64)
+    total = np.bincount(keys, values, minlength=size)
+    squares = np.bincount(keys, values * values, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        std = np.sqrt(np.clip(squares / count - mean * mean, 0, None))
+    std[count < 2] = np.nan
+    return mean, std
+
+
+def compute(columns, demand, today, lead_default=DEFAULT_LEAD_DAYS, safety_z=SAFETY_Z):
+    """Per-product plan arrays from load() columns and a (products, weeks) demand matrix."""
+    product_ids = columns["product_ids"]
+    n, weeks = demand.shape
+    horizon_days = 7 * weeks
+    today = float(today.toordinal())
+
+    cumulative = np.zeros((n, weeks + 1))
+    np.cumsum(demand, axis=1, out=cumulative[:, 1:])
+
+    def demand_until(rows, days):
+        # Forecast units sold from today to `days` days ahead, spread evenly within a week
+        days = np.clip(days, 0, horizon_days)
+        week = np.minimum(days // 7, weeks - 1).astype(np.int64)
+        return cumulative[rows, week] + (days - 7 * week) / 7 * demand[rows, week]
+
+    # Batches of products outside the catalogue are ignored
+    row = np.searchsorted(product_ids, columns["batch_product"])
+    known = row < n
+    known[known] = product_ids[row[known]] == columns["batch_product"][known]
+    row, supplier = row[known], columns["batch_supplier"][known]
+    quantity = columns["batch_quantity"][known]
+    expiry = columns["batch_expiry"][known] - today
+    ordered, delivered = columns["batch_ordered"][known], columns["batch_delivered"][known]
+
+    live = quantity > 0
+    expired = live & (expiry < 0)
+    stock = np.bincount(row[live & ~expired], quantity[live & ~expired], minlength=n)
+    expired_units = np.bincount(row[expired], quantity[expired], minlength=n)
+
+    # FEFO sell-through: with batches in expiry order and Q the running stock,
+    # units sold from the first k batches by their expiry are
+    # S_k = min(S_k-1 + q_k, D(t_k)) = Q_k + min(0, min_j<=k (D(t_j) - Q_j)).
+    # Batches outliving the horizon are never cut short (D = inf).
+    usable = live & ~expired
+    b_row, b_qty, b_expiry = row[usable], quantity[usable], expiry[usable]
+    order = np.lexsort((np.nan_to_num(b_expiry, nan=np.inf), b_row))
+    b_row, b_qty, b_expiry = b_row[order], b_qty[order], b_expiry[order]
+    first = np.r_[True, b_row[1:] != b_row[:-1]] if len(b_row) else np.zeros(0, dtype=bool)
+    running = _grouped_cumsum(b_qty, first)
+    limit = np.where(np.isnan(b_expiry) | (b_expiry >= horizon_days), np.inf,
+                     demand_until(b_row, np.nan_to_num(b_expiry)))
+    sold = running + _grouped_cummin(np.minimum(limit - running, 0), first)
+    last = np.r_[first[1:], True] if len(b_row) else first
+    sellable = np.zeros(n)
+    sellable[b_row[last]] = sold[last]
+    waste = stock - sellable
+
+    # Supplier: whoever delivered the product's most recent order
+    by_order = np.lexsort((np.nan_to_num(ordered, nan=-np.inf), row))
+    latest = by_order[np.r_[row[by_order][1:] != row[by_order][:-1], True]] if len(row) else by_order
+    product_supplier = np.full(n, -1, dtype=np.int64)
+    product_supplier[row[latest]] = supplier[latest]
+
+    # Lead time: (product, supplier) history, else supplier-wide, else the default
+    history = ~np.isnan(ordered) & ~np.isnan(delivered)
+    lead = np.clip(delivered[history] - ordered[history], 0, None)
+    suppliers = max(len(columns["suppliers"]), 1)
+    pairs = row[history] * suppliers + supplier[history]
+    pair_keys, pair_index = np.unique(pairs, return_inverse=True)
+    pair_mean, pair_std = _mean_std(pair_index, lead, len(pair_keys))
+    supplier_mean, supplier_std = _mean_std(supplier[history], lead, suppliers)
+
+    wanted = np.arange(n) * suppliers + product_supplier
+    found = np.searchsorted(pair_keys, wanted)
+    found = np.minimum(found, max(len(pair_keys) - 1, 0))
+    has_pair = (product_supplier >= 0) & (len(pair_keys) > 0)
+    has_pair[has_pair] = pair_keys[found[has_pair]] == wanted[has_pair]
+    lead_mean = np.full(n, lead_default)
+    lead_std = np.zeros(n)
+    has_supplier = product_supplier >= 0
+    s_mean, s_std = supplier_mean[product_supplier[has_supplier]], supplier_std[product_supplier[has_supplier]]
+    lead_mean[has_supplier] = np.where(np.isnan(s_mean), lead_default, s_mean)
+    lead_std[has_supplier] = np.nan_to_num(s_std)
+    lead_mean[has_pair] = pair_mean[found[has_pair]]
+    lead_std[has_pair] = np.where(np.isnan(pair_std[found[has_pair]]), lead_std[has_pair], pair_std[found[has_pair]])
+    lead_days = np.ceil(lead_mean)
+
+    # Shelf life: mean delivery -> expiry span of the product's past batches
+    shelf_known = ~np.isnan(delivered) & ~np.isnan(columns["batch_expiry"][known])
+    shelf_total = np.bincount(row[shelf_known], (expiry + today - delivered)[shelf_known], minlength=n)
+    shelf_count = np.bincount(row[shelf_known], minlength=n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shelf_life = np.where(shelf_count > 0, shelf_total / shelf_count, np.inf)
+
+    rows = np.arange(n)
+    total_demand = cumulative[:, weeks]
+    before_arrival = demand_until(rows, lead_days)
+    safety = safety_z * (total_demand / horizon_days) * lead_std
+    on_arrival = np.clip(sellable - before_arrival, 0, None)
+    need = total_demand - before_arrival + safety - on_arrival
+    # Nothing ordered now should still be on the shelf when it expires
+    sell_window = demand_until(rows, lead_days + np.nan_to_num(shelf_life, posinf=horizon_days)) - before_arrival
+    order_quantity = np.ceil(np.clip(np.minimum(need, sell_window + safety), 0, None)).astype(np.int64)
+
+    return {
+        "supplier": product_supplier,
+        "lead_time_days": lead_days,
+        "lead_time_std": lead_std,
+        "stock": stock,
+        "expired": expired_units,
+        "expected_waste": waste,
+        "forecast_demand": total_demand,
+        "demand_before_arrival": before_arrival,
+        "safety_stock": safety,
+        "order_quantity": order_quantity,
+        "stockout_before_arrival": before_arrival > sellable,
+    }
+
+
+def plan(cache, conn, weeks=4, today=None, supplier=None, category=None, include_all=False):
+    """Suggested orders grouped by supplier; raises ValueError for bad arguments."""
+    if not 1 <= weeks <= MAX_WEEKS:
+        raise ValueError(f"weeks must be between 1 and {MAX_WEEKS}")
+    started = time.perf_counter()
+    today = today or date.today()
+    columns = load(conn)
+    demand = forecast_demand(cache, columns["product_ids"], weeks, today)
+    result = compute(columns, demand, today)
+
+    suppliers = columns["suppliers"]
+    groups = {}
+    include = include_all | (result["order_quantity"] > 0)
+    names, categories = columns["names"], columns["categories"]
+    for i in np.flatnonzero(include).tolist():
+        code = int(result["supplier"][i])
+        name = (suppliers[code] or None) if code >= 0 else None
+        if (supplier is not None and name != supplier) or (category is not None and categories[i] != category):
+            continue
+        lead = int(result["lead_time_days"][i])
+        group = groups.setdefault(name, {"supplier": name, "order_units": 0, "products": []})
+        group["order_units"] += int(result["order_quantity"][i])
+        group["products"].append({
+            "product_id": int(columns["product_ids"][i]),
+            "name": names[i],
+            "category": categories[i],
+            "order_quantity": int(result["order_quantity"][i]),
+            "order_by": today.isoformat(),
+            "arrives": (today + timedelta(days=lead)).isoformat(),
+            "lead_time_days": lead,
+            "stock": int(result["stock"][i]),
+            "expired": int(result["expired"][i]),
+            "expected_waste": round(float(result["expected_waste"][i]), 1),
+            "forecast_demand": round(float(result["forecast_demand"][i]), 1),
+            "safety_stock": round(float(result["safety_stock"][i]), 1),
+            "stockout_before_arrival": bool(result["stockout_before_arrival"][i]),
+        })
+    ordered = sorted(groups.values(), key=lambda g: (-g["order_units"], g["supplier"] or ""))
+    return {
+        "start": today.isoformat(),
+        "weeks": weeks,
+        "products": len(columns["product_ids"]),
+        "ordering": int((result["order_quantity"] > 0).sum()),
+        "suppliers": ordered,
+        "latency_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--weeks", type=int, default=4)
+    parser.add_argument("--model", help="registry model (default: the default model)")
+    parser.add_argument("--all", action="store_true", help="include products that need no order")
+    args = parser.parse_args()
+
+    import mysql.connector
+    from db import db_connection
+    from model_registry import registry
+    cache = forecast.ForecastCache(registry.get(args.model or registry.default))
+    try:
+        with db_connection() as conn:
+            print(json.dumps(plan(cache, conn, args.weeks, include_all=args.all), indent=2))
+    except (mysql.connector.Error, ValueError) as err:
+        sys.exit(str(err))
+
+
+if __name__ == "__main__":
+    main()
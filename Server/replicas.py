@@ -0,0 +1,263 @@
+# Read replicas for the read-only routes, with lag-aware fallback
+#
+#   DB_REPLICAS=replica1,replica2:3307      # MySQL hosts, sharing db_config's user, password and database
+#   SQLITE_REPLICAS=replica.sqlite3         # with DB_BACKEND=sqlite
+#
+# Writes, and reads that must see them, stay on db_connection() (the
+# primary). Read-only queries take read_connection(), which hands out a
+# pooled connection to a replica that is reachable, at most REPLICA_MAX_LAG
+# seconds behind and has applied everything the caller must see, and
+# otherwise the primary's.
+#
+# Lag is measured with a heartbeat: every REPLICA_HEARTBEAT seconds a thread
+# stamps replication_heartbeat on the primary with the time, then reads the
+# stamp back from each replica. A replica showing stamp T has applied every
+# transaction the primary committed before T (the clock is the app hosts').
+#
+# Read-your-writes: a request that wrote gets a read_after cookie holding
+# the time its response was sent, and reads made for that session only use
+# replicas whose stamp has passed it. Caches loaded once and then kept
+# current from the write signals (analytics, expiry and sales indexes) load
+# through cache_connection(), which only uses a replica that has applied
+# this process's last signalled write, so no change falls between the load
+# and the signals that follow it.
+import contextvars
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import ExitStack, closing, contextmanager
+
+import mysql.connector
+
+import db
+import metrics
+from signals import catalogue_changed, inventory_changed, sales_recorded
+
+log = logging.getLogger("smartretail")
+
+DB_REPLICAS = [h.strip() for h in os.environ.get("DB_REPLICAS", "").split(",") if h.strip()]
+SQLITE_REPLICAS = [p.strip() for p in os.environ.get("SQLITE_REPLICAS", "").split(",") if p.strip()]
+REPLICA_MAX_LAG = float(os.environ.get("REPLICA_MAX_LAG", 5))
+REPLICA_HEARTBEAT = float(os.environ.get("REPLICA_HEARTBEAT", 1))
+REPLICA_POOL_SIZE = int(os.environ.get("REPLICA_POOL_SIZE", db.POOL_SIZE))
+# A replica that failed is left alone this long before it is tried again
+REPLICA_RETRY_SECONDS = float(os.environ.get("REPLICA_RETRY_SECONDS", 10))
+
+READ_AFTER_COOKIE = "read_after"
+# Past this a write is older than any replica allowed to serve reads
+READ_AFTER_MAX_AGE = math.ceil(REPLICA_MAX_LAG) + 1
+
+STAMP_SQL = "UPDATE replication_heartbeat SET beat = %s WHERE id = 1 AND beat < %s"
+BEAT_SQL = "SELECT beat FROM replication_heartbeat WHERE id = 1"
+
+# Time of the session's last write, from the read_after cookie
+read_after = contextvars.ContextVar("read_after", default=0.0)
+# Freshness of the request being served, when a caller asked to know it
+current_reads = contextvars.ContextVar("current_reads", default=None)
+
+
+class Reads:
+    """Oldest heartbeat among the replicas read from; inf when only the primary was."""
+
+    __slots__ = ("upto",)
+
+    def __init__(self):
+        self.upto = math.inf
+
+
+def _connector(spec):
+    if db.DB_BACKEND == "sqlite":
+        import sqlite_backend
+        return lambda: metrics.instrument(sqlite_backend.connect(spec))
+    host, _, port = spec.partition(":")
+    config = {**db.db_config, "host": host, **({"port": int(port)} if port else {})}
+    return lambda: metrics.instrument(mysql.connector.connect(**config))
+
+
+class Replica:
+    def __init__(self, name, connect, pool_size=REPLICA_POOL_SIZE):
+        self.name = name
+        self.connect = connect
+        self.pool = db.ConnectionPool(connect=connect, size=pool_size)
+        self.beat = None
+        self.checked_at = None
+        self.failed_at = None
+        self.error = None
+        self.reads = 0
+
+    @property
+    def lag(self):
+        return None if self.beat is None else max(0.0, time.time() - self.beat)
+
+    def usable(self, after, now, max_lag):
+        if self.failed_at is not None and now - self.failed_at < REPLICA_RETRY_SECONDS:
+            return False
+        return self.beat is not None and now - self.beat <= max_lag and self.beat >= after
+
+    def check(self):
+        try:
+            with db.db_connection(self.pool) as conn, closing(conn.cursor()) as cursor:
+                cursor.execute(BEAT_SQL)
+                row = cursor.fetchone()
+            self.beat = float(row[0]) if row else None
+            self.failed_at = self.error = None
+        except Exception as e:
+            self.fail(e)
+        self.checked_at = time.time()
+
+    def fail(self, error):
+        self.failed_at = time.time()
+        self.error = str(error)
+
+    def stats(self):
+        lag = self.lag
+        return {
+            "name": self.name,
+            "up": self.failed_at is None,
+            "lag_seconds": None if lag is None else round(lag, 3),
+            "error": self.error,
+            "reads": self.reads,
+            "pool": self.pool.stats(),
+        }
+
+
+class ReplicaSet:
+    def __init__(self, replicas, max_lag=REPLICA_MAX_LAG, heartbeat=REPLICA_HEARTBEAT, connection=db.db_connection):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.heartbeat = heartbeat
+        self._connection = connection
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.primary_reads = 0
+        self.fallbacks = 0
+        # Time of the last write this process signalled, for cache_connection()
+        self.last_write = 0.0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="replica-heartbeat", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.beat()
+            self._stop.wait(self.heartbeat)
+
+    def beat(self):
+        """Stamp the primary, then read each replica's stamp."""
+        now = time.time()
+        try:
+            with self._connection() as conn, closing(conn.cursor()) as cursor:
+                cursor.execute(STAMP_SQL, (now, now))
+                conn.commit()
+        except Exception:
+            log.exception("replication heartbeat failed")
+        for replica in self.replicas:
+            replica.check()
+
+    def choose(self, after):
+        self._start()
+        now = time.time()
+        usable = [r for r in self.replicas if r.usable(after, now, self.max_lag)]
+        if not usable:
+            return None
+        return usable[next(self._next) % len(usable)]
+
+    @contextmanager
+    def connection(self, after):
+        replica = self.choose(after) if self.replicas else None
+        stack = ExitStack()
+        with stack:
+            if replica is not None:
+                try:
+                    conn = stack.enter_context(db.db_connection(replica.pool))
+                except Exception as e:
+                    # Unreachable since the last heartbeat; the primary answers instead
+                    log.warning("replica %s unavailable: %s", replica.name, e)
+                    replica.fail(e)
+                    replica = None
+            if replica is None:
+                conn = stack.enter_context(self._connection())
+            with self._lock:
+                if replica is None:
+                    self.primary_reads += 1
+                    self.fallbacks += bool(self.replicas)
+                else:
+                    replica.reads += 1
+            reads = current_reads.get()
+            if reads is not None and replica is not None:
+                reads.upto = min(reads.upto, replica.beat)
+            yield conn
+
+    def note_write(self, *args, **kwargs):
+        self.last_write = time.time()
+
+    def close(self):
+        self._stop.set()
+        for replica in self.replicas:
+            replica.pool.close()
+
+    def after_fork(self):
+        # The heartbeat thread and pooled sockets stay with the parent process
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        for replica in self.replicas:
+            replica.pool = db.ConnectionPool(connect=replica.connect, size=replica.pool.size)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "replicas": [r.stats() for r in self.replicas],
+                "max_lag_seconds": self.max_lag,
+                "primary_reads": self.primary_reads,
+                "fallbacks": self.fallbacks,
+            }
+
+
+def create_replica_set():
+    specs = SQLITE_REPLICAS if db.DB_BACKEND == "sqlite" else DB_REPLICAS
+    return ReplicaSet([Replica(spec, _connector(spec)) for spec in specs])
+
+
+replicas = create_replica_set()
+os.register_at_fork(after_in_child=replicas.after_fork)
+if replicas.replicas:
+    # Connected on import, ahead of the caches that import this module, so a
+    # write is noted before their deltas for it apply
+    for signal in (catalogue_changed, inventory_changed, sales_recorded):
+        signal.connect(replicas.note_write)
+
+
+def read_connection(after=None):
+    """Pooled connection for read-only queries: a fresh enough replica, or the primary."""
+    if not replicas.replicas:
+        return db.db_connection()
+    return replicas.connection(read_after.get() if after is None else after)
+
+
+def cache_connection():
+    """read_connection() for a cache that is then kept current from the write signals."""
+    return read_connection(after=replicas.last_write)
+
+
+def session_after(cookie):
+    # Clamped to now, so a forged cookie can't pin a session to the primary;
+    # nan would slip through min(), so only finite stamps count
+    try:
+        stamp = float(cookie) if cookie else 0.0
+    except ValueError:
+        return 0.0
+    return min(stamp, time.time()) if math.isfinite(stamp) else 0.0
+
+
+def wrote(method, status):
+    """Whether a response should carry the read_after cookie."""
+    return bool(replicas.replicas) and method not in ("GET", "HEAD", "OPTIONS") and status < 400
@@ -0,0 +1,241 @@
+# Per-product daily and ISO-week sales rollups (sales_daily, sales_weekly)
+#
+#   python rollups.py backfill [--start 2024-01-01] [--end 2024-12-31]
+#
+# Every sale write adds its quantities to both tables in the same
+# transaction (allocation.write_sale_rows), so /sales/timeseries reads
+# O(buckets) rollup rows instead of the sales they summarise. Months are
+# summed from the daily rows. Backfill rebuilds whole weeks from the sales
+# table, a few weeks per transaction, holding a shared lock on the sales
+# range so sales written meanwhile can't be lost or counted twice.
+import argparse
+import json
+import sys
+from collections import defaultdict
+from contextlib import closing
+from datetime import date, timedelta
+
+UPSERT_DAILY_SQL = """
+    INSERT INTO sales_daily (product_id, sale_date, quantity, line_count)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity), line_count = line_count + VALUES(line_count)
+"""
+
+UPSERT_WEEKLY_SQL = """
+    INSERT INTO sales_weekly (product_id, week_start, iso_year, iso_week, quantity, line_count)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity), line_count = line_count + VALUES(line_count)
+"""
+
+SALES_RANGE_SQL = "SELECT MIN(sale_date), MAX(sale_date) FROM sales"
+
+# Shared lock on the range: concurrent sales for these days wait for the rebuild
+BACKFILL_SOURCE_SQL = """
+    SELECT product_id, sale_date, SUM(quantity), COUNT(*)
+    FROM sales
+    WHERE sale_date BETWEEN %s AND %s
+    GROUP BY product_id, sale_date
+    LOCK IN SHARE MODE
+"""
+
+CLEAR_DAILY_SQL = "DELETE FROM sales_daily WHERE sale_date BETWEEN %s AND %s"
+CLEAR_WEEKLY_SQL = "DELETE FROM sales_weekly WHERE week_start BETWEEN %s AND %s"
+
+BACKFILL_WEEKS = 4
+MAX_BUCKETS = 5000
+
+GRANULARITIES = ("day", "week", "month")
+GROUPINGS = ("total", "product", "category")
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def add(cursor, rows):
+    """Add (user_id, product_id, quantity, sale_date, batch_id) sale rows to the rollups."""
+    daily = defaultdict(lambda: [0, 0])
+    weekly = defaultdict(lambda: [0, 0])
+    for _, product_id, quantity, sale_date, _ in rows:
+        for totals in (daily[product_id, sale_date], weekly[product_id, week_start(sale_date)]):
+            totals[0] += quantity
+            totals[1] += 1
+    cursor.executemany(UPSERT_DAILY_SQL, [(pid, day, qty, n) for (pid, day), (qty, n) in daily.items()])
+    cursor.executemany(UPSERT_WEEKLY_SQL, [
+        (pid, monday, *monday.isocalendar()[:2], qty, n) for (pid, monday), (qty, n) in weekly.items()
+    ])
+
+
+def backfill(conn, start=None, end=None, weeks=BACKFILL_WEEKS):
+    """Rebuild the rollups for [start, end], widened to whole weeks; returns days and weeks written."""
+    with closing(conn.cursor()) as cursor:
+        if start is None or end is None:
+            cursor.execute(SALES_RANGE_SQL)
+            first, last = cursor.fetchone()
+            conn.rollback()
+            if first is None:
+                return {"days": 0, "weeks": 0}
+            start, end = start or first, end or last
+    start, end = week_start(_as_date(start)), week_start(_as_date(end)) + timedelta(days=6)
+
+    written = {"days": 0, "weeks": 0}
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(weeks=weeks) - timedelta(days=1), end)
+        with closing(conn.cursor()) as cursor:
+            try:
+                cursor.execute(BACKFILL_SOURCE_SQL, (chunk_start, chunk_end))
+                daily = [(pid, _as_date(day), int(qty), int(n)) for pid, day, qty, n in cursor.fetchall()]
+                weekly = defaultdict(lambda: [0, 0])
+                for pid, day, qty, n in daily:
+                    totals = weekly[pid, week_start(day)]
+                    totals[0] += qty
+                    totals[1] += n
+                cursor.execute(CLEAR_DAILY_SQL, (chunk_start, chunk_end))
+                cursor.execute(CLEAR_WEEKLY_SQL, (chunk_start, chunk_end))
+                if daily:
+                    cursor.executemany(UPSERT_DAILY_SQL, daily)
+                    cursor.executemany(UPSERT_WEEKLY_SQL, [
+                        (pid, monday, *monday.isocalendar()[:2], qty, n) for (pid, monday), (qty, n) in weekly.items()
+                    ])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        written["days"] += len({day for _, day, _, _ in daily})
+        written["weeks"] += len({monday for _, monday in weekly})
+        chunk_start = chunk_end + timedelta(days=1)
+    return written
+
+
+def _as_date(value):
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value.date() if hasattr(value, "date") else value
+
+
+def _bucket(day, granularity):
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return week_start(day)
+    return day.replace(day=1)
+
+
+def _next_bucket(bucket, granularity):
+    if granularity == "day":
+        return bucket + timedelta(days=1)
+    if granularity == "week":
+        return bucket + timedelta(weeks=1)
+    return (bucket + timedelta(days=32)).replace(day=1)
+
+
+def _label(bucket, granularity):
+    if granularity == "week":
+        year, week, _ = bucket.isocalendar()
+        return f"{year}-W{week:02d}"
+    if granularity == "month":
+        return bucket.strftime("%Y-%m")
+    return bucket.isoformat()
+
+
+def timeseries_query(granularity, group_by, low, high, product_ids=None, category=None, category_id=None):
+    """(sql, params) summing one rollup table per group and row date."""
+    # Weeks come from sales_weekly whole, so the range snaps to week bounds
+    table, column = ("sales_weekly", "r.week_start") if granularity == "week" else ("sales_daily", "r.sale_date")
+    key = {"total": None, "product": "r.product_id", "category": "c.name"}[group_by]
+    joins = ""
+    where = [f"{column} BETWEEN %s AND %s"]
+    params = [low, high]
+    if group_by == "category" or category is not None or category_id is not None:
+        joins = " JOIN products p ON p.id = r.product_id JOIN categories c ON c.id = p.category_id"
+    if product_ids:
+        where.append(f"r.product_id IN ({', '.join(['%s'] * len(product_ids))})")
+        params.extend(product_ids)
+    if category_id is not None:
+        where.append("p.category_id = %s")
+        params.append(category_id)
+    if category is not None:
+        where.append("c.name = %s")
+        params.append(category)
+    grouping = f"{key}, {column}" if key else column
+    sql = f"""
+        SELECT {grouping}, SUM(r.quantity), SUM(r.line_count)
+        FROM {table} r{joins}
+        WHERE {' AND '.join(where)}
+        GROUP BY {grouping}
+    """
+    return sql, params
+
+
+def timeseries(conn, start, end, granularity="day", group_by="total", product_ids=None, category=None,
+               category_id=None, fill=True):
+    """Quantity and line counts per bucket, read only from the rollup tables.
+
+    Raises ValueError for bad arguments.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    if group_by not in GROUPINGS:
+        raise ValueError(f"group_by must be one of {', '.join(GROUPINGS)}")
+    start, end = _as_date(start), _as_date(end)
+    if start > end:
+        raise ValueError("start must not be after end")
+    first, last = _bucket(start, granularity), _bucket(end, granularity)
+    buckets = []
+    bucket = first
+    while bucket <= last:
+        buckets.append(bucket)
+        if len(buckets) > MAX_BUCKETS:
+            raise ValueError(f"At most {MAX_BUCKETS} buckets per query; use a coarser granularity")
+        bucket = _next_bucket(bucket, granularity)
+
+    low, high = (first, last) if granularity == "week" else (start, end)
+    sql, params = timeseries_query(granularity, group_by, low, high, product_ids, category, category_id)
+    with closing(conn.cursor()) as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall() if group_by != "total" else [("total", *row) for row in cursor.fetchall()]
+
+    series = defaultdict(dict)
+    for group, day, quantity, lines in rows:
+        bucket = _bucket(_as_date(day), granularity)
+        point = series[group].setdefault(bucket, [0, 0])
+        point[0] += int(quantity or 0)
+        point[1] += int(lines or 0)
+
+    def points(values):
+        keys = buckets if fill else sorted(values)
+        out = []
+        for b in keys:
+            quantity, lines = values.get(b, (0, 0))
+            point = {"bucket": _label(b, granularity), "start": b.isoformat(), "quantity": quantity, "lines": lines}
+            out.append(point)
+        return out
+
+    if group_by == "total":
+        result = [{"key": "total", "points": points(series.get("total", {}))}]
+    else:
+        result = [{"key": group, "points": points(values)} for group, values in sorted(series.items())]
+    return {"granularity": granularity, "group_by": group_by, "start": start.isoformat(), "end": end.isoformat(),
+            "series": result}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--start", help="first day to rebuild (default: first sale)")
+    parser.add_argument("--end", help="last day to rebuild (default: last sale)")
+    parser.add_argument("--weeks", type=int, default=BACKFILL_WEEKS, help="weeks per transaction")
+    args = parser.parse_args()
+
+    import mysql.connector
+    from db import db_connection
+    try:
+        with db_connection() as conn:
+            print(json.dumps(backfill(conn, args.start, args.end, weeks=args.weeks)))
+    except mysql.connector.Error as err:
+        sys.exit(str(err))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Flask application factory, with one blueprint per subsystem
+#
+#   from routes import create_app
+#   app = create_app()                                         # everything (app.py)
+#   app = create_app(blueprints=("forecasting",))              # one subsystem
+#
+# Blueprint modules only import light modules at the top; numpy, joblib and
+# the models behind them (sklearn, pandas) are imported by the views that
+# use them. A blueprint module may define warm_up(), which create_app runs
+# on one background thread (WARM_UP=0 turns it off), so those costs are
+# usually paid before the first request that needs them, without holding
+# back the first request served.
+import importlib
+import logging
+import os
+import threading
+import time
+
+from flask import Flask, g, request
+from flask_cors import CORS
+
+import http_cache
+import metrics
+import replicas
+
+log = logging.getLogger("smartretail")
+
+BLUEPRINTS = ("ops", "catalogue", "inventory", "sales", "analytics", "forecasting", "schemes", "changes")
+WARM_UP = os.environ.get("WARM_UP", "1") not in ("0", "false")
+
+
+def start_timer():
+    g.request_start = time.perf_counter()
+    # Labelled by the URL rule, not the path, so /products/<id> is one series
+    g.route_token = metrics.current_route.set(request.url_rule.rule if request.url_rule else "<unmatched>")
+    g.read_after_token = replicas.read_after.set(replicas.session_after(request.cookies.get(replicas.READ_AFTER_COOKIE)))
+
+
+def record_timing(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        metrics.observe_request(request.method, metrics.current_route.get(), response.status_code,
+                                time.perf_counter() - start)
+    if replicas.wrote(request.method, response.status_code):
+        # Read-your-writes: this session's reads skip replicas that haven't caught up
+        response.set_cookie(replicas.READ_AFTER_COOKIE, repr(time.time()), max_age=replicas.READ_AFTER_MAX_AGE,
+                            httponly=True, samesite="Lax")
+    return response
+
+
+def clear_route(exc):
+    token = g.pop("route_token", None)
+    if token is not None:
+        metrics.current_route.reset(token)
+    token = g.pop("read_after_token", None)
+    if token is not None:
+        replicas.read_after.reset(token)
+
+
+def warm_up(modules):
+    for module in modules:
+        start = time.perf_counter()
+        try:
+            module.warm_up()
+            log.info("warmed %s in %.0f ms", module.__name__, (time.perf_counter() - start) * 1000)
+        except Exception:
+            log.exception("warm-up of %s failed", module.__name__)
+
+
+def create_app(blueprints=BLUEPRINTS, warm=WARM_UP, import_name="app"):
+    app = Flask(import_name)
+    CORS(app)
+    http_cache.init_app(app)
+    app.before_request(start_timer)
+    app.after_request(record_timing)
+    app.teardown_request(clear_route)
+
+    modules = [importlib.import_module(f"routes.{name}") for name in blueprints]
+    for module in modules:
+        app.register_blueprint(module.bp)
+    warmers = [m for m in modules if hasattr(m, "warm_up")]
+    if warm and warmers:
+        threading.Thread(target=warm_up, args=(warmers,), name="warm-up", daemon=True).start()
+    return app
@@ -0,0 +1,17 @@
+# /analytics dashboard, served from the incrementally maintained store
+from flask import Blueprint, jsonify
+import mysql.connector
+
+from analytics_store import store as analytics_store
+import http_cache
+
+bp = Blueprint("analytics", __name__)
+
+analytics_bodies = http_cache.Memo()
+
+@bp.route("/analytics")
+def analytics():
+    try:
+        return http_cache.respond(analytics_bodies.body(analytics_store.snapshot()))
+    except mysql.connector.Error as err:
+        return jsonify({"error": str(err)}), 500
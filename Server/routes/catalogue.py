@@ -0,0 +1,52 @@
+# /products: listing, adding and deleting products
+from contextlib import closing
+
+from flask import Blueprint, jsonify, request
+import mysql.connector
+
+from db import db_connection
+import http_cache
+import listing
+from routes.common import listing_response
+from signals import catalogue_changed
+
+bp = Blueprint("catalogue", __name__)
+
+@bp.route("/products", methods=["GET"])
+@http_cache.versioned("catalogue", "inventory")
+def get_products():
+    return listing_response(listing.PRODUCTS)
+
+@bp.route("/products", methods=["POST"])
+def add_product():
+    try:
+        data = request.get_json()
+        required_fields = ["name", "category_id", "price", "inventory"]
+        for field in required_fields:
+            if field not in data:
+                return jsonify({"error": f"{field} is required"}), 400
+
+        with db_connection() as conn, closing(conn.cursor()) as cursor:
+            cursor.execute("""
+                INSERT INTO products (name, category_id, price, inventory)
+                VALUES (%s, %s, %s, %s)
+            """, (data["name"], data["category_id"], data["price"], data["inventory"]))
+            conn.commit()
+            product_id = cursor.lastrowid
+        catalogue_changed.send("products", product_id=product_id, action="added")
+        return jsonify({"message": "Product added"})
+    except mysql.connector.Error as err:
+        return jsonify({"error": str(err)}), 500
+    except Exception as e:
+        return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
+
+@bp.route("/products/<int:id>", methods=["DELETE"])
+def delete_product(id):
+    try:
+        with db_connection() as conn, closing(conn.cursor()) as cursor:
+            cursor.execute("DELETE FROM products WHERE id = %s", (id,))
+            conn.commit()
+        catalogue_changed.send("products", product_id=id, action="deleted")
+        return jsonify({"message": "Product deleted"})
+    except mysql.connector.Error as err:
+        return jsonify({"error": str(err)}), 500
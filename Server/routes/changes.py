@@ -0,0 +1,18 @@
+# Live stock changes as Server-Sent Events (changefeed.py)
+from flask import Blueprint, Response, jsonify, request
+
+import changefeed
+
+bp = Blueprint("changes", __name__)
+
+@bp.route("/changes", methods=["GET"])
+def changes():
+    # One thread per subscriber here; asgi.py serves /changes on its event loop
+    subscription = changefeed.Subscription(
+        changefeed.feed, request.headers.get("Last-Event-ID") or request.args.get("last_event_id"))
+    return Response(subscription.stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@bp.route("/admin/changes", methods=["GET"])
+def change_feed_stats():
+    return jsonify(changefeed.feed.stats())
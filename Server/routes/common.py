@@ -0,0 +1,21 @@
+# Helpers shared by the blueprints
+from flask import Response, jsonify, request
+import mysql.connector
+
+import listing
+
+def listing_response(spec):
+    # ?limit= pages with a keyset cursor; otherwise the rows are streamed as a
+    # JSON array (the original shape) or, with ?format=ndjson, one per line
+    try:
+        if request.args.get("limit"):
+            return jsonify(listing.page(spec, request.args))
+        ndjson = request.args.get("format") == "ndjson"
+        chunks, close = listing.stream(spec, request.args, ndjson=ndjson)
+        response = Response(chunks, mimetype="application/x-ndjson" if ndjson else "application/json")
+        response.call_on_close(close)
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except mysql.connector.Error as err:
+        return jsonify({"error": str(err)}), 500
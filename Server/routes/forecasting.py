@@ -0,0 +1,193 @@
+# Demand forecasts, the models behind them and the reorder plan
+#
+# Nothing heavy comes in with this module: numpy, the rolling sales index and
+# the forecast caches are built by forecasting() on first use, and a model
+# (joblib, sklearn, pandas) is loaded by the first lookup against it.
+# warm_up() does both ahead of time on create_app's background thread, and
+# with FORECAST_PRECOMPUTE set also fills the default model's cache.
+import logging
+import os
+import threading
+from contextlib import closing
+
+from flask import Blueprint, Response, jsonify, request
+import mysql.connector
+
+from db import db_connection
+from ledger import LedgerError, get_ledger
+from model_registry import registry as model_registry
+from replicas import read_connection
+import services
+from signals import sales_recorded
+
+log = logging.getLogger("smartretail")
+
+bp = Blueprint("forecasting", __name__)
+
+
+class Forecasting:
+    """The sales index behind the lag features and the per-model forecast caches."""
+
+    def __init__(self):
+        import forecast
+        import sales_index
+        self.lags = sales_index.create_index()
+        sales_recorded.connect(self.lags.on_sales_recorded)
+        self.caches = forecast.ForecastCaches(model_registry, lags=self.lags)
+
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def forecasting():
+    global _state
+    if _state is None:
+        with _state_lock:
+            if _state is None:
+                state = Forecasting()
+                # Lags read as zero until the index is loaded
+                threading.Thread(target=warm_sales_index, args=(state.lags,), daemon=True).start()
+                _state = state
+    return _state
+
+
+def warm_sales_index(lags):
+    import sales_index
+    try:
+        sales_index.warm(lags)
+        log.info("sales index warmed: %s", lags.stats())
+    except Exception:
+        log.exception("sales index warm-up failed")
+
+
+def sync_sales_index(lags):
+    # Sales recorded by sibling workers only reach this process's index by reloading it
+    import sales_index
+    try:
+        sales_index.sync(lags)
+    except Exception:
+        log.exception("sales index sync failed")
+
+
+def precompute_forecasts():
+    try:
+        with read_connection() as conn, closing(conn.cursor()) as cursor:
+            cursor.execute("SELECT id FROM products")
+            product_ids = [pid for (pid,) in cursor.fetchall()]
+        filled = forecasting().caches.get().warm(product_ids)
+        log.info("precomputed forecasts for %d products", filled)
+    except Exception:
+        log.exception("forecast precompute failed")
+
+
+def warm_up():
+    global _state
+    with _state_lock:
+        built = _state is None
+        if built:
+            _state = Forecasting()
+    if built:
+        # Already on a background thread (or the pre-fork master), so no need for another
+        warm_sales_index(_state.lags)
+    model_registry.preload()
+    if os.environ.get("FORECAST_PRECOMPUTE"):
+        precompute_forecasts()
+
+
+def model_cache():
+    try:
+        state = forecasting()
+        sync_sales_index(state.lags)
+        return state.caches.get(request.args.get("model")), None
+    except KeyError as e:
+        return None, (jsonify({"error": e.args[0]}), 400)
+    except Exception as e:
+        return None, (jsonify({"error": f"ML model not loaded: {e}"}), 500)
+
+@bp.route("/predict_demand", methods=["GET"])
+def predict_demand():
+    cache, error = model_cache()
+    if error:
+        return error
+    payload, status = services.predict_demand(cache, request.args)
+    return jsonify(payload), status
+
+@bp.route("/predict_demand/batch", methods=["POST"])
+def predict_demand_batch():
+    cache, error = model_cache()
+    if error:
+        return error
+    try:
+        product_ids, months, weeks = services.parse_predict_batch(request.get_json())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        predictions = cache.lookup(product_ids, months, weeks)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    import forecast
+    ndjson = request.args.get("format") == "ndjson"
+    return Response(forecast.stream_predictions(product_ids, months, weeks, predictions, ndjson=ndjson),
+                    mimetype="application/x-ndjson" if ndjson else "application/json")
+
+@bp.route("/predict_demand/cache")
+def forecast_cache_stats():
+    return jsonify(forecasting().caches.stats())
+
+@bp.route("/admin/models", methods=["GET"])
+def list_models():
+    return jsonify(model_registry.status())
+
+@bp.route("/admin/models/reload", methods=["POST"])
+def reload_model():
+    name = (request.get_json(silent=True) or {}).get("name") or request.args.get("name")
+    try:
+        return jsonify(model_registry.reload(name))
+    except KeyError:
+        return jsonify({"error": f"Unknown model {name!r}"}), 404
+    except Exception as e:
+        return jsonify({"error": f"Reload failed, previous version still served: {e}"}), 500
+
+@bp.route("/predict_demand/lags")
+def sales_lags():
+    import forecast
+    lags = forecasting().lags
+    sync_sales_index(lags)
+    product_id = request.args.get("product_id", type=int)
+    if product_id is None:
+        return jsonify(lags.stats())
+    values = lags.lag_features([product_id])[0]
+    return jsonify({"product_id": product_id, **dict(zip(forecast.LAG_FEATURES, values.astype(int).tolist()))})
+
+@bp.route("/predict_demand/lags/check")
+def sales_lags_check():
+    import sales_index
+    try:
+        return jsonify(sales_index.check(forecasting().lags))
+    except mysql.connector.Error as err:
+        return jsonify({"error": str(err)}), 500
+
+@bp.route("/reorder/plan", methods=["GET"])
+def reorder_plan():
+    import reorder
+    cache, error = model_cache()
+    if error:
+        return error
+    try:
+        stock = get_ledger()
+        if stock is not None:
+            # Plan from the batches as the ledger sees them, not a flush behind
+            stock.drain()
+        with (db_connection if stock is not None else read_connection)() as conn:
+            return jsonify(reorder.plan(
+                cache, conn, request.args.get("weeks", 4, type=int),
+                supplier=request.args.get("supplier"),
+                category=request.args.get("category"),
+                include_all=request.args.get("all") in ("1", "true"),
+            ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except (mysql.connector.Error, LedgerError) as err:
+        return jsonify({"error": str(err)}), 500
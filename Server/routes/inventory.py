@@ -0,0 +1,205 @@
+# Batches and stock: /inventory, /stock, expiring batches and the stock ledger admin
+from contextlib import closing
+from datetime import date
+
+from flask import Blueprint, jsonify, request
+import mysql.connector
+
+from allocation import reduce_batch
+from db import db_connection
+import http_cache
+from ingest import INGEST_CHUNK_SIZE, ingest_inventory_csv
+from ledger import LedgerError, get_ledger, reconcile
+import listing
+from replicas import read_connection
+from routes.common import listing_response
+from signals import inventory_changed
+
+bp = Blueprint("inventory", __name__)
+
+
+def warm_up():
+    # numpy, behind the expiry index
+    import expiry
+
+@bp.route("/inventory/upload_csv", methods=["POST"])
+def upload_inventory_csv():
+    if "file" not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    file = request.files["file"]
+    if file.filename == "":
+        return jsonify({"error": "Empty file name"}), 400
+
+    chunk_size = request.args.get("chunk_size", INGEST_CHUNK_SIZE, type=int)
+    try:
+        with db_connection() as conn:
+            report = ingest_inventory_csv(file.stream, conn, chunk_size=max(1, chunk_size))
+        return jsonify(report.to_dict()), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except mysql.connector.Error as err:
+        return jsonify({"error": str(err)}), 500
+
+@bp.route("/inventory", methods=["GET"])
+@http_cache.versioned("catalogue", "inventory")
+def get_inventory():
+    return listing_response(listing.INVENTORY)
+
+@bp.route("/inventory", methods=["POST"])
+def add_inventory():
+    try:
+        data = request.get_json()
+        fields = ["product_id", "quantity", "expiry_date", "supplier_name", "order_date", "delivery_date"]
+        for field in fields:
+            if field not in data:
+                return jsonify({"error": f"{field} is required"}), 400
+        # Listings page on (expiry_date, id), so every batch needs a date
+        try:
+            date.fromisoformat(str(data["expiry_date"]))
+        except ValueError:
+            return jsonify({"error": "expiry_date must be a YYYY-MM-DD date"}), 400
+
+        with db_connection() as conn, closing(conn.cursor()) as cursor:
+            cursor.execute("""
+                INSERT INTO product_inventory_batches (product_id, quantity, expiry_date, supplier_name, order_date, delivery_date)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (
+                data["product_id"], data["quantity"], data["expiry_date"],
+                data["supplier_name"], data["order_date"], data["delivery_date"]
+            ))
+            batch_id = cursor.lastrowid
+            cursor.execute("UPDATE products SET inventory = inventory + %s WHERE id = %s",
+                           (data["quantity"], data["product_id"]))
+            conn.commit()
+        inventory_changed.send("inventory", changes=[{
+            "op": "add", "product_id": int(data["product_id"]), "batch_id": batch_id,
+            "delta": int(data["quantity"]), "quantity": int(data["quantity"]), "expiry_date": data["expiry_date"],
+            "supplier_name": data["supplier_name"], "order_date": data["order_date"],
+            "delivery_date": data["delivery_date"]
+        }])
+        return jsonify({"message": "Inventory added"})
+    except mysql.connector.Error as err:
+        return jsonify({"error": str(err)}), 500
+
+@bp.route("/inventory/reduce", methods=["POST"])
+def reduce_inventory_quantity():
+    try:
+        data = request.get_json()
+        inventory_id = data.get("inventory_id")
+        qty_to_reduce = data.get("quantity")
+
+        if not inventory_id or not qty_to_reduce:
+            return jsonify({"error": "Missing inventory_id or quantity"}), 400
+        try:
+            inventory_id, qty_to_reduce = int(inventory_id), int(qty_to_reduce)
+        except (TypeError, ValueError):
+            return jsonify({"error": "inventory_id and quantity must be integers"}), 400
+        if qty_to_reduce <= 0:
+            return jsonify({"error": "quantity must be positive"}), 400
+
+        stock = get_ledger()
+        if stock is not None:
+            try:
+                stock.reduce(inventory_id, qty_to_reduce)
+            except KeyError:
+                return jsonify({"error": "Inventory entry not found"}), 404
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify({"message": "Inventory updated"})
+
+        with db_connection() as conn, closing(conn.cursor()) as cursor:
+            cursor.execute("SELECT quantity, product_id FROM product_inventory_batches WHERE id = %s", (inventory_id,))
+            row = cursor.fetchone()
+            if not row:
+                return jsonify({"error": "Inventory entry not found"}), 404
+
+            current_qty, product_id = row
+            if qty_to_reduce > current_qty:
+                return jsonify({"error": "Not enough quantity to reduce"}), 400
+            op = "delete" if qty_to_reduce == current_qty else "update"
+            reduce_batch(cursor, product_id, inventory_id, qty_to_reduce, delete=op == "delete")
+
+            conn.commit()
+        inventory_changed.send("inventory", changes=[{
+            "op": op, "product_id": product_id, "batch_id": inventory_id, "delta": -qty_to_reduce,
+            "quantity": current_qty - qty_to_reduce
+        }])
+        return jsonify({"message": "Inventory updated"})
+    except (mysql.connector.Error, LedgerError) as err:
+        return jsonify({"error": str(err)}), 500
+
+@bp.route("/stock", methods=["GET"])
+@http_cache.versioned("inventory")
+def stock_levels():
+    try:
+        product_ids = [int(p) for p in request.args.get("product_ids", "").split(",") if p.strip()]
+    except ValueError:
+        return jsonify({"error": "product_ids must be a comma separated list of ids"}), 400
+    if not product_ids:
+        return jsonify({"error": "product_ids is required"}), 400
+    stock = get_ledger()
+    if stock is not None:
+        return jsonify({str(pid): qty for pid, qty in stock.available(product_ids).items()})
+    try:
+        placeholders = ", ".join(["%s"] * len(product_ids))
+        with read_connection() as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(f"""
+                SELECT product_id, SUM(quantity) FROM product_inventory_batches
+                WHERE product_id IN ({placeholders}) GROUP BY product_id
+            """, product_ids)
+            totals = {pid: int(qty or 0) for pid, qty in cursor.fetchall()}
+        return jsonify({str(pid): totals.get(pid, 0) for pid in product_ids})
+    except mysql.connector.Error as err:
+        return jsonify({"error": str(err)}), 500
+
+@bp.route("/admin/stock", methods=["GET"])
+def stock_ledger_stats():
+    stock = get_ledger()
+    return jsonify({"enabled": False} if stock is None else {"enabled": True, **stock.stats()})
+
+@bp.route("/admin/stock/reconcile", methods=["GET", "POST"])
+def reconcile_stock():
+    # GET reports drift between products.inventory and the batches; POST also fixes it
+    try:
+        stock = get_ledger()
+        with db_connection() as conn:
+            report = reconcile(conn, fix=request.method == "POST")
+        if stock is not None:
+            report["ledger_mismatches"] = stock.verify()
+        return jsonify(report)
+    except (mysql.connector.Error, LedgerError) as err:
+        return jsonify({"error": str(err)}), 500
+
+@bp.route("/inventory/expiring", methods=["GET"])
+@http_cache.versioned("catalogue", "inventory")
+def expiring_inventory():
+    from expiry import MAX_EXPIRY_DAYS, index as expiry_index
+    days = request.args.get("days", 7, type=int)
+    group_by = request.args.get("group_by", "product")
+    if days is None or not 0 <= days <= MAX_EXPIRY_DAYS or group_by not in ("product", "supplier"):
+        return jsonify({"error": f"days must be an integer from 0 to {MAX_EXPIRY_DAYS} "
+                                 "and group_by product or supplier"}), 400
+    try:
+        return jsonify(expiry_index.expiring(
+            days, group_by=group_by,
+            include_expired=request.args.get("include_expired") in ("1", "true"),
+            list_batches=request.args.get("batches") in ("1", "true"),
+        ))
+    except mysql.connector.Error as err:
+        return jsonify({"error": str(err)}), 500
+
+@bp.route("/inventory/<int:product_id>", methods=["GET"])
+@http_cache.versioned("inventory")
+def get_inventory_by_product(product_id):
+    try:
+        with read_connection() as conn, closing(conn.cursor(dictionary=True)) as cursor:
+            cursor.execute("""
+                SELECT * FROM product_inventory_batches
+                WHERE product_id = %s AND quantity > 0
+                ORDER BY expiry_date ASC
+            """, (product_id,))
+            batches = cursor.fetchall()
+        return jsonify(batches)
+    except mysql.connector.Error as err:
+        return jsonify({"error": str(err)}), 500
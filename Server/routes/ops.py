@@ -0,0 +1,38 @@
+# Service status: liveness, pool, replica and memory stats, Prometheus metrics
+import os
+
+from flask import Blueprint, Response, jsonify
+
+from db import get_pool
+import metrics
+import prefork
+import replicas
+
+bp = Blueprint("ops", __name__)
+
+@bp.route("/")
+def home():
+    return "SmartRetail Backend is running."
+
+@bp.route("/db/pool")
+def pool_stats():
+    return jsonify(get_pool().stats())
+
+@bp.route("/db/replicas")
+def replica_stats():
+    return jsonify(replicas.replicas.stats())
+
+@bp.route("/admin/memory")
+def worker_memory():
+    # The worker that answered; `python prefork.py memory --pid <master>` covers them all
+    return jsonify({"pid": os.getpid(), "parent": os.getppid(), **prefork.memory()})
+
+@bp.route("/metrics")
+def prometheus_metrics():
+    pool = get_pool().stats()
+    gauges = {
+        "smartretail_db_pool_open": ("Open pooled connections", pool["open"]),
+        "smartretail_db_pool_in_use": ("Pooled connections checked out", pool["in_use"]),
+        "smartretail_db_pool_idle": ("Pooled connections parked idle", pool["idle"]),
+    }
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,50 @@
+# Sales: /sales/sell, /create-invoice and the /sales/timeseries rollups
+from flask import Blueprint, jsonify, request
+import mysql.connector
+
+from invoice_queue import invoices
+from replicas import read_connection
+import http_cache
+import rollups
+import services
+
+bp = Blueprint("sales", __name__)
+
+@bp.route("/sales/timeseries", methods=["GET"])
+@http_cache.versioned("catalogue", "sales")
+def sales_timeseries():
+    # Served from the sales_daily/sales_weekly rollups, never the sales table
+    args = request.args
+    if not args.get("start") or not args.get("end"):
+        return jsonify({"error": "start and end (YYYY-MM-DD) are required"}), 400
+    try:
+        product_ids = [int(p) for p in args.get("product_id", "").split(",") if p.strip()]
+        with read_connection() as conn:
+            series = rollups.timeseries(
+                conn, args["start"], args["end"],
+                granularity=args.get("granularity", "day"),
+                group_by=args.get("group_by", "total"),
+                product_ids=product_ids,
+                category=args.get("category"),
+                category_id=args.get("category_id", type=int),
+                fill=args.get("fill", "true") not in ("0", "false"),
+            )
+        return jsonify(series)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except mysql.connector.Error as err:
+        return jsonify({"error": str(err)}), 500
+
+@bp.route("/sales/sell", methods=["POST"])
+def sell_product():
+    payload, status = services.sell(request.get_json(silent=True))
+    return jsonify(payload), status
+
+@bp.route("/create-invoice", methods=["POST"])
+def create_invoice():
+    payload, status = services.create_invoice(request.get_json(silent=True), request.headers.get("Idempotency-Key"))
+    return jsonify(payload), status
+
+@bp.route("/admin/invoice-queue", methods=["GET"])
+def invoice_queue_stats():
+    return jsonify(invoices.stats())
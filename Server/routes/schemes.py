@@ -0,0 +1,88 @@
+# /schemes: the static list of government schemes for retailers
+from flask import Blueprint
+
+import http_cache
+
+bp = Blueprint("schemes", __name__)
+
+SCHEMES = [
+    {
+        "name": "Pradhan Mantri MUDRA Yojana (PMMY)",
+        "description": "Collateral-free loans up to ₹10 lakh for micro/small businesses including grocery shops.",
+        "link": "https://www.mudra.org.in/",
+        "category": "Finance",
+        "icon": "💰",
+        "type": "Retail"
+    },
+    {
+        "name": "Stand-Up India Scheme",
+        "description": "Loans from ₹10 lakh to ₹1 crore for women and SC/ST entrepreneurs in retail sectors.",
+        "link": "https://www.standupmitra.in/",
+        "category": "Women-focused",
+        "icon": "👩‍💼",
+        "type": "Retail"
+    },
+    {
+        "name": "PM Formalization of Micro Food Processing Enterprises (PMFME)",
+        "description": "Support for local food processing businesses, great for grocery chains and kirana stores.",
+        "link": "https://mofpi.nic.in/pmfme/",
+        "category": "Food/Agri",
+        "icon": "🍱",
+        "type": "Food Retail"
+    },
+    {
+        "name": "National Small Industries Corporation (NSIC) Subsidy",
+        "description": "Marketing and credit support for small retail businesses like supermarkets.",
+        "link": "https://www.nsic.co.in/",
+        "category": "Finance",
+        "icon": "🏬",
+        "type": "Retail"
+    },
+    {
+        "name": "MSME Competitive Lean Scheme",
+        "description": "Encourages lean manufacturing practices even in grocery storage and supply chain.",
+        "link": "https://dcmsme.gov.in/CLCS_TUS.htm",
+        "category": "Operations",
+        "icon": "📦",
+        "type": "Retail"
+    },
+    {
+        "name": "Market Development Assistance Scheme",
+        "description": "Helps MSMEs participate in trade fairs and get marketing support.",
+        "link": "https://msme.gov.in/",
+        "category": "Marketing",
+        "icon": "📢",
+        "type": "Retail"
+    },
+    {
+        "name": "Digital MSME Scheme",
+        "description": "Promotes digital tools and cloud-based solutions for MSMEs including retail.",
+        "link": "https://msme.gov.in/",
+        "category": "Technology",
+        "icon": "💻",
+        "type": "Retail Tech"
+    },
+    {
+        "name": "SIDBI Make in India Soft Loan Fund for Micro Small and Medium Enterprises (SMILE)",
+        "description": "Soft loans for new and existing MSMEs including supermarkets to upgrade.",
+        "link": "https://www.sidbi.in/",
+        "category": "Finance",
+        "icon": "📈",
+        "type": "Retail"
+    },
+    {
+        "name": "Credit Linked Capital Subsidy Scheme (CLCSS)",
+        "description": "Subsidy for technology upgrades including POS and billing systems in grocery stores.",
+        "link": "https://www.dcmsme.gov.in/schemes/sccr.htm",
+        "category": "Tech Upgrade",
+        "icon": "🧾",
+        "type": "Retail Tech"
+    }
+]
+
+# Never changes, so it is serialized and compressed once
+SCHEMES_BODY = http_cache.Body.json(SCHEMES, best=True)
+
+@bp.route("/schemes")
+def get_schemes():
+    return http_cache.respond(SCHEMES_BODY)
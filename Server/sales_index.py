@@ -0,0 +1,237 @@
+# Rolling per-product daily sales totals backing the forecast lag features
+import csv
+import os
+import threading
+import time
+from contextlib import closing
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from forecast import LAG_WINDOWS
+from replicas import cache_connection
+import versions
+
+# Ring buffer length in days; must cover the longest lag window
+WINDOW_DAYS = 35
+# Warm from a sales CSV (e.g. sales_data.csv) instead of the sales table
+SALES_INDEX_CSV = os.environ.get("SALES_INDEX_CSV")
+# How often a worker looks for sales its siblings recorded (versions.foreign)
+SALES_INDEX_SYNC_SECONDS = float(os.environ.get("SALES_INDEX_SYNC_SECONDS", 5))
+
+WINDOW_SALES_SQL = """
+    SELECT product_id, sale_date, SUM(quantity)
+    FROM sales
+    WHERE sale_date >= %s
+    GROUP BY product_id, sale_date
+"""
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    for fmt in ("%Y-%m-%d", "%m/%d/%Y"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Unrecognised sale_date {value!r}")
+
+
+def rows_from_db(conn, since):
+    with closing(conn.cursor()) as cursor:
+        cursor.execute(WINDOW_SALES_SQL, (since,))
+        return [(pid, _parse_date(day), int(qty)) for pid, day, qty in cursor.fetchall()]
+
+
+def rows_from_csv(path):
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            yield int(row["product_id"]), _parse_date(row["sale_date"]), int(row["quantity"])
+
+
+class RollingSalesIndex:
+    """Daily sales per product for the last ``window`` days.
+
+    Each product owns a row of a 2-D array used as a ring buffer indexed by
+    date ordinal, so recording a sale and reading the lag features are both
+    constant time. With ``follow_clock`` the newest day tracks the wall
+    clock; otherwise it tracks the newest sale seen (for replaying history).
+    """
+
+    def __init__(self, window=WINDOW_DAYS, follow_clock=True):
+        if window < max(LAG_WINDOWS) + 1:
+            raise ValueError("window must cover the longest lag window")
+        self.window = window
+        self.follow_clock = follow_clock
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.mark = None
+        self.checked_at = 0.0
+        self._reset()
+
+    def _reset(self):
+        self._rows = {}
+        self._versions = {}
+        self._daily = np.zeros((0, self.window), dtype=np.int64)
+        self.today = None
+        self.updates = 0
+
+    def _row(self, product_id):
+        row = self._rows.get(product_id)
+        if row is None:
+            row = len(self._rows)
+            if row >= len(self._daily):
+                grown = np.zeros((max(64, row * 2), self.window), dtype=np.int64)
+                grown[:len(self._daily)] = self._daily
+                self._daily = grown
+            self._rows[product_id] = row
+        return row
+
+    def _advance(self, ordinal):
+        if self.today is None:
+            self.today = ordinal
+            return
+        if ordinal <= self.today:
+            return
+        if ordinal - self.today >= self.window:
+            self._daily[:] = 0
+        else:
+            for day in range(self.today + 1, ordinal + 1):
+                self._daily[:, day % self.window] = 0
+        self.today = ordinal
+
+    def _sync_clock(self):
+        if self.follow_clock:
+            self._advance(date.today().toordinal())
+
+    def _add(self, product_id, sale_date, quantity):
+        ordinal = sale_date.toordinal()
+        self._advance(ordinal)
+        if ordinal <= self.today - self.window:
+            return
+        row = self._row(product_id)
+        self._daily[row, ordinal % self.window] += quantity
+        self._versions[product_id] = self._versions.get(product_id, 0) + 1
+        self.updates += 1
+
+    def add(self, product_id, sale_date, quantity):
+        with self._lock:
+            self._sync_clock()
+            self._add(product_id, _parse_date(sale_date), quantity)
+
+    def load(self, rows):
+        with self._lock:
+            self._reset()
+            self.loads += 1
+            self._sync_clock()
+            for product_id, sale_date, quantity in rows:
+                self._add(product_id, sale_date, quantity)
+
+    def warm_from_db(self, conn):
+        since = date.today() - timedelta(days=self.window - 1)
+        self.load(rows_from_db(conn, since))
+
+    def warm_from_csv(self, path):
+        self.load(rows_from_csv(path))
+
+    def on_sales_recorded(self, sender, rows):
+        with self._lock:
+            self._sync_clock()
+            for product_id, _, quantity, sale_date in rows:
+                self._add(product_id, _parse_date(sale_date), quantity)
+
+    def stamps(self, product_ids):
+        # Changes whenever a product's lag features could have changed; a
+        # reload restarts the per-product counts, hence the load number
+        with self._lock:
+            self._sync_clock()
+            return [(self.today, self.loads, self._versions.get(pid, 0)) for pid in product_ids]
+
+    def lag_features(self, product_ids):
+        """(n, 3) array of last week / 2 weeks / month sales, excluding today."""
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        longest = max(LAG_WINDOWS)
+        with self._lock:
+            self._sync_clock()
+            out = np.zeros((len(product_ids), len(LAG_WINDOWS)), dtype=np.float64)
+            if self.today is None or not self._rows:
+                return out
+            rows = np.fromiter((self._rows.get(pid, -1) for pid in product_ids.tolist()), dtype=np.int64,
+                               count=len(product_ids))
+            known = rows >= 0
+            slots = [(self.today - k) % self.window for k in range(1, longest + 1)]
+            cumulative = np.cumsum(self._daily[np.ix_(rows[known], slots)], axis=1)
+        out[known] = cumulative[:, [n - 1 for n in LAG_WINDOWS]]
+        return out
+
+    def verify(self, rows):
+        """Compare the live buffers with a from-scratch rebuild over ``rows``."""
+        rebuilt = RollingSalesIndex(self.window, follow_clock=self.follow_clock)
+        rebuilt.load(rows)
+        zeros = np.zeros(self.window, dtype=np.int64)
+        mismatches = []
+        with self._lock:
+            self._sync_clock()
+            if self.today is not None:
+                rebuilt._advance(self.today)
+            for product_id in sorted(set(self._rows) | set(rebuilt._rows)):
+                live = self._daily[self._rows[product_id]] if product_id in self._rows else zeros
+                expected = rebuilt._daily[rebuilt._rows[product_id]] if product_id in rebuilt._rows else zeros
+                for slot in np.nonzero(live != expected)[0].tolist():
+                    day = rebuilt.today - (rebuilt.today - slot) % self.window
+                    mismatches.append({"product_id": product_id, "day": date.fromordinal(day).isoformat(),
+                                       "live": int(live[slot]), "expected": int(expected[slot])})
+            products = len(self._rows)
+        return {"products": products, "consistent": not mismatches, "mismatches": mismatches}
+
+    def verify_db(self, conn):
+        with self._lock:
+            self._sync_clock()
+            newest = date.fromordinal(self.today) if self.today else date.today()
+        return self.verify(rows_from_db(conn, newest - timedelta(days=self.window - 1)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "products": len(self._rows),
+                "window_days": self.window,
+                "today": date.fromordinal(self.today).isoformat() if self.today else None,
+                "updates": self.updates,
+            }
+
+
+def create_index():
+    # Replayed CSV history is anchored at its newest sale, the live table at today
+    return RollingSalesIndex(follow_clock=not SALES_INDEX_CSV)
+
+
+def warm(index):
+    if SALES_INDEX_CSV:
+        index.warm_from_csv(SALES_INDEX_CSV)
+    else:
+        mark = versions.mark("sales")
+        with cache_connection() as conn:
+            index.warm_from_db(conn)
+        index.mark = mark
+
+
+def sync(index):
+    """Reload ``index`` if sibling workers recorded sales since it was warmed."""
+    now = time.monotonic()
+    if SALES_INDEX_CSV or now - index.checked_at < SALES_INDEX_SYNC_SECONDS:
+        return False
+    index.checked_at = now
+    if not versions.foreign(index.mark):
+        return False
+    warm(index)
+    return True
+
+
+def check(index):
+    if SALES_INDEX_CSV:
+        return index.verify(rows_from_csv(SALES_INDEX_CSV))
+    with cache_connection() as conn:
+        return index.verify_db(conn)
@@ -0,0 +1,128 @@
+# Transport-independent route logic shared by the Flask app (app.py) and the
+# ASGI app (asgi.py). Each function returns (payload, status).
+import logging
+
+import mysql.connector
+
+from allocation import allocate_fefo
+from db import db_connection
+from invoice_queue import INVOICE_QUEUE, invoices
+from ledger import LedgerError, get_ledger
+
+log = logging.getLogger("smartretail")
+
+
+def allocate_stock(user_id, items, partial=False):
+    # The in-memory ledger when enabled, otherwise a locking transaction
+    stock = get_ledger()
+    if stock is not None:
+        return stock.allocate(user_id, items, partial=partial)
+    with db_connection() as conn:
+        return allocate_fefo(conn, user_id, items, partial=partial)
+
+
+def _integer(data, field):
+    # Raises ValueError with the message the client gets back
+    value = data.get(field)
+    if value is None:
+        raise ValueError(f"'{field}' is required")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{field}' must be an integer")
+
+
+def sell(data):
+    if not isinstance(data, dict):
+        return {"error": "Invalid JSON body"}, 400
+    try:
+        user_id = _integer(data, "user_id")
+        product_id = _integer(data, "product_id")
+        quantity = _integer(data, "quantity")
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    if quantity <= 0:
+        return {"error": "quantity must be positive"}, 400
+
+    try:
+        allocation = allocate_stock(user_id, [{"product_id": product_id, "quantity": quantity}], partial=True)
+        log.info("sale of product %s allocated in %.1f ms", product_id, allocation.latency_ms)
+        return {
+            "message": "Sale recorded",
+            "unsold_quantity": allocation.shortfall.get(product_id, 0),
+            "latency_ms": allocation.latency_ms
+        }, 200
+    except (mysql.connector.Error, LedgerError) as err:
+        return {"error": str(err)}, 500
+
+
+def create_invoice(data, idempotency_key=None):
+    if not isinstance(data, dict):
+        return {"error": "Invalid JSON body"}, 400
+    user_id = data.get("user_id")
+    items = data.get("items", [])
+    if not user_id or not isinstance(items, list) or not items:
+        return {"error": "Invalid request. 'user_id' and 'items' are required."}, 400
+    # Checked before queueing: a value the database rejects would fail the whole group's commit
+    if not all(isinstance(item, dict) for item in items):
+        return {"error": "Each item must be an object with 'product_id' and 'quantity'"}, 400
+    try:
+        user_id = _integer(data, "user_id")
+        items = [{"product_id": _integer(item, "product_id"), "quantity": _integer(item, "quantity")}
+                 for item in items]
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    try:
+        # The ledger already group-commits through its journal; the queue
+        # does the same for the database path and deduplicates retries
+        if INVOICE_QUEUE and get_ledger() is None:
+            return invoices.submit(user_id, items, idempotency_key or data.get("idempotency_key"))
+
+        allocation = allocate_stock(user_id, items)
+        log.info("invoice of %d products allocated in %.1f ms", len(allocation.requested), allocation.latency_ms)
+
+        if not allocation.complete:
+            product_id = next(iter(allocation.shortfall))
+            return {
+                "error": f"Insufficient stock for product ID {product_id}",
+                "shortfall": allocation.shortfall,
+                "latency_ms": allocation.latency_ms
+            }, 400
+
+        return {"message": "Invoice created successfully", "latency_ms": allocation.latency_ms}, 200
+
+    except (mysql.connector.Error, LedgerError) as err:
+        return {"error": str(err)}, 500
+
+
+def predict_demand(cache, args):
+    import forecast
+    product_id, month, week = (args.get(name) for name in ("product_id", "month", "week"))
+    if not product_id or not month or not week:
+        return {"error": "Missing parameters. Please provide product_id, month, and week."}, 400
+    try:
+        product_id, month, week = int(product_id), int(month), int(week)
+        forecast.validate([product_id], [month], [week])
+    except (TypeError, ValueError, OverflowError) as e:
+        return {"error": str(e)}, 400
+
+    try:
+        prediction = cache.get(product_id, month, week)
+        return {
+            "product_id": product_id,
+            "month": month,
+            "week": week,
+            "predicted_demand": round(prediction)
+        }, 200
+    except Exception as e:
+        return {"error": str(e)}, 500
+
+
+def parse_predict_batch(data):
+    """(product_ids, months, weeks) or raises ValueError for a bad request."""
+    import forecast
+    try:
+        return forecast.validate(*forecast.parse_batch_request(data or {}))
+    except (KeyError, TypeError) as e:
+        raise ValueError(str(e))
@@ -0,0 +1,17 @@
+# In-process notifications sent by write paths after they commit
+from blinker import Namespace
+
+_signals = Namespace()
+
+# rows: [(product_id, batch_id, quantity, sale_date)]
+sales_recorded = _signals.signal("sales-recorded")
+
+# changes: [{"op": "add" | "update" | "delete", "product_id", "batch_id", "delta", ...}]
+# "add" changes also carry expiry_date and supplier_name (and order_date and
+# delivery_date from the API); batch_id is None when the id isn't known (bulk
+# CSV ingestion). "quantity", where known, is the batch's quantity after the
+# change.
+inventory_changed = _signals.signal("inventory-changed")
+
+# product_id, action: "added" | "deleted"
+catalogue_changed = _signals.signal("catalogue-changed")
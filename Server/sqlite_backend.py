@@ -0,0 +1,249 @@
+# SQLite stand-in for MySQL (DB_BACKEND=sqlite), for benchmarks and local runs
+#
+# Wraps sqlite3 in the slice of the mysql.connector API this app uses:
+# %s placeholders, dictionary cursors, ping/consume_results, and errors
+# raised as mysql.connector.Error so the routes' handlers still apply.
+# MySQL-only syntax the app emits is rewritten on the way in.
+import os
+import re
+import sqlite3
+from datetime import date, datetime
+
+import mysql.connector
+
+# Mirrors migrations/ (MySQL), including the hot-path indexes
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        category_id INTEGER REFERENCES categories(id),
+        price REAL NOT NULL DEFAULT 0,
+        inventory INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS product_inventory_batches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        expiry_date DATE NOT NULL,
+        supplier_name TEXT,
+        order_date DATE,
+        delivery_date DATE
+    );
+    CREATE TABLE IF NOT EXISTS sales (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        sale_date DATE NOT NULL,
+        batch_id INTEGER,
+        sale_month TEXT GENERATED ALWAYS AS (strftime('%Y-%m', sale_date)) STORED
+    );
+    CREATE TABLE IF NOT EXISTS stock_ledger_checkpoint (
+        id INTEGER PRIMARY KEY,
+        seq INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS sales_daily (
+        product_id INTEGER NOT NULL,
+        sale_date DATE NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        line_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (product_id, sale_date)
+    );
+    CREATE TABLE IF NOT EXISTS sales_weekly (
+        product_id INTEGER NOT NULL,
+        week_start DATE NOT NULL,
+        iso_year INTEGER NOT NULL,
+        iso_week INTEGER NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        line_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (product_id, week_start)
+    );
+    CREATE TABLE IF NOT EXISTS invoice_requests (
+        idempotency_key TEXT PRIMARY KEY,
+        user_id INTEGER,
+        request_hash TEXT NOT NULL,
+        response TEXT NOT NULL,
+        created_at DATETIME NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS replication_heartbeat (
+        id INTEGER PRIMARY KEY,
+        beat REAL NOT NULL
+    );
+    INSERT OR IGNORE INTO replication_heartbeat (id, beat) VALUES (1, 0);
+    CREATE INDEX IF NOT EXISTS idx_invoice_requests_created ON invoice_requests (created_at);
+    CREATE INDEX IF NOT EXISTS idx_sales_daily_date ON sales_daily (sale_date, product_id);
+    CREATE INDEX IF NOT EXISTS idx_sales_weekly_week ON sales_weekly (week_start, product_id);
+    CREATE INDEX IF NOT EXISTS idx_products_category ON products (category_id);
+    CREATE INDEX IF NOT EXISTS idx_batches_product_expiry
+        ON product_inventory_batches (product_id, expiry_date, id, quantity);
+    CREATE INDEX IF NOT EXISTS idx_batches_expiry ON product_inventory_batches (expiry_date, id);
+    CREATE INDEX IF NOT EXISTS idx_sales_date_product ON sales (sale_date, product_id, quantity);
+    CREATE INDEX IF NOT EXISTS idx_sales_product ON sales (product_id, quantity);
+    CREATE INDEX IF NOT EXISTS idx_sales_month ON sales (sale_month, quantity);
+"""
+
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+
+_FOR_UPDATE = re.compile(r"\s+(?:FOR\s+UPDATE|FOR\s+SHARE|LOCK\s+IN\s+SHARE\s+MODE)\b", re.IGNORECASE)
+_ON_DUPLICATE = re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.IGNORECASE)
+_VALUES_REF = re.compile(r"\bVALUES\((\w+)\)", re.IGNORECASE)
+
+# Statement listeners get (sql, many) for every execute; used for round-trip counting
+statement_listeners = []
+
+
+def _date_format(value, fmt):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.strftime(fmt)
+
+
+def _convert_date(raw):
+    return date.fromisoformat(raw.decode()[:10])
+
+
+def _convert_datetime(raw):
+    return datetime.fromisoformat(raw.decode())
+
+
+sqlite3.register_converter("DATE", _convert_date)
+sqlite3.register_converter("DATETIME", _convert_datetime)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+
+
+def translate(sql, has_params):
+    sql = _FOR_UPDATE.sub("", sql)
+    match = _ON_DUPLICATE.search(sql)
+    if match:
+        # Upsert: SQLite names the incoming row "excluded" instead of VALUES(col)
+        sql = sql[:match.start()] + "ON CONFLICT DO UPDATE SET" + _VALUES_REF.sub(r"excluded.\1", sql[match.end():])
+    if has_params:
+        # mysql.connector only unescapes %% when it interpolates parameters
+        sql = sql.replace("%s", "?").replace("%%", "%")
+    return sql
+
+
+def _error(e):
+    return mysql.connector.errors.DatabaseError(msg=str(e))
+
+
+class Cursor:
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._cursor = connection._conn.cursor()
+        self._dictionary = dictionary
+
+    def _notify(self, sql, many):
+        for listener in statement_listeners:
+            listener(sql, many)
+
+    def execute(self, sql, params=None):
+        self._notify(sql, False)
+        try:
+            if not self._connection.in_transaction and _FOR_UPDATE.search(sql):
+                # No row locks: take the database write lock up front, as the
+                # locking read would have, instead of failing on the later write
+                self._cursor.execute("BEGIN IMMEDIATE")
+            self._cursor.execute(translate(sql, params is not None), tuple(params) if params is not None else ())
+        except sqlite3.Error as e:
+            raise _error(e) from e
+
+    def executemany(self, sql, seq_params):
+        self._notify(sql, True)
+        try:
+            self._cursor.executemany(translate(sql, True), [tuple(p) for p in seq_params])
+        except sqlite3.Error as e:
+            raise _error(e) from e
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip(self.column_names, row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(r) for r in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    @property
+    def column_names(self):
+        return tuple(d[0] for d in self._cursor.description or ())
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES,
+                                     check_same_thread=False, isolation_level="DEFERRED")
+        self._conn.create_function("DATE_FORMAT", 2, _date_format, deterministic=True)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL fsyncs every commit, like InnoDB's default; NORMAL only checkpoints
+        self._conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+
+    def cursor(self, dictionary=False, buffered=None):
+        return Cursor(self, dictionary=dictionary)
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def ping(self, reconnect=False):
+        try:
+            self._conn.execute("SELECT 1")
+        except sqlite3.Error as e:
+            raise _error(e) from e
+
+    def consume_results(self):
+        pass
+
+    def commit(self):
+        try:
+            self._conn.commit()
+        except sqlite3.Error as e:
+            raise _error(e) from e
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+def connect(path):
+    return Connection(path)
+
+
+def create_schema(path):
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(SCHEMA)
+    finally:
+        conn.close()
@@ -0,0 +1,228 @@
+# Chunked, parallel training pipeline for the weekly demand models
+import json
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from forecast import LAG_FEATURES, LAG_WINDOWS
+
+# Same features demand_forecast.py and forecast.build_features serve
+FEATURES = ("product_id", "month", "week", "season_encoded",
+            "last_week_sales", "last_2w_sales", "last_month_sales")
+
+SEASON_BY_MONTH = np.array([0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 0], dtype=np.int64)
+
+CHUNK_ROWS = 250_000
+HOLDOUT_FRACTION = 0.2
+MODELS_DIR = "models"
+
+
+def read_daily(path, chunksize=CHUNK_ROWS):
+    """Stream a sales CSV into daily totals per (product, category, day).
+
+    Each chunk is reduced before the next is read, so memory follows the
+    number of product-days rather than the number of sales lines.
+    """
+    partials = []
+    reader = pd.read_csv(
+        path,
+        usecols=["product_id", "category", "quantity", "sale_date"],
+        dtype={"product_id": np.int32, "category": "category", "quantity": np.int32, "sale_date": str},
+        chunksize=chunksize,
+    )
+    for chunk in reader:
+        chunk["sale_date"] = pd.to_datetime(chunk["sale_date"], format="%Y-%m-%d")
+        partials.append(
+            chunk.groupby(["product_id", "category", "sale_date"], observed=True, sort=False)["quantity"].sum()
+        )
+    daily = pd.concat(partials).groupby(level=[0, 1, 2], observed=True).sum()
+    return daily.reset_index()
+
+
+def weekly_features(daily):
+    """Weekly totals per product with calendar, season and lag features.
+
+    Weeks without sales are filled with zero. Each lag sums the LAG_WINDOWS
+    days before the week starts, as sales_index serves them for a forecast
+    made that day.
+    """
+    daily = daily.copy()
+    daily["week_start"] = daily["sale_date"] - pd.to_timedelta(daily["sale_date"].dt.weekday, unit="D")
+    weekly = daily.groupby(["product_id", "week_start"])["quantity"].sum()
+
+    weeks = pd.date_range(weekly.index.get_level_values(1).min(), weekly.index.get_level_values(1).max(), freq="W-MON")
+    products = weekly.index.get_level_values(0).unique()
+    full = pd.MultiIndex.from_product([products, weeks], names=["product_id", "week_start"])
+    frame = weekly.reindex(full, fill_value=0).rename("quantity").reset_index()
+
+    # Running totals over every day from the longest window before the first week
+    per_day = daily.groupby(["product_id", "sale_date"])["quantity"].sum()
+    days = pd.date_range(weeks[0] - pd.Timedelta(days=max(LAG_WINDOWS)), weeks[-1])
+    grid = per_day.reindex(pd.MultiIndex.from_product([products, days]), fill_value=0).to_numpy(dtype=np.int64)
+    cumulative = np.zeros((len(products), len(days) + 1), dtype=np.int64)
+    cumulative[:, 1:] = grid.reshape(len(products), len(days)).cumsum(axis=1)
+    rows = products.get_indexer(frame["product_id"])
+    start = (frame["week_start"] - days[0]).dt.days.to_numpy()
+    for name, window in zip(LAG_FEATURES, LAG_WINDOWS):
+        frame[name] = cumulative[rows, start] - cumulative[rows, start - window]
+
+    frame["month"] = frame["week_start"].dt.month
+    frame["week"] = frame["week_start"].dt.isocalendar().week.astype(np.int64)
+    frame["season_encoded"] = SEASON_BY_MONTH[frame["month"].to_numpy()]
+
+    categories = daily.drop_duplicates("product_id").set_index("product_id")["category"]
+    frame["category"] = frame["product_id"].map(categories).astype(str)
+    return frame
+
+
+def _fit_groups(tasks, estimator_params):
+    fitted = []
+    for key, X, y, X_test, y_test in tasks:
+        model = RandomForestRegressor(**estimator_params)
+        model.fit(X, y)
+        mae = float(np.abs(model.predict(X_test) - y_test).mean()) if len(y_test) else None
+        fitted.append((key, model, len(y), mae))
+    return fitted
+
+
+class ModelBundle:
+    """One regressor per group (product or category) plus a global fallback.
+
+    Exposes ``feature_names_in_`` and ``predict`` so the serving code can treat
+    it like a single estimator.
+    """
+
+    def __init__(self, group_by, models, fallback, categories, manifest):
+        self.group_by = group_by
+        self.models = models
+        self.fallback = fallback
+        self.categories = categories
+        self.manifest = manifest
+        self.feature_names_in_ = np.array(FEATURES, dtype=object)
+        self.n_features_in_ = len(FEATURES)
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        product_ids = X[:, FEATURES.index("product_id")].astype(np.int64)
+        if self.group_by == "category":
+            keys = np.array([self.categories.get(pid) for pid in product_ids.tolist()], dtype=object)
+        else:
+            keys = product_ids
+        out = np.empty(len(X), dtype=np.float64)
+        for key in pd.unique(keys):
+            mask = keys == key
+            out[mask] = self.models.get(key, self.fallback).predict(X[mask])
+        return out
+
+
+def _split(frame):
+    # Hold out the most recent weeks so the score reflects forecasting forward
+    cutoff = frame["week_start"].quantile(1 - HOLDOUT_FRACTION)
+    return frame["week_start"] <= cutoff
+
+
+def train(frame, group_by="product", workers=None, estimator_params=None):
+    estimator_params = {"n_estimators": 30, "max_depth": 8, "min_samples_leaf": 2, "random_state": 42, "n_jobs": 1,
+                        **(estimator_params or {})}
+    key_column = "product_id" if group_by == "product" else "category"
+    train_mask = _split(frame)
+    X_all = frame[list(FEATURES)].to_numpy(dtype=np.float64)
+    y_all = frame["quantity"].to_numpy(dtype=np.float64)
+
+    tasks = []
+    for key, index in frame.groupby(key_column, sort=True).indices.items():
+        in_train = train_mask.to_numpy()[index]
+        tasks.append((key, X_all[index[in_train]], y_all[index[in_train]],
+                      X_all[index[~in_train]], y_all[index[~in_train]]))
+
+    workers = workers or os.cpu_count() or 1
+    # A few tasks per worker keeps the pool busy without pickling per group
+    per_task = max(1, len(tasks) // (workers * 4))
+    batches = [tasks[i:i + per_task] for i in range(0, len(tasks), per_task)]
+
+    models, metrics = {}, {}
+    if workers == 1 or len(batches) == 1:
+        results = [_fit_groups(batch, estimator_params) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_fit_groups, batches, [estimator_params] * len(batches)))
+    for batch in results:
+        for key, model, rows, mae in batch:
+            key = key.item() if hasattr(key, "item") else key
+            models[key] = model
+            metrics[str(key)] = {"rows": rows, "holdout_mae": mae}
+
+    fallback = RandomForestRegressor(**{**estimator_params, "n_jobs": workers})
+    fallback.fit(X_all[train_mask.to_numpy()], y_all[train_mask.to_numpy()])
+
+    categories = frame.drop_duplicates("product_id").set_index("product_id")["category"].to_dict()
+    return models, fallback, categories, metrics
+
+
+def save_bundle(bundle, out_dir=MODELS_DIR):
+    version = bundle.manifest["version"]
+    path = os.path.join(out_dir, version)
+    os.makedirs(path, exist_ok=True)
+    joblib.dump(bundle, os.path.join(path, "bundle.joblib"))
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(bundle.manifest, f, indent=2)
+    # Pointer swapped with a rename so readers never see a half-written value
+    latest = os.path.join(out_dir, "LATEST")
+    with open(latest + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(latest + ".tmp", latest)
+    return path
+
+
+def peak_memory_mb():
+    # ru_maxrss is KiB on Linux; include the worker processes
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / 1024, 1)
+
+
+def run(data="sales_data.csv", group_by="product", workers=None, out_dir=MODELS_DIR, chunksize=CHUNK_ROWS,
+        archive=None, since=None, until=None):
+    # ``archive`` names a dataset in the columnar archive (archive.py) to
+    # train from instead of parsing the CSV at ``data``
+    timings = {}
+    start = time.perf_counter()
+    if archive:
+        import archive as sales_archive
+        daily = sales_archive.daily_totals(archive, start=since, end=until)
+        data = os.path.join(sales_archive.ARCHIVE_DIR, archive)
+    else:
+        daily = read_daily(data, chunksize=chunksize)
+    timings["load_s"] = round(time.perf_counter() - start, 3)
+
+    step = time.perf_counter()
+    frame = weekly_features(daily)
+    timings["features_s"] = round(time.perf_counter() - step, 3)
+
+    step = time.perf_counter()
+    models, fallback, categories, metrics = train(frame, group_by=group_by, workers=workers)
+    timings["train_s"] = round(time.perf_counter() - step, 3)
+
+    manifest = {
+        "version": datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "source": os.path.abspath(data) if isinstance(data, str) else str(data),
+        "group_by": group_by,
+        "features": list(FEATURES),
+        "weeks": int(frame["week_start"].nunique()),
+        "training_rows": int(len(frame)),
+        "groups": metrics,
+    }
+    bundle = ModelBundle(group_by, models, fallback, categories, manifest)
+    path = save_bundle(bundle, out_dir)
+
+    timings["total_s"] = round(time.perf_counter() - start, 3)
+    return {"path": path, "version": manifest["version"], "groups": len(models),
+            "peak_memory_mb": peak_memory_mb(), **timings}
@@ -0,0 +1,92 @@
+# Data versions behind the HTTP validators (ETag / Last-Modified)
+#
+# Each dataset has a random 64-bit token and the time it last changed,
+# replaced whenever a write path touches it (through the signals below, or
+# bump() for writes that land later, like the stock ledger's flush). They
+# live in an anonymous shared mapping created at import, so workers forked
+# from one parent see each other's bumps. A bump writes a fresh random token
+# rather than incrementing, so a process that forked before it can't reuse
+# an old value. Writes made outside the app (CLI ingest, another host) are
+# only noticed once VERSION_MAX_AGE rolls every tag over.
+#
+# Each slot also counts its bumps, and every process counts the bumps it
+# made itself. A cache that applies its own process's write signals takes a
+# mark() when it loads; foreign() then tells it whether a sibling worker has
+# written since, which its signals never showed it.
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+
+from signals import catalogue_changed, inventory_changed, sales_recorded
+
+VERSION_MAX_AGE = float(os.environ.get("VERSION_MAX_AGE", 300))
+
+DATASETS = ("catalogue", "inventory", "sales")
+
+# token, changed at, bumps so far
+_SLOT = struct.Struct("<QdQ")
+_shared = mmap.mmap(-1, _SLOT.size * len(DATASETS))
+# Inherited by forked workers, like the mapping
+_lock = multiprocessing.Lock()
+# Bumps made by this process (a forked worker starts from its parent's)
+_own = dict.fromkeys(DATASETS, 0)
+
+
+def _slot(name):
+    return _SLOT.size * DATASETS.index(name)
+
+
+def bump(*names):
+    now = time.time()
+    with _lock:
+        for name in names:
+            bumps = _SLOT.unpack_from(_shared, _slot(name))[2]
+            _SLOT.pack_into(_shared, _slot(name), int.from_bytes(os.urandom(8), "little"), now, bumps + 1)
+            _own[name] += 1
+
+
+def current(*names):
+    """(token parts, last modified) for the named datasets."""
+    tokens, modified = [], 0.0
+    for name in names:
+        token, changed, _ = _SLOT.unpack_from(_shared, _slot(name))
+        tokens.append(token)
+        modified = max(modified, changed)
+    # Epoch of the max-age window, so out-of-band writes surface eventually
+    tokens.append(int(time.time() // VERSION_MAX_AGE) if VERSION_MAX_AGE > 0 else 0)
+    return tokens, modified
+
+
+def mark(*names):
+    """Where the named datasets stand now, for foreign()."""
+    with _lock:
+        return tuple((name, _SLOT.unpack_from(_shared, _slot(name))[2], _own[name]) for name in names)
+
+
+def foreign(since):
+    """Whether another process bumped a dataset in the mark ``since`` after it was taken."""
+    if since is None:
+        return False
+    with _lock:
+        return any(_SLOT.unpack_from(_shared, _slot(name))[2] - bumps > _own[name] - own
+                   for name, bumps, own in since)
+
+
+def on_catalogue_changed(sender, **kwargs):
+    bump("catalogue")
+
+
+def on_inventory_changed(sender, **kwargs):
+    bump("inventory")
+
+
+def on_sales_recorded(sender, **kwargs):
+    bump("sales")
+
+
+bump(*DATASETS)
+catalogue_changed.connect(on_catalogue_changed)
+inventory_changed.connect(on_inventory_changed)
+sales_recorded.connect(on_sales_recorded)
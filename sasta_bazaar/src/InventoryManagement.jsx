@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import {
   FaBox,
   FaPlusCircle,
@@ -11,8 +11,58 @@ import {
   MdInventory,
 } from "react-icons/md";
 import api from "./services/api";
+import { isLive, subscribeChanges } from "./services/changes";
 import bgImage from "./images/im-01.jpg";
 
+// The table's columns, plus product_id to match live changes to rows
+const FIELDS =
+  "batch_id,product_id,product_name,category,quantity,expiry_date,supplier_name,order_date,delivery_date";
+
+const byExpiry = (a, b) =>
+  Date.parse(a.expiry_date) - Date.parse(b.expiry_date) || a.batch_id - b.batch_id;
+
+// Rows with one feed event applied, or null when only a refetch can bring
+// the table up to date
+const applyChange = (rows, event) => {
+  if (event.type === "catalogue") {
+    return event.action === "deleted"
+      ? rows.filter((row) => row.product_id !== event.product_id)
+      : rows;
+  }
+  if (event.type !== "inventory" || event.refetch) return null;
+  let next = rows;
+  let added = false;
+  for (const change of event.changes) {
+    const index = next.findIndex((row) => row.batch_id === change.batch_id);
+    if (change.op === "delete") {
+      if (index >= 0) next = next.filter((_, i) => i !== index);
+    } else if (index >= 0) {
+      // quantity is absolute, so an event already in the snapshot changes nothing
+      const quantity = change.quantity ?? next[index].quantity + change.delta;
+      next = next.map((row, i) => (i === index ? { ...row, quantity } : row));
+    } else if (change.op === "add") {
+      const sibling = next.find((row) => row.product_id === change.product_id);
+      if (!sibling) return null;
+      next = [
+        ...next,
+        {
+          batch_id: change.batch_id,
+          product_id: change.product_id,
+          product_name: sibling.product_name,
+          category: sibling.category,
+          quantity: change.quantity ?? change.delta,
+          expiry_date: change.expiry_date,
+          supplier_name: change.supplier_name,
+          order_date: change.order_date,
+          delivery_date: change.delivery_date,
+        },
+      ];
+      added = true;
+    }
+  }
+  return added ? [...next].sort(byExpiry) : next;
+};
+
 const InventoryManagement = () => {
   const [inventory, setInventory] = useState([]);
   const [form, setForm] = useState({
@@ -25,18 +75,58 @@ const InventoryManagement = () => {
   });
   const [loading, setLoading] = useState(false);
   const [csvFile, setCsvFile] = useState(null);
+  const rows = useRef([]);
+  // Feed events held while a snapshot loads, applied on top of it
+  const pending = useRef(null);
 
-  useEffect(() => {
-    fetchInventory();
-  }, []);
+  const show = (next) => {
+    rows.current = next;
+    setInventory(next);
+  };
 
   const fetchInventory = () => {
+    if (pending.current) {
+      // A reset while loading: that snapshot may be older than the gap
+      pending.current.push({ type: "reset" });
+      return;
+    }
+    pending.current = [];
     setLoading(true);
     api
-      .get("/inventory")
-      .then((res) => setInventory(res.data))
-      .catch((err) => console.error(err))
-      .finally(() => setLoading(false));
+      .get(`/inventory?fields=${FIELDS}`)
+      .then((res) => {
+        const queued = pending.current;
+        pending.current = null;
+        setLoading(false);
+        const next = queued.reduce((acc, event) => acc && applyChange(acc, event), res.data);
+        show(next ?? res.data);
+        if (!next) fetchInventory();
+      })
+      .catch((err) => {
+        pending.current = null;
+        setLoading(false);
+        console.error(err);
+      });
+  };
+
+  useEffect(
+    () =>
+      // The feed's first event is a reset, which loads the table
+      subscribeChanges((event) => {
+        if (pending.current) {
+          pending.current.push(event);
+          return;
+        }
+        const next = event.type === "reset" ? null : applyChange(rows.current, event);
+        if (next) show(next);
+        else fetchInventory();
+      }),
+    []
+  );
+
+  // Without the feed, reload after our own changes as before
+  const refreshUnlessLive = () => {
+    if (!isLive()) fetchInventory();
   };
 
   const handleChange = (e) => {
@@ -56,7 +146,7 @@ const InventoryManagement = () => {
           order_date: "",
           delivery_date: "",
         });
-        fetchInventory();
+        refreshUnlessLive();
       })
       .catch((err) => console.error(err))
       .finally(() => setLoading(false));
@@ -72,7 +162,7 @@ const InventoryManagement = () => {
         inventory_id,
         quantity: parseInt(qty),
       })
-      .then(fetchInventory)
+      .then(refreshUnlessLive)
       .catch((err) => console.error(err))
       .finally(() => setLoading(false));
   };
@@ -95,7 +185,7 @@ const InventoryManagement = () => {
       })
       .then(() => {
         setCsvFile(null);
-        fetchInventory();
+        refreshUnlessLive();
       })
       .catch((err) => console.error(err))
       .finally(() => setLoading(false));
@@ -14,6 +14,8 @@ const Sales = () => {
   const [totalSales, setTotalSales] = useState(0);
   const [userId, setUserId] = useState(1); // For demo; replace with dynamic user handling
   const [status, setStatus] = useState(null);
+  // One key per invoice: retries resend it so the server records the sale once
+  const [idempotencyKey, setIdempotencyKey] = useState(() => crypto.randomUUID());
 
   useEffect(() => {
     const fetchProducts = async () => {
@@ -29,6 +31,7 @@ const Sales = () => {
   }, []);
 
   const addInvoiceItem = () => {
+    setIdempotencyKey(crypto.randomUUID());
     setInvoiceItems([
       ...invoiceItems,
       {
@@ -58,6 +61,7 @@ const Sales = () => {
       }
     }
 
+    setIdempotencyKey(crypto.randomUUID());
     setInvoiceItems(updated);
   };
 
@@ -84,19 +88,36 @@ const Sales = () => {
       return;
     }
 
-    try {
-      const res = await fetch("http://localhost:5000/create-invoice", {
+    const postInvoice = () =>
+      fetch("http://localhost:5000/create-invoice", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          "Idempotency-Key": idempotencyKey,
+        },
         body: JSON.stringify({
           user_id: userId,
           items: itemsToSubmit,
         }),
       });
 
+    try {
+      // Network errors and 503 (still queued) are retried with the same key
+      let res;
+      for (let attempt = 1; ; attempt++) {
+        try {
+          res = await postInvoice();
+          if (res.status !== 503 || attempt === 3) break;
+        } catch (error) {
+          if (attempt === 3) throw error;
+        }
+        await new Promise((resolve) => setTimeout(resolve, 500 * attempt));
+      }
+
       const result = await res.json();
       if (res.ok) {
         setStatus("✅ Invoice created successfully!");
+        setIdempotencyKey(crypto.randomUUID());
         setInvoiceItems([
           {
             product_id: "",
@@ -0,0 +1,49 @@
+// Live stock changes from the server's /changes feed (Server-Sent Events).
+// One EventSource per tab, shared by every subscriber; the browser
+// reconnects by itself and resumes from the last event id it saw.
+//
+// Listeners get the feed's events, plus { type: "reset" } whenever they
+// should (re)load their snapshot: on connecting, after a gap, when they
+// subscribe to an already open feed, and when the feed is unavailable.
+import api from "./api";
+
+const listeners = new Set();
+let source = null;
+let live = false;
+
+const emit = (event) => listeners.forEach((listener) => listener(event));
+
+const open = () => {
+  source = new EventSource(`${api.defaults.baseURL}/changes`);
+  source.onmessage = (e) => emit(JSON.parse(e.data));
+  source.addEventListener("reset", (e) => {
+    live = true;
+    emit(JSON.parse(e.data));
+  });
+  source.onerror = () => {
+    live = false;
+    if (source.readyState === EventSource.CLOSED) {
+      // Refused for good (e.g. an older server): callers fall back to refetching
+      emit({ type: "reset", reason: "unavailable" });
+    }
+  };
+};
+
+export const isLive = () => live;
+
+export const subscribeChanges = (listener) => {
+  listeners.add(listener);
+  if (!source) {
+    open();
+  } else if (live || source.readyState === EventSource.CLOSED) {
+    queueMicrotask(() => listener({ type: "reset", reason: live ? "subscribed" : "unavailable" }));
+  }
+  return () => {
+    listeners.delete(listener);
+    if (!listeners.size && source) {
+      source.close();
+      source = null;
+      live = false;
+    }
+  };
+};